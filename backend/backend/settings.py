@@ -35,9 +35,26 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
+CELERY_TASK_ROUTES = ("tasks.routing.route_task",)
+# Воркер берёт по одной задаче, чтобы ручные запуски не ждали
+# за уже разобранными плановыми
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_BEAT_SCHEDULE = {
+    "maintain-result-partitions": {
+        "task": "tasks.tasks.maintain_result_partitions",
+        "schedule": 60 * 60,
+    },
+    "prune-execution-history": {
+        "task": "tasks.tasks.prune_execution_history",
+        "schedule": 60 * 60,
+    },
+}
+
+REDIS_URL = "redis://localhost:6379/0"
 
 
 INSTALLED_APPS = [
+    "daphne",
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
@@ -80,6 +97,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "backend.wsgi.application"
+ASGI_APPLICATION = "backend.asgi.application"
 
 DATABASES = {
     "default": {
@@ -123,3 +141,44 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 RESULT_TABLE_NAME = "query_results"  # Имя таблицы результатов
+RESULT_RETENTION_DAYS = 30  # Срок хранения партиций таблицы результатов
+RESULT_PARTITIONS_AHEAD = 7  # Сколько дневных партиций создавать заранее
+# Секунды до удаления результатов без ссылок
+RESULT_BLOB_GC_GRACE = 24 * 60 * 60
+HISTORY_PRUNE_BATCH_SIZE = 1000  # Строк истории за одну транзакцию удаления
+
+EXECUTION_HISTORY_PAGE_SIZE = 50
+EXECUTION_HISTORY_MAX_PAGE_SIZE = 500
+
+# Пул подключений к внешним БД в каждом процессе воркера
+SOURCE_POOL_MAX_SIZE = 5
+SOURCE_POOL_CHECKOUT_TIMEOUT = 30  # секунды
+SOURCE_POOL_CONNECT_TIMEOUT = 10  # секунды
+SOURCE_POOL_IDLE_TIMEOUT = 300  # секунды
+SOURCE_POOL_HEALTH_CHECK_INTERVAL = 30  # секунды
+SOURCE_POOL_STATS_INTERVAL = 10  # секунды
+
+# Ограничение параллельных запросов к одной внешней БД
+CONNECTION_SLOT_LEASE = 60 * 60  # секунды
+CONNECTION_THROTTLE_DELAY = 10  # секунды до повторной постановки в очередь
+
+# Защита от одновременного выполнения одной задачи
+TASK_LOCK_LEASE = 60 * 60  # секунды
+TASK_FOLLOW_UP_DELAY = 10  # секунды между проверками для отложенного запуска
+
+# Предпросмотр запроса
+PREVIEW_ROWS = 100
+PREVIEW_MAX_ROWS = 1000
+PREVIEW_TIMEOUT = 2  # секунды на весь запрос, включая подключение
+
+# Очередь для запусков из интерфейса
+INTERACTIVE_QUEUE = "interactive"
+
+# Автоматический выключатель для недоступных внешних БД
+CIRCUIT_FAILURE_THRESHOLD = 5  # ошибок подключения подряд до размыкания
+CIRCUIT_OPEN_TIMEOUT = 30  # секунды до первой пробной попытки
+CIRCUIT_MAX_OPEN_TIMEOUT = 15 * 60  # секунды
+CIRCUIT_PROBE_TIMEOUT = 60  # секунды на пробную попытку
+
+# Экспоненциальная задержка повторных попыток
+RETRY_BACKOFF_MAX = 60 * 60  # секунды
@@ -1,10 +1,24 @@
 from django.contrib import admin
-from .models import Task, ExecutionHistory, DatabaseConnection
+from .models import (
+    Task,
+    ExecutionHistory,
+    ExecutionStats,
+    DatabaseConnection,
+    ResultBlob,
+)
 
 
 @admin.register(DatabaseConnection)
 class DatabaseConnectionAdmin(admin.ModelAdmin):
-    list_display = ("name", "host", "port", "database_name", "username")
+    list_display = (
+        "name",
+        "host",
+        "port",
+        "database_name",
+        "username",
+        "max_concurrency",
+        "queue",
+    )
     search_fields = ("name", "host", "database_name", "username")
 
 
@@ -25,4 +39,25 @@ class TaskAdmin(admin.ModelAdmin):
 class ExecutionHistoryAdmin(admin.ModelAdmin):
     list_display = ("task", "execution_time", "status")
     list_filter = ("status", "execution_time")
+    list_select_related = ("task",)
     search_fields = ("task__name",)
+
+
+@admin.register(ResultBlob)
+class ResultBlobAdmin(admin.ModelAdmin):
+    list_display = ("content_hash", "row_count", "size", "created_at")
+    search_fields = ("content_hash",)
+
+
+@admin.register(ExecutionStats)
+class ExecutionStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        "grain",
+        "period_start",
+        "database_connection",
+        "task",
+        "executions",
+        "successes",
+        "failures",
+    )
+    list_filter = ("grain", "database_connection")
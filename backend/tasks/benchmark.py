@@ -0,0 +1,345 @@
+import math
+import os
+import resource
+import statistics
+import threading
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+from . import pool
+from .events import events_disabled
+from .metrics import metrics_disabled
+from .models import DatabaseConnection, ExecutionHistory, Task
+from .tasks import execute_task
+
+PROFILES = ("narrow", "mixed", "wide")
+STORAGE_MODES = ("fetchall", "stream", "materialize")
+PHASES = ("connect", "execute", "fetch", "encode", "write", "total")
+WIDE_COLUMNS = 20
+
+Column = namedtuple("Column", ["name", "type_code"])
+Scenario = namedtuple("Scenario", ["rows", "profile", "storage", "width"])
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class FakeCursor:
+    """
+    Stand-in for a psycopg2 cursor that generates a synthetic result
+    instead of running the query.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+        self.itersize = 2000
+        self._rows = iter(())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def execute(self, query, params=None):
+        scenario = self.connection.scenario
+        self.connection.seed += 1
+        self.description = _description(scenario)
+        self._rows = _generate_rows(scenario, self.connection.seed)
+
+    def fetchmany(self, size):
+        return [row for _, row in zip(range(size), self._rows)]
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        self._rows = iter(())
+
+
+class FakeConnection:
+    closed = 0
+
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.seed = 0
+
+    def cursor(self, name=None):
+        return FakeCursor(self)
+
+    def get_backend_pid(self):
+        return 0
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeSourcePool(pool.SourceConnectionPool):
+    def __init__(self, connection_id, params, scenario):
+        super().__init__(connection_id, params)
+        self.scenario = scenario
+
+    def _connect(self, timeout):
+        return FakeConnection(self.scenario)
+
+
+def run_benchmark(scenarios, runs=5, source="fake", fetch_size=1000, log=None):
+    """
+    Runs execute_task eagerly for every scenario and returns the
+    measurements keyed by scenario name. Everything the runs write is
+    rolled back afterwards, and they are kept out of the metrics and
+    the event stream, which live in Redis.
+    """
+    report = {}
+    for scenario in scenarios:
+        name = scenario_name(scenario)
+        if log is not None:
+            log(f"Running {name}...")
+        with transaction.atomic(), metrics_disabled(), events_disabled():
+            report[name] = _run_scenario(scenario, runs, source, fetch_size)
+            transaction.set_rollback(True)
+    return report
+
+
+def scenario_name(scenario):
+    return (
+        f"{scenario.storage}/{scenario.profile}/"
+        f"w{scenario.width}/{scenario.rows}"
+    )
+
+
+def compare_reports(report, baseline, tolerance):
+    """
+    Returns a description of every scenario whose throughput dropped,
+    or whose p99 latency or peak RSS grew, by more than tolerance
+    compared to the baseline.
+    """
+    regressions = []
+    checks = [
+        ("rows_per_second", -1),
+        ("latency_p99", 1),
+        ("peak_rss_delta", 1),
+    ]
+    for name, result in report.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for key, direction in checks:
+            old, new = expected.get(key), result.get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if change * direction > tolerance:
+                regressions.append(
+                    f"{name}: {key} {old:g} -> {new:g} ({change:+.0%})"
+                )
+    return regressions
+
+
+def _run_scenario(scenario, runs, source, fetch_size):
+    db_conn = _create_connection(scenario, source)
+    task = Task.objects.create(
+        name=f"Benchmark {scenario_name(scenario)}",
+        query=_source_query(scenario) if source == "postgres" else "SELECT 1",
+        schedule="0 0 * * *",
+        is_active=False,
+        max_retries=0,
+        stream_results=scenario.storage == "stream",
+        materialize_results=scenario.storage == "materialize",
+        fetch_size=fetch_size,
+        database_connection=db_conn,
+    )
+    if source == "fake":
+        with pool._pools_lock:
+            pool._pools[db_conn.id] = FakeSourcePool(
+                db_conn.id, pool.get_pool(db_conn).params, scenario
+            )
+
+    phase_times = {phase: [] for phase in PHASES}
+    throughputs = []
+    peak_rss = 0
+    rss_before = _current_rss()
+    try:
+        for run in range(runs):
+            if source == "postgres":
+                # Vary the data so runs don't reuse an identical stored result.
+                Task.objects.filter(id=task.id).update(
+                    query=_source_query(scenario, seed=run)
+                )
+            sampler = _RssSampler()
+            sampler.start()
+            try:
+                eager_result = execute_task.apply(args=[task.id])
+            finally:
+                sampler.stop()
+            peak_rss = max(peak_rss, sampler.peak)
+            history = ExecutionHistory.objects.get(
+                celery_task_id=eager_result.id
+            )
+            if history.status != "SUCCESS":
+                raise BenchmarkError(
+                    f"{scenario_name(scenario)}: execution ended with "
+                    f"{history.status}: {history.error_message}"
+                )
+            for phase in PHASES:
+                phase_times[phase].append(history.timings.get(phase, 0.0))
+            throughputs.append(
+                scenario.rows / max(history.timings["total"], 1e-9)
+            )
+    finally:
+        pool.invalidate_pool(db_conn.id)
+
+    result = {
+        "rows": scenario.rows,
+        "runs": runs,
+        "rows_per_second": round(statistics.median(throughputs), 1),
+        "peak_rss": peak_rss,
+        "peak_rss_delta": max(peak_rss - rss_before, 0),
+        "byte_count": history.byte_count,
+    }
+    for phase, values in phase_times.items():
+        prefix = "latency" if phase == "total" else phase
+        result[f"{prefix}_p50"] = round(_percentile(values, 50), 6)
+        result[f"{prefix}_p99"] = round(_percentile(values, 99), 6)
+    return result
+
+
+def _create_connection(scenario, source):
+    if source == "postgres":
+        database = settings.DATABASES["default"]
+        params = {
+            "host": database.get("HOST") or "localhost",
+            "port": database.get("PORT") or 5432,
+            "database_name": database["NAME"],
+            "username": database.get("USER", ""),
+            "password": database.get("PASSWORD", ""),
+        }
+    else:
+        params = {
+            "host": "fake",
+            "database_name": "fake",
+            "username": "fake",
+            "password": "",
+        }
+    return DatabaseConnection.objects.create(
+        name=f"benchmark-{uuid.uuid4().hex}", **params
+    )
+
+
+def _description(scenario):
+    if scenario.profile == "narrow":
+        return [Column("id", 20), Column("value", 23)]
+    if scenario.profile == "mixed":
+        return [
+            Column("id", 20),
+            Column("name", 25),
+            Column("amount", 1700),
+            Column("created_at", 1184),
+            Column("active", 16),
+            Column("ref", 2950),
+        ]
+    return [Column("id", 20)] + [
+        Column(f"c{index}", 25) for index in range(WIDE_COLUMNS)
+    ]
+
+
+def _generate_rows(scenario, seed):
+    text = ("x" * scenario.width)[: max(scenario.width - 8, 0)]
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for i in range(1, scenario.rows + 1):
+        key = i + seed * scenario.rows
+        if scenario.profile == "narrow":
+            yield (key, i % 1000)
+        elif scenario.profile == "mixed":
+            yield (
+                key,
+                f"{key:08x}{text}",
+                Decimal(key) / 100,
+                start + timedelta(seconds=i),
+                i % 2 == 0,
+                uuid.UUID(int=key),
+            )
+        else:
+            yield (key,) + tuple(
+                f"{key + index:08x}{text}" for index in range(WIDE_COLUMNS)
+            )
+
+
+def _source_query(scenario, seed=0):
+    """
+    Builds a query producing the scenario's synthetic result with
+    generate_series, for runs against a real PostgreSQL source.
+    """
+    key = f"(g + {seed * scenario.rows})::bigint"
+    text = (
+        f"lpad(to_hex({key}), 8, '0') || "
+        f"repeat('x', {max(scenario.width - 8, 0)})"
+    )
+    if scenario.profile == "narrow":
+        columns = [f"{key} AS id", "(g % 1000)::integer AS value"]
+    elif scenario.profile == "mixed":
+        columns = [
+            f"{key} AS id",
+            f"{text} AS name",
+            f"({key}::numeric / 100) AS amount",
+            "timestamptz '2024-01-01 00:00:00+00' + g * interval '1 second'"
+            " AS created_at",
+            "g % 2 = 0 AS active",
+            f"lpad(to_hex({key}), 32, '0')::uuid AS ref",
+        ]
+    else:
+        columns = [f"{key} AS id"] + [
+            f"lpad(to_hex({key} + {index}), 8, '0') || "
+            f"repeat('x', {max(scenario.width - 8, 0)}) AS c{index}"
+            for index in range(WIDE_COLUMNS)
+        ]
+    return (
+        f"SELECT {', '.join(columns)} "
+        f"FROM generate_series(1, {scenario.rows}) AS g"
+    )
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = max(math.ceil(percent / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+def _current_rss():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _RssSampler(threading.Thread):
+    """
+    Samples the process RSS in the background to catch its peak
+    during one execution.
+    """
+
+    def __init__(self, interval=0.01):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = _current_rss()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, _current_rss())
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self.peak = max(self.peak, _current_rss())
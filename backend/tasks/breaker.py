@@ -0,0 +1,115 @@
+import time
+
+from django.conf import settings
+
+from .redis_client import get_redis
+
+ALLOW_SCRIPT = """
+local key, now, probe_timeout = KEYS[1], tonumber(ARGV[1]), tonumber(ARGV[2])
+if redis.call('EXISTS', key) == 0 then
+    return '-1'
+end
+local state = redis.call('HGET', key, 'state')
+if not state or state == 'closed' then
+    return '0'
+end
+local until_field = state == 'open' and 'open_until' or 'probe_until'
+local wait = tonumber(redis.call('HGET', key, until_field)) - now
+if wait > 0 then
+    return tostring(wait)
+end
+redis.call(
+    'HSET', key, 'state', 'half_open', 'probe_until', now + probe_timeout
+)
+return '0'
+"""
+
+RECORD_FAILURE_SCRIPT = """
+local key, now = KEYS[1], tonumber(ARGV[1])
+local threshold = tonumber(ARGV[2])
+local base, max = tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HGET', key, 'state') or 'closed'
+local failures = redis.call('HINCRBY', key, 'failures', 1)
+if state == 'half_open' or (state == 'closed' and failures >= threshold) then
+    local opens = redis.call('HINCRBY', key, 'opens', 1)
+    local timeout = math.min(base * 2 ^ (opens - 1), max)
+    redis.call('HSET', key, 'state', 'open', 'open_until', now + timeout)
+    state = 'open'
+end
+redis.call('EXPIRE', key, max * 2)
+return state
+"""
+
+
+class CircuitOpen(Exception):
+    def __init__(self, connection_id, retry_in):
+        super().__init__(
+            f"Circuit for DatabaseConnection {connection_id} is open, "
+            f"retrying in {retry_in:.0f}s"
+        )
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker shared by all workers for one DatabaseConnection.
+    After CIRCUIT_FAILURE_THRESHOLD connection failures in a row the
+    circuit opens and executions fail fast. Once the open timeout
+    passes, a single half-open probe is let through: its success closes
+    the circuit, its failure opens it again for twice as long.
+    """
+
+    KEY = "circuit:{}"
+
+    def __init__(self, connection_id):
+        self.connection_id = connection_id
+        self.key = self.KEY.format(connection_id)
+        self._has_state = True
+
+    def check(self):
+        """
+        Raises CircuitOpen unless an execution may use the connection.
+        Remembers whether any failures were recorded, so that
+        record_success() only writes to Redis when there is something
+        to reset.
+        """
+        allow = get_redis().register_script(ALLOW_SCRIPT)
+        retry_in = float(
+            allow(
+                keys=[self.key],
+                args=[time.time(), settings.CIRCUIT_PROBE_TIMEOUT],
+            )
+        )
+        if retry_in > 0:
+            raise CircuitOpen(self.connection_id, retry_in)
+        self._has_state = retry_in == 0
+
+    def record_success(self):
+        if self._has_state:
+            get_redis().delete(self.key)
+            self._has_state = False
+
+    def record_failure(self):
+        record_failure = get_redis().register_script(RECORD_FAILURE_SCRIPT)
+        record_failure(
+            keys=[self.key],
+            args=[
+                time.time(),
+                settings.CIRCUIT_FAILURE_THRESHOLD,
+                settings.CIRCUIT_OPEN_TIMEOUT,
+                settings.CIRCUIT_MAX_OPEN_TIMEOUT,
+            ],
+        )
+
+    def get_state(self):
+        state = {
+            key.decode(): value.decode()
+            for key, value in get_redis().hgetall(self.key).items()
+        }
+        return {
+            "state": state.get("state", "closed"),
+            "failures": int(state.get("failures", 0)),
+            "open_until": float(state["open_until"])
+            if "open_until" in state
+            else None,
+        }
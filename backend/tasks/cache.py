@@ -0,0 +1,68 @@
+import hashlib
+import re
+import time
+
+import redis
+
+from .models import ResultBlob
+from .redis_client import get_redis
+
+CACHE_KEY = "query_cache:{}:{}:{}:{}"
+
+
+def get_cached_result(task):
+    """
+    Returns the stored result of an earlier run of the same query
+    against the same connection with the same limits, if it was cached
+    no longer than this task's cache_ttl ago.
+    """
+    try:
+        entry = get_redis().get(_cache_key(task))
+    except redis.RedisError:
+        return None
+    if entry is None:
+        return None
+    result_id, _, cached_at = entry.decode().partition(":")
+    if not cached_at or time.time() - float(cached_at) > task.cache_ttl:
+        return None
+    return ResultBlob.objects.filter(
+        id=int(result_id), content_hash__isnull=False
+    ).first()
+
+
+def cache_result(task, blob):
+    """
+    Caches a reference to the stored result for task.cache_ttl seconds.
+    Only the ResultBlob id and the caching time are kept in Redis, so
+    every entry is a few bytes no matter how large the result is.
+    """
+    try:
+        get_redis().set(
+            _cache_key(task), f"{blob.id}:{time.time()}", ex=task.cache_ttl
+        )
+    except redis.RedisError:
+        pass
+
+
+def _cache_key(task):
+    """
+    The row and byte caps change what a run stores, so tasks only
+    share entries when their limits match as well.
+    """
+    digest = hashlib.sha256(_normalize_query(task.query).encode()).hexdigest()
+    return CACHE_KEY.format(
+        task.database_connection_id,
+        task.max_rows,
+        task.max_result_bytes,
+        digest,
+    )
+
+
+def _normalize_query(query):
+    """
+    Collapses whitespace outside of string literals and drops the
+    trailing semicolon, so formatting differences share a cache entry.
+    """
+    parts = re.split(r"('(?:[^']|'')*')", query)
+    parts[::2] = [re.sub(r"\s+", " ", part) for part in parts[::2]]
+    return "".join(parts).strip().rstrip(";").strip()
@@ -0,0 +1,119 @@
+import base64
+import json
+import zlib
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from uuid import UUID
+
+MAGIC = b"QRC1"
+COMPRESSION_LEVEL = 6
+
+# PostgreSQL type OIDs reported in cursor.description -> column types.
+# Anything not listed here is treated as text.
+PG_TYPE_NAMES = {
+    16: "boolean",
+    17: "bytea",
+    20: "bigint",
+    21: "smallint",
+    23: "integer",
+    25: "text",
+    114: "json",
+    700: "real",
+    701: "double precision",
+    1042: "text",
+    1043: "text",
+    1082: "date",
+    1083: "time without time zone",
+    1114: "timestamp without time zone",
+    1184: "timestamp with time zone",
+    1186: "interval",
+    1700: "numeric",
+    2950: "uuid",
+    3802: "jsonb",
+}
+
+_ENCODERS = {
+    "bytea": lambda v: base64.b64encode(bytes(v)).decode("ascii"),
+    "numeric": str,
+    "date": lambda v: v.isoformat(),
+    "time without time zone": lambda v: v.isoformat(),
+    "timestamp without time zone": lambda v: v.isoformat(),
+    "timestamp with time zone": lambda v: v.isoformat(),
+    "interval": lambda v: v.total_seconds(),
+    "uuid": str,
+}
+
+_DECODERS = {
+    "bytea": base64.b64decode,
+    "numeric": Decimal,
+    "date": date.fromisoformat,
+    "time without time zone": time.fromisoformat,
+    "timestamp without time zone": datetime.fromisoformat,
+    "timestamp with time zone": datetime.fromisoformat,
+    "interval": lambda v: timedelta(seconds=v),
+    "uuid": UUID,
+}
+
+
+def column_types(description):
+    return [PG_TYPE_NAMES.get(desc.type_code, "text") for desc in description]
+
+
+def serialize_rows(rows, types):
+    """
+    Lays the rows out column by column as compact JSON, converting
+    values that JSON can't represent according to the column type.
+    The output is deterministic and is what content hashes cover.
+    """
+    columns = []
+    for index, type_name in enumerate(types):
+        encode = _ENCODERS.get(type_name)
+        values = [row[index] for row in rows]
+        if encode is not None:
+            values = [None if v is None else encode(v) for v in values]
+        columns.append(values)
+    return json.dumps(
+        {"n": len(rows), "columns": columns},
+        separators=(",", ":"),
+        default=str,
+    ).encode("utf-8")
+
+
+def compress(payload):
+    return MAGIC + zlib.compress(payload, COMPRESSION_LEVEL)
+
+
+def decode_rows(data, types):
+    """
+    Decodes a chunk written by serialize_rows and compress back into
+    rows of typed Python values.
+    """
+    data = bytes(data)
+    if not data.startswith(MAGIC):
+        raise ValueError("Unknown result chunk format.")
+    payload = json.loads(zlib.decompress(data[len(MAGIC):]))
+    columns = []
+    for values, type_name in zip(payload["columns"], types):
+        decode = _DECODERS.get(type_name)
+        if decode is not None:
+            values = [None if v is None else decode(v) for v in values]
+        columns.append(values)
+    if not columns:
+        return [[] for _ in range(payload["n"])]
+    return [list(row) for row in zip(*columns)]
+
+
+def to_json_value(value):
+    """
+    Converts a decoded value to a JSON-friendly representation for the
+    API and NDJSON exports.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode("ascii")
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    return value
@@ -0,0 +1,89 @@
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .redis_client import get_redis
+from .serializers import ExecutionHistoryListSerializer
+
+EVENTS_CHANNEL = "executions"
+TASK_EVENTS_CHANNEL = "executions:task:{}"
+KEEPALIVE_INTERVAL = 15
+
+_publishing = ContextVar("publishing_events", default=True)
+
+
+def publish_execution_event(execution_history):
+    """
+    Publishes the current state of an execution to the global and the
+    per-task channels. Called explicitly where an execution is created
+    or changes state, so every change is published exactly once.
+    """
+    publish_execution_events([execution_history])
+
+
+def publish_execution_events(execution_histories):
+    """
+    Publishes the current state of several executions in one round
+    trip, e.g. of the executions a batch run created.
+    """
+    if not _publishing.get():
+        return
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        for execution_history in execution_histories:
+            payload = json.dumps(
+                ExecutionHistoryListSerializer(execution_history).data,
+                cls=DjangoJSONEncoder,
+            )
+            pipeline.publish(EVENTS_CHANNEL, payload)
+            pipeline.publish(
+                TASK_EVENTS_CHANNEL.format(execution_history.task_id),
+                payload,
+            )
+        pipeline.execute()
+    except redis.RedisError:
+        pass
+
+
+@contextmanager
+def events_disabled():
+    """
+    Keeps the state changes of executions made inside off the event
+    stream.
+    """
+    token = _publishing.set(False)
+    try:
+        yield
+    finally:
+        _publishing.reset(token)
+
+
+async def stream_execution_events(task_id=None):
+    """
+    Yields execution events as server-sent events, with a comment line
+    every KEEPALIVE_INTERVAL seconds to keep idle connections open.
+    """
+    channel = EVENTS_CHANNEL
+    if task_id is not None:
+        channel = TASK_EVENTS_CHANNEL.format(task_id)
+    client = redis.asyncio.from_url(settings.REDIS_URL)
+    pubsub = client.pubsub()
+    try:
+        await pubsub.subscribe(channel)
+        yield "retry: 3000\n\n"
+        while True:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=KEEPALIVE_INTERVAL
+            )
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: execution\ndata: {message['data'].decode()}\n\n"
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
@@ -0,0 +1,120 @@
+import csv
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+
+from .encoding import to_json_value
+from .results import iter_result_rows, materialized_table_name
+
+EXPORT_FETCH_SIZE = 2000
+EXPORT_BLOCK_SIZE = 64 * 1024
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def iter_blob_export(blob):
+    """
+    Yields the column names and then the rows of a stored result.
+    """
+    yield blob.columns
+    yield from iter_result_rows(blob)
+
+
+def iter_materialized_export(task, execution_id=None):
+    """
+    Yields the column names and then the rows of a task's materialized
+    table, read through a server-side cursor.
+    """
+    query = f'SELECT * FROM "{materialized_table_name(task)}"'
+    params = []
+    if execution_id is not None:
+        query += " WHERE _execution_id = %s"
+        params.append(execution_id)
+    cursor = connection.chunked_cursor()
+    try:
+        cursor.execute(query, params)
+        rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+        yield [desc[0] for desc in cursor.description][1:]
+        while rows:
+            for row in rows:
+                yield row[1:]
+            rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+    finally:
+        cursor.close()
+
+
+def render_csv(rows):
+    writer = csv.writer(_Echo())
+    for row in rows:
+        yield writer.writerow([_csv_value(value) for value in row])
+
+
+def render_ndjson(rows):
+    columns = None
+    for row in rows:
+        if columns is None:
+            columns = row
+            continue
+        values = [to_json_value(value) for value in row]
+        yield json.dumps(dict(zip(columns, values))) + "\n"
+
+
+RENDERERS = {
+    "csv": (render_csv, "text/csv"),
+    "ndjson": (render_ndjson, "application/x-ndjson"),
+}
+
+
+def _csv_value(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "\\x" + bytes(value).hex()
+    return value
+
+
+def encode_blocks(lines, compress=False):
+    """
+    Groups rendered lines into blocks of about EXPORT_BLOCK_SIZE bytes,
+    gzip-compressing them on the fly when requested.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    block = []
+    size = 0
+    for line in lines:
+        data = line.encode("utf-8")
+        block.append(data)
+        size += len(data)
+        if size >= EXPORT_BLOCK_SIZE:
+            data = b"".join(block)
+            block, size = [], 0
+            if compressor is not None:
+                data = compressor.compress(data)
+            if data:
+                yield data
+    data = b"".join(block)
+    if compressor is not None:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+async def aiter_blocks(blocks):
+    """
+    Adapts encoded blocks for the ASGI handler, which would otherwise
+    buffer a synchronous iterator in full before sending it. Blocks are
+    pulled one at a time in the request's sync thread, which owns the
+    database connection the rows are read from.
+    """
+    next_block = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            block = await next_block(blocks, None)
+            if block is None:
+                return
+            yield block
+    finally:
+        await sync_to_async(blocks.close, thread_sensitive=True)()
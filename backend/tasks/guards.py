@@ -0,0 +1,146 @@
+import json
+import time
+
+from celery import current_app
+
+from .models import DatabaseConnection
+from .pool import get_pool
+from .redis_client import get_redis
+
+CANCEL_KEY = "execution_cancel:{}"
+BACKEND_KEY = "execution_backend:{}"
+KEY_TTL = 24 * 60 * 60
+CANCEL_CHECK_INTERVAL = 1
+
+
+class ExecutionAborted(Exception):
+    status = "FAILURE"
+
+
+class ExecutionCancelled(ExecutionAborted):
+    status = "CANCELLED"
+
+
+class ExecutionTimedOut(ExecutionAborted):
+    status = "TIMEOUT"
+
+
+class ExecutionGuard:
+    """
+    Enforces a task's time, row and byte limits while its results
+    stream in, and lets a running execution be cancelled.
+    """
+
+    def __init__(self, task, celery_task_id, slot="main"):
+        self.celery_task_id = celery_task_id
+        self.slot = slot
+        self.statement_timeout = task.statement_timeout
+        self.max_rows = task.max_rows
+        self.max_bytes = task.max_result_bytes
+        self.deadline = None
+        if task.statement_timeout:
+            self.deadline = time.monotonic() + task.statement_timeout
+        self.rows = 0
+        self.bytes = 0
+        self.truncated = False
+        self._cancel_checked_at = 0
+
+    @property
+    def has_result_limits(self):
+        return bool(self.max_rows or self.max_bytes)
+
+    def start(self, source_conn, connection_id):
+        """
+        Applies the statement timeout to the source transaction and
+        registers its backend pid so the query can be cancelled.
+        """
+        if self.statement_timeout:
+            with source_conn.cursor() as cursor:
+                cursor.execute(
+                    "SET LOCAL statement_timeout = %s",
+                    [self.statement_timeout * 1000],
+                )
+        key = BACKEND_KEY.format(self.celery_task_id)
+        pipeline = get_redis().pipeline()
+        pipeline.hset(
+            key,
+            self.slot,
+            json.dumps(
+                {
+                    "connection_id": connection_id,
+                    "pid": source_conn.get_backend_pid(),
+                }
+            ),
+        )
+        pipeline.expire(key, KEY_TTL)
+        pipeline.execute()
+        self.check()
+
+    def finish(self):
+        get_redis().hdel(BACKEND_KEY.format(self.celery_task_id), self.slot)
+
+    def is_cancelled(self):
+        return is_cancelled(self.celery_task_id)
+
+    def check(self):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise ExecutionTimedOut(
+                f"Statement timeout of {self.statement_timeout}s exceeded"
+            )
+        now = time.monotonic()
+        if now - self._cancel_checked_at >= CANCEL_CHECK_INTERVAL:
+            self._cancel_checked_at = now
+            if self.is_cancelled():
+                raise ExecutionCancelled("Execution was cancelled")
+
+    def admit_rows(self, rows):
+        """
+        Returns the part of a batch that fits into the row limit.
+        """
+        self.check()
+        if self.max_rows and self.rows + len(rows) > self.max_rows:
+            rows = rows[: self.max_rows - self.rows]
+            self.truncated = True
+        self.rows += len(rows)
+        return rows
+
+    def admit_bytes(self, size):
+        """
+        Returns whether a batch of the given encoded size still fits
+        into the byte limit.
+        """
+        if self.max_bytes and self.bytes + size > self.max_bytes:
+            self.truncated = True
+            return False
+        self.bytes += size
+        return True
+
+
+def is_cancelled(celery_task_id):
+    return bool(get_redis().exists(CANCEL_KEY.format(celery_task_id)))
+
+
+def cancel_execution(execution_history):
+    """
+    Revokes the Celery task and cancels its queries on the source
+    database, including those of its shards. Returns whether the
+    execution was running.
+    """
+    celery_task_id = execution_history.celery_task_id
+    current_app.control.revoke(celery_task_id)
+    client = get_redis()
+    client.set(CANCEL_KEY.format(celery_task_id), 1, ex=KEY_TTL)
+    backends = client.hvals(BACKEND_KEY.format(celery_task_id))
+    for backend in backends:
+        backend = json.loads(backend)
+        db_conn = DatabaseConnection.objects.filter(
+            id=backend["connection_id"]
+        ).first()
+        if db_conn is None:
+            continue
+        with get_pool(db_conn).connection() as source_conn:
+            with source_conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_cancel_backend(%s)", [backend["pid"]]
+                )
+    return bool(backends)
@@ -0,0 +1,138 @@
+from celery.schedules import ParseException
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Q
+from django_celery_beat.models import (
+    CrontabSchedule,
+    PeriodicTask,
+    PeriodicTasks,
+)
+from rest_framework import serializers
+
+from .models import DatabaseConnection, Task
+
+CRON_FIELDS = (
+    "minute",
+    "hour",
+    "day_of_month",
+    "month_of_year",
+    "day_of_week",
+)
+
+
+class TaskImportSerializer(serializers.ModelSerializer):
+    database_connection = serializers.IntegerField()
+
+    class Meta:
+        model = Task
+        exclude = [
+            "id",
+            "last_run",
+            "periodic_task",
+            "watermark_value",
+            "consecutive_failures",
+        ]
+
+    def validate_schedule(self, value):
+        try:
+            Task._parse_cron_expression(value)
+        except (ValueError, ParseException) as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
+    def validate(self, attrs):
+        """
+        Runs Task.clean, which bulk_create skips, so the sharding options
+        are checked the same way as for tasks created one by one.
+        """
+        fields = {
+            key: value
+            for key, value in attrs.items()
+            if key != "database_connection"
+        }
+        try:
+            Task(**fields).clean()
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.message_dict)
+        return attrs
+
+
+def import_tasks(items):
+    """
+    Creates tasks and their periodic tasks in bulk inside one
+    transaction. Validation runs in memory with a single query for the
+    referenced connections, CrontabSchedules are shared between tasks
+    and beat is notified about the schedule change once.
+    Raises serializers.ValidationError with per-item errors.
+    """
+    serializer = TaskImportSerializer(data=items, many=True)
+    serializer.is_valid(raise_exception=True)
+    rows = serializer.validated_data
+    if not rows:
+        return []
+
+    connection_ids = {row["database_connection"] for row in rows}
+    existing_ids = set(
+        DatabaseConnection.objects.filter(id__in=connection_ids).values_list(
+            "id", flat=True
+        )
+    )
+    errors = [
+        (
+            {"database_connection": ["Подключение не найдено."]}
+            if row["database_connection"] not in existing_ids
+            else {}
+        )
+        for row in rows
+    ]
+    if any(errors):
+        raise serializers.ValidationError(errors)
+
+    cron_keys = [_schedule_key(row["schedule"]) for row in rows]
+    with transaction.atomic():
+        schedules = _get_or_create_schedules(set(cron_keys))
+        new_tasks = []
+        for row in rows:
+            row = dict(row)
+            row["database_connection_id"] = row.pop("database_connection")
+            new_tasks.append(Task(**row))
+        tasks = Task.objects.bulk_create(new_tasks)
+        periodic_tasks = PeriodicTask.objects.bulk_create(
+            [
+                PeriodicTask(**task.get_periodic_task_kwargs(schedules[key]))
+                for task, key in zip(tasks, cron_keys)
+            ]
+        )
+        for task, periodic_task in zip(tasks, periodic_tasks):
+            task.periodic_task = periodic_task
+        Task.objects.bulk_update(tasks, ["periodic_task"])
+        PeriodicTasks.update_changed()
+    return tasks
+
+
+def _get_or_create_schedules(keys):
+    """
+    Returns CrontabSchedules keyed by their cron fields, creating the
+    missing ones with a single bulk insert.
+    """
+    query = Q()
+    for key in keys:
+        query |= Q(**dict(zip(CRON_FIELDS, key)))
+    schedules = {}
+    for schedule in CrontabSchedule.objects.filter(query):
+        key = tuple(getattr(schedule, field) for field in CRON_FIELDS)
+        schedules.setdefault(key, schedule)
+    missing = [
+        CrontabSchedule(**dict(zip(CRON_FIELDS, key)))
+        for key in keys
+        if key not in schedules
+    ]
+    for schedule in CrontabSchedule.objects.bulk_create(missing):
+        key = tuple(getattr(schedule, field) for field in CRON_FIELDS)
+        schedules[key] = schedule
+    return schedules
+
+
+def _schedule_key(cron_expression):
+    cron_fields = Task._parse_cron_expression(cron_expression)
+    return tuple(cron_fields[field] for field in CRON_FIELDS)
@@ -0,0 +1,109 @@
+import time
+
+from django.conf import settings
+
+from .redis_client import get_redis
+
+ACQUIRE_SLOT_SCRIPT = """
+local key, token = KEYS[1], ARGV[1]
+local limit = tonumber(ARGV[2])
+local now, lease = tonumber(ARGV[3]), tonumber(ARGV[4])
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - lease)
+if redis.call('ZSCORE', key, token) or redis.call('ZCARD', key) < limit then
+    redis.call('ZADD', key, now, token)
+    redis.call('EXPIRE', key, lease)
+    return 1
+end
+return 0
+"""
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class ConnectionSemaphore:
+    """
+    Distributed counting semaphore limiting how many executions run at
+    once against one DatabaseConnection. Holders are kept in a sorted
+    set scored by acquisition time, so slots of crashed workers expire
+    after CONNECTION_SLOT_LEASE seconds.
+    """
+
+    KEY = "connection_slots:{}"
+
+    def __init__(self, connection_id, limit, token):
+        self.key = self.KEY.format(connection_id)
+        self.limit = limit
+        self.token = token
+
+    def acquire(self):
+        acquire_slot = get_redis().register_script(ACQUIRE_SLOT_SCRIPT)
+        return bool(
+            acquire_slot(
+                keys=[self.key],
+                args=[
+                    self.token,
+                    self.limit,
+                    time.time(),
+                    settings.CONNECTION_SLOT_LEASE,
+                ],
+            )
+        )
+
+    def release(self):
+        get_redis().zrem(self.key, self.token)
+
+
+class TaskLock:
+    """
+    Per-task lock held by the execution currently running the task's
+    query. The holder's Celery task id is stored as the value so
+    overlapping triggers can find the in-flight execution.
+    """
+
+    KEY = "task_lock:{}"
+    FOLLOW_UP_KEY = "task_follow_up:{}"
+
+    def __init__(self, task_id, token):
+        self.key = self.KEY.format(task_id)
+        self.follow_up_key = self.FOLLOW_UP_KEY.format(task_id)
+        self.token = token
+
+    def acquire(self):
+        return bool(
+            get_redis().set(
+                self.key, self.token, nx=True, ex=settings.TASK_LOCK_LEASE
+            )
+        )
+
+    def holder(self):
+        holder = get_redis().get(self.key)
+        return holder.decode() if holder is not None else None
+
+    def release(self):
+        release_lock = get_redis().register_script(RELEASE_LOCK_SCRIPT)
+        release_lock(keys=[self.key], args=[self.token])
+
+    def claim_follow_up(self):
+        """
+        Reserves the single follow-up run of the task. Returns whether
+        this trigger is (or already was) the follow-up.
+        """
+        client = get_redis()
+        if client.set(
+            self.follow_up_key,
+            self.token,
+            nx=True,
+            ex=settings.TASK_LOCK_LEASE,
+        ):
+            return True
+        follow_up = client.get(self.follow_up_key)
+        return follow_up is not None and follow_up.decode() == self.token
+
+    def release_follow_up(self):
+        release_lock = get_redis().register_script(RELEASE_LOCK_SCRIPT)
+        release_lock(keys=[self.follow_up_key], args=[self.token])
@@ -0,0 +1,142 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.benchmark import (
+    PROFILES,
+    STORAGE_MODES,
+    BenchmarkError,
+    Scenario,
+    compare_reports,
+    run_benchmark,
+)
+
+COLUMNS = [
+    ("rows_per_second", "rows/s"),
+    ("latency_p50", "p50 s"),
+    ("latency_p99", "p99 s"),
+    ("fetch_p99", "fetch p99"),
+    ("encode_p99", "encode p99"),
+    ("write_p99", "write p99"),
+    ("peak_rss", "peak RSS MB"),
+]
+
+
+def _csv_list(cast):
+    return lambda value: [cast(item) for item in value.split(",") if item]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks execute_task on synthetic result sets and compares "
+        "the results with a saved baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=_csv_list(int),
+            default=[1, 1000, 100000],
+            help="Comma-separated result sizes, up to 10000000 rows.",
+        )
+        parser.add_argument(
+            "--profiles",
+            type=_csv_list(str),
+            default=list(PROFILES),
+            help=f"Column profiles: {', '.join(PROFILES)}.",
+        )
+        parser.add_argument(
+            "--storage",
+            type=_csv_list(str),
+            default=list(STORAGE_MODES),
+            help=f"Result storage modes: {', '.join(STORAGE_MODES)}.",
+        )
+        parser.add_argument(
+            "--width",
+            type=_csv_list(int),
+            default=[32],
+            help="Comma-separated lengths of generated text values.",
+        )
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument("--fetch-size", type=int, default=1000)
+        parser.add_argument(
+            "--source",
+            choices=["fake", "postgres"],
+            default="fake",
+            help=(
+                "fake generates rows in-process; postgres runs "
+                "generate_series queries against the default database."
+            ),
+        )
+        parser.add_argument("--save", help="Write the results to this file.")
+        parser.add_argument(
+            "--compare", help="Baseline file to check the results against."
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Allowed relative regression against the baseline.",
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options["profiles"]) - set(PROFILES)
+        unknown |= set(options["storage"]) - set(STORAGE_MODES)
+        if unknown:
+            raise CommandError(
+                f"Unknown options: {', '.join(sorted(unknown))}"
+            )
+        if options["runs"] < 1 or options["fetch_size"] < 1:
+            raise CommandError("--runs and --fetch-size must be positive.")
+        scenarios = [
+            Scenario(rows, profile, storage, width)
+            for storage in options["storage"]
+            for profile in options["profiles"]
+            for width in options["width"]
+            for rows in options["rows"]
+        ]
+        try:
+            report = run_benchmark(
+                scenarios,
+                runs=options["runs"],
+                source=options["source"],
+                fetch_size=options["fetch_size"],
+                log=self.stdout.write,
+            )
+        except BenchmarkError as e:
+            raise CommandError(str(e))
+
+        self._print_report(report)
+        if options["save"]:
+            with open(options["save"], "w", encoding="utf-8") as file:
+                json.dump(report, file, indent=2, sort_keys=True)
+            self.stdout.write(f"Saved results to {options['save']}.")
+        if options["compare"]:
+            with open(options["compare"], encoding="utf-8") as file:
+                baseline = json.load(file)
+            regressions = compare_reports(
+                report, baseline, options["tolerance"]
+            )
+            if regressions:
+                raise CommandError(
+                    "Regressions against the baseline:\n"
+                    + "\n".join(regressions)
+                )
+            self.stdout.write(
+                self.style.SUCCESS("No regressions against the baseline.")
+            )
+
+    def _print_report(self, report):
+        name_width = max(len(name) for name in report)
+        header = "scenario".ljust(name_width) + "".join(
+            title.rjust(14) for _, title in COLUMNS
+        )
+        self.stdout.write(header)
+        for name, result in report.items():
+            values = []
+            for key, _ in COLUMNS:
+                value = result[key]
+                if key == "peak_rss":
+                    value /= 1024 * 1024
+                values.append(f"{value:14.4g}")
+            self.stdout.write(name.ljust(name_width) + "".join(values))
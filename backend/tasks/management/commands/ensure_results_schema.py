@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from tasks.results import ensure_results_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the day-partitioned results table of result chunks, "
+        "with its (id, execution_time) primary key and "
+        "(content_hash, execution_time) unique index, and its upcoming "
+        "partitions."
+    )
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            ensure_results_schema(cursor)
+        self.stdout.write(self.style.SUCCESS("Results schema is ready."))
@@ -0,0 +1,24 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework import serializers
+
+from tasks.importer import import_tasks
+
+
+class Command(BaseCommand):
+    help = "Creates tasks in bulk from a JSON file with a list of tasks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path to the JSON file.")
+
+    def handle(self, *args, **options):
+        with open(options["path"], encoding="utf-8") as file:
+            items = json.load(file)
+        try:
+            tasks = import_tasks(items)
+        except serializers.ValidationError as e:
+            raise CommandError(json.dumps(e.detail, ensure_ascii=False))
+        self.stdout.write(
+            self.style.SUCCESS(f"Imported {len(tasks)} tasks.")
+        )
@@ -0,0 +1,231 @@
+import re
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import redis
+
+from .redis_client import get_redis
+
+METRICS_KEY = "metrics"
+DURATION_BUCKETS = (
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1,
+    5,
+    10,
+    30,
+    60,
+    300,
+    900,
+    3600,
+)
+METRIC_TYPES = {
+    "query_executions_total": "counter",
+    "query_rows_total": "counter",
+    "query_result_bytes_total": "counter",
+    "query_phase_duration_seconds": "histogram",
+    "query_execution_duration_seconds": "histogram",
+    "query_queue_wait_seconds": "histogram",
+}
+
+SUFFIXES = ("_bucket", "_sum", "_count")
+LABEL_PATTERN = re.compile(r'(\w+)="([^"]*)"')
+
+_current_timer = ContextVar("phase_timer", default=None)
+_recording = ContextVar("recording_metrics", default=True)
+
+
+class PhaseTimer:
+    """
+    Accumulates the time one execution spends in each phase. Time
+    spent in a nested phase is only counted for the inner phase, so
+    e.g. fetching driven by COPY is not also counted as writing.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases = defaultdict(float)
+        self._nested = []
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        self._nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] += elapsed - self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+
+    def as_dict(self):
+        return {
+            **{name: round(value, 6) for name, value in self.phases.items()},
+            "total": round(time.perf_counter() - self.started_at, 6),
+        }
+
+
+@contextmanager
+def track_phases():
+    """
+    Makes a new PhaseTimer current for the code running inside.
+    """
+    timer = PhaseTimer()
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+@contextmanager
+def timed(phase):
+    """
+    Adds the time spent inside to the current execution's phase, if an
+    execution is being tracked.
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.phase(phase):
+        yield
+
+
+@contextmanager
+def metrics_disabled():
+    """
+    Keeps the executions finishing inside out of the metrics.
+    """
+    token = _recording.set(False)
+    try:
+        yield
+    finally:
+        _recording.reset(token)
+
+
+def record_execution(execution_history, task, timings):
+    """
+    Adds one finished execution to the Prometheus metrics kept in Redis,
+    where every worker process can update them.
+    """
+    if not _recording.get():
+        return
+    labels = {
+        "task": task.id,
+        "connection": task.database_connection_id,
+    }
+    metrics = defaultdict(float)
+    status = execution_history.status
+    metrics[_series("query_executions_total", status=status, **labels)] += 1
+    if execution_history.row_count is not None:
+        metrics[_series("query_rows_total", **labels)] += (
+            execution_history.row_count
+        )
+    if execution_history.byte_count is not None:
+        metrics[_series("query_result_bytes_total", **labels)] += (
+            execution_history.byte_count
+        )
+    for phase, value in timings.items():
+        if phase == "total":
+            _observe(
+                metrics, "query_execution_duration_seconds", value, labels
+            )
+        else:
+            _observe(
+                metrics,
+                "query_phase_duration_seconds",
+                value,
+                {**labels, "phase": phase},
+            )
+    if execution_history.queue_wait is not None:
+        _observe(
+            metrics,
+            "query_queue_wait_seconds",
+            execution_history.queue_wait,
+            {**labels, "lane": execution_history.lane},
+        )
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        for series, value in metrics.items():
+            pipeline.hincrbyfloat(METRICS_KEY, series, value)
+        pipeline.execute()
+    except redis.RedisError:
+        pass
+
+
+def render_metrics():
+    """
+    Returns all metrics in the Prometheus text exposition format.
+    """
+    values = get_redis().hgetall(METRICS_KEY)
+    by_name = defaultdict(list)
+    for series, value in values.items():
+        series = series.decode()
+        by_name[_metric_name(series)].append((series, float(value)))
+    lines = []
+    for name in sorted(by_name):
+        lines.append(f"# TYPE {name} {METRIC_TYPES.get(name, 'untyped')}")
+        for series, value in sorted(by_name[name], key=_series_order):
+            lines.append(f"{series} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _observe(metrics, name, value, labels):
+    for bucket in DURATION_BUCKETS:
+        metrics[_series(f"{name}_bucket", le=bucket, **labels)] += int(
+            value <= bucket
+        )
+    metrics[_series(f"{name}_bucket", le="+Inf", **labels)] += 1
+    metrics[_series(f"{name}_sum", **labels)] += value
+    metrics[_series(f"{name}_count", **labels)] += 1
+
+
+def _series(name, **labels):
+    label_text = ",".join(
+        f'{key}="{value}"' for key, value in sorted(labels.items())
+    )
+    return f"{name}{{{label_text}}}"
+
+
+def _series_order(item):
+    """
+    Sorts series by their labels, with every histogram's buckets in
+    increasing le order followed by its _sum and _count.
+    """
+    series, _ = item
+    name, _, label_text = series.partition("{")
+    labels = dict(LABEL_PATTERN.findall(label_text))
+    le = labels.pop("le", None)
+    suffix = next(
+        (rank for rank, s in enumerate(SUFFIXES) if name.endswith(s)), 0
+    )
+    return (
+        sorted(labels.items()),
+        suffix,
+        float(le) if le is not None else 0.0,
+    )
+
+
+def _format_value(value):
+    """
+    Formats a sample without losing precision, writing whole numbers
+    such as counters as integers.
+    """
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _metric_name(series):
+    name = series.split("{", 1)[0]
+    for suffix in SUFFIXES:
+        if name.endswith(suffix) and name[: -len(suffix)] in METRIC_TYPES:
+            return name[: -len(suffix)]
+    return name
@@ -1,7 +1,11 @@
 import json
+from celery.schedules import ParseException, crontab
+from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
 from django.db import models
 from django_celery_beat.models import PeriodicTask, CrontabSchedule
 from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
 
 
 class DatabaseConnection(models.Model):
@@ -15,6 +19,9 @@ class DatabaseConnection(models.Model):
     database_name = models.CharField(max_length=255)
     username = models.CharField(max_length=255)
     password = models.CharField(max_length=128)
+    max_concurrency = models.PositiveIntegerField(default=0)  # 0 = no limit
+    queue = models.CharField(max_length=255, blank=True)
+    consecutive_failures = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.name
@@ -25,13 +32,47 @@ class Task(models.Model):
     Model to store task details.
     """
 
+    OVERLAP_POLICY_CHOICES = [
+        ("allow", "Allow concurrent runs"),
+        ("skip", "Skip while running"),
+        ("queue", "Queue one follow-up run"),
+        ("coalesce", "Reuse the running execution's result"),
+    ]
+
     name = models.CharField(max_length=255)
     query = models.TextField()
     schedule = models.CharField(max_length=100)  # Cron expression
     retry_delay = models.PositiveIntegerField(default=60)
     max_retries = models.PositiveIntegerField(default=3)
     is_active = models.BooleanField(default=True)
+    stream_results = models.BooleanField(default=False)
+    materialize_results = models.BooleanField(default=False)
+    fetch_size = models.PositiveIntegerField(
+        default=1000, validators=[MinValueValidator(1)]
+    )
+    cache_ttl = models.PositiveIntegerField(default=0)  # Seconds, 0 = off
+    # Guardrails, 0 = no limit
+    statement_timeout = models.PositiveIntegerField(default=0)  # Seconds
+    max_rows = models.PositiveIntegerField(default=0)
+    max_result_bytes = models.PositiveBigIntegerField(default=0)
+    # Incremental mode: only rows past the stored watermark are fetched
+    watermark_column = models.CharField(max_length=255, blank=True)
+    watermark_value = models.TextField(null=True, blank=True)
+    # What a trigger does while another execution of the task is running
+    overlap_policy = models.CharField(
+        max_length=20, choices=OVERLAP_POLICY_CHOICES, default="allow"
+    )
+    # Sharded mode: rows are split by a hash of shard_key into
+    # shard_count slices, each extracted by its own Celery task
+    shard_key = models.CharField(max_length=255, blank=True)
+    shard_count = models.PositiveIntegerField(
+        default=1, validators=[MinValueValidator(1)]
+    )
+    # History retention, 0 = keep everything
+    retention_runs = models.PositiveIntegerField(default=0)
+    retention_days = models.PositiveIntegerField(default=0)
     last_run = models.DateTimeField(null=True, blank=True)
+    consecutive_failures = models.PositiveIntegerField(default=0)
     database_connection = models.ForeignKey(
         DatabaseConnection, on_delete=models.CASCADE, related_name="tasks"
     )
@@ -45,12 +86,36 @@ class Task(models.Model):
 
     def clean(self):
         """
-        Validates the cron expression.
+        Validates the cron expression and the sharding options.
         """
         try:
             self._parse_cron_expression(self.schedule)
-        except ValueError as e:
+        except (ValueError, ParseException) as e:
             raise ValidationError({"schedule": str(e)})
+        if self.shard_count > 1:
+            if not self.shard_key:
+                raise ValidationError(
+                    {"shard_key": "A shard key is required for sharded tasks."}
+                )
+            if self.materialize_results or self.watermark_column:
+                raise ValidationError(
+                    {
+                        "shard_count": "Sharded tasks can't be materialized "
+                        "or incremental."
+                    }
+                )
+            # Each shard would enforce the limits on its own slice only
+            if self.max_rows or self.max_result_bytes:
+                raise ValidationError(
+                    {
+                        "shard_count": "Sharded tasks can't limit their "
+                        "result rows or bytes."
+                    }
+                )
+
+    @property
+    def is_sharded(self):
+        return self.shard_count > 1
 
     def save(self, *args, **kwargs):
         self.full_clean()
@@ -58,8 +123,11 @@ class Task(models.Model):
         self.create_or_update_periodic_task()
 
     def delete(self, *args, **kwargs):
+        from .retention import delete_task_history
+
         if self.periodic_task:
             self.periodic_task.delete()
+        delete_task_history(self)
         super().delete(*args, **kwargs)
 
     def create_or_update_periodic_task(self):
@@ -67,14 +135,7 @@ class Task(models.Model):
         schedule = CrontabSchedule.objects.filter(**cron_fields).first()
         if not schedule:
             schedule = CrontabSchedule.objects.create(**cron_fields)
-        task_name = f"Task {self.id}: {self.name}"
-        task_kwargs = {
-            "crontab": schedule,
-            "name": task_name,
-            "task": "tasks.tasks.execute_task",
-            "args": json.dumps([self.id]),
-            "enabled": self.is_active,
-        }
+        task_kwargs = self.get_periodic_task_kwargs(schedule)
         if self.periodic_task:
             for key, value in task_kwargs.items():
                 setattr(self.periodic_task, key, value)
@@ -83,25 +144,120 @@ class Task(models.Model):
             self.periodic_task = PeriodicTask.objects.create(**task_kwargs)
             super().save(update_fields=["periodic_task"])
 
-    def _parse_cron_expression(self, cron_expression):
+    def get_periodic_task_kwargs(self, schedule):
+        return {
+            "crontab": schedule,
+            "name": f"Task {self.id}: {self.name}",
+            "task": "tasks.tasks.execute_task",
+            "args": json.dumps([self.id]),
+            "enabled": self.is_active,
+        }
+
+    def get_query(self, shard_index=None):
+        """
+        Returns the SQL and parameters to run. In incremental mode the
+        query is wrapped to select only rows past the stored watermark,
+        and for a shard only the rows whose shard key hashes to it.
+        """
+        if shard_index is not None:
+            key = '"' + self.shard_key.replace('"', '""') + '"'
+            query = self.query.strip().rstrip(";")
+            return (
+                f"SELECT * FROM ({query}) AS shard_source "
+                f"WHERE (hashtext(shard_source.{key}::text) & 2147483647) "
+                f"% {self.shard_count} = {shard_index}",
+                None,
+            )
+        if not self.watermark_column:
+            return self.query, None
+        column = '"' + self.watermark_column.replace('"', '""') + '"'
+        query = self.query.strip().rstrip(";")
+        if self.watermark_value is None:
+            return (
+                f"SELECT * FROM ({query}) AS incremental_source "
+                f"ORDER BY {column}",
+                None,
+            )
+        query = query.replace("%", "%%")
+        return (
+            f"SELECT * FROM ({query}) AS incremental_source "
+            f"WHERE {column} > %(watermark)s ORDER BY {column}",
+            {"watermark": self.watermark_value},
+        )
+
+    @staticmethod
+    def _parse_cron_expression(cron_expression):
         """
         Parses a cron into CrontabSchedule.
         """
         fields = cron_expression.strip().split()
         if len(fields) != 5:
             raise ValueError("Invalid cron expression. Expected 5 fields.")
-        return {
+        cron_fields = {
             "minute": fields[0],
             "hour": fields[1],
             "day_of_month": fields[2],
             "month_of_year": fields[3],
             "day_of_week": fields[4],
         }
+        crontab(**cron_fields)
+        return cron_fields
 
     def __str__(self):
         return self.name
 
 
+class ResultBlob(models.Model):
+    """
+    Model to store a query result once per day, addressed by its content
+    hash. The rows live in the chunks listed in chunk_ids, all of them
+    in the results table partition of chunk_date, and the blob expires
+    together with that partition.
+    """
+
+    content_hash = models.CharField(
+        max_length=64, null=True, blank=True, db_index=True
+    )
+    columns = models.JSONField(default=list)
+    column_types = models.JSONField(default=list)
+    row_count = models.PositiveBigIntegerField(default=0)
+    size = models.PositiveBigIntegerField(default=0)
+    chunk_date = models.DateTimeField(db_index=True)
+    chunk_ids = ArrayField(models.BigIntegerField(), default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["content_hash", "chunk_date"],
+                name="unique_result_blob_per_day",
+            )
+        ]
+
+    def __str__(self):
+        return self.content_hash or f"Result {self.id} (incomplete)"
+
+
+class ResultChunk(models.Model):
+    """
+    Model to store a batch of rows of one or more results. Chunks live
+    in the daily partitions of the results table, created by
+    tasks.results.ensure_results_schema, and are shared by every result
+    of the day with the same content.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    # Start of the UTC day of the partition holding the chunk
+    execution_time = models.DateTimeField()
+    content_hash = models.CharField(max_length=64)
+    # Compressed columnar encoding, see tasks.encoding
+    data = models.BinaryField()
+
+    class Meta:
+        managed = False
+        db_table = settings.RESULT_TABLE_NAME
+
+
 class ExecutionHistory(models.Model):
     """
     Model to store execution history of tasks.
@@ -112,19 +268,121 @@ class ExecutionHistory(models.Model):
         ("SUCCESS", "Success"),
         ("RETRY", "Retry"),
         ("FAILURE", "Failure"),
+        ("PARTIAL", "Partial"),
+        ("TIMEOUT", "Timeout"),
+        ("CANCELLED", "Cancelled"),
+        ("SKIPPED", "Skipped"),
+        ("COALESCED", "Coalesced"),
+    ]
+    LANE_CHOICES = [
+        ("scheduled", "Scheduled"),
+        ("interactive", "Interactive"),
     ]
     task = models.ForeignKey(
         Task, on_delete=models.CASCADE, related_name="executions"
     )
     execution_time = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    result = models.ForeignKey(
+        ResultBlob,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="executions",
+    )
     result_data = models.JSONField(null=True, blank=True)
+    from_cache = models.BooleanField(default=False)
+    coalesced_into = models.ForeignKey(
+        "self",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="coalesced",
+    )
     error_message = models.TextField(null=True, blank=True)
     retry_count = models.PositiveIntegerField(default=0)
     celery_task_id = models.CharField(max_length=255, unique=True)
+    timings = models.JSONField(null=True, blank=True)
+    row_count = models.PositiveBigIntegerField(null=True, blank=True)
+    byte_count = models.PositiveBigIntegerField(null=True, blank=True)
+    queue_wait = models.FloatField(null=True, blank=True)
+    lane = models.CharField(
+        max_length=20, choices=LANE_CHOICES, default="scheduled"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["task", "-execution_time"],
+                name="execution_task_time_idx",
+            ),
+            models.Index(
+                fields=["status", "execution_time"],
+                name="execution_status_time_idx",
+            ),
+            models.Index(
+                fields=["-execution_time", "-id"],
+                name="execution_time_idx",
+            ),
+        ]
 
     def __str__(self):
         return (
             f"{self.task.name} - "
             f'{self.execution_time.strftime("%Y-%m-%d %H:%M:%S")}'
         )
+
+
+class ExecutionStats(models.Model):
+    """
+    Model to store execution statistics rolled up per hour or per day,
+    for one task or, when task is empty, for a whole connection.
+    """
+
+    GRAIN_CHOICES = [
+        ("hour", "Hour"),
+        ("day", "Day"),
+    ]
+    grain = models.CharField(max_length=10, choices=GRAIN_CHOICES)
+    period_start = models.DateTimeField()
+    database_connection = models.ForeignKey(
+        DatabaseConnection, on_delete=models.CASCADE, related_name="stats"
+    )
+    task = models.ForeignKey(
+        Task,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="stats",
+    )
+    executions = models.PositiveIntegerField(default=0)
+    successes = models.PositiveIntegerField(default=0)
+    failures = models.PositiveIntegerField(default=0)
+    cancellations = models.PositiveIntegerField(default=0)
+    skips = models.PositiveIntegerField(default=0)
+    max_failure_streak = models.PositiveIntegerField(default=0)
+    duration_sum = models.FloatField(default=0)
+    duration_max = models.FloatField(default=0)
+    # Execution counts per tasks.metrics.DURATION_BUCKETS bucket, plus +Inf
+    duration_buckets = ArrayField(models.PositiveIntegerField(), default=list)
+    row_count = models.PositiveBigIntegerField(default=0)
+    byte_count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ["period_start"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["grain", "period_start", "task"],
+                condition=models.Q(task__isnull=False),
+                name="unique_task_stats_period",
+            ),
+            models.UniqueConstraint(
+                fields=["grain", "period_start", "database_connection"],
+                condition=models.Q(task__isnull=True),
+                name="unique_connection_stats_period",
+            ),
+        ]
+
+    def __str__(self):
+        target = self.task or self.database_connection
+        return f"{target} - {self.grain} {self.period_start:%Y-%m-%d %H:%M}"
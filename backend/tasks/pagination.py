@@ -0,0 +1,49 @@
+import base64
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(execution_time, pk):
+    """
+    Encodes the (execution_time, id) position of the last returned row.
+    """
+    raw = f"{execution_time.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor built by encode_cursor. Raises ValueError for
+    malformed cursors.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        execution_time, pk = raw.rsplit("|", 1)
+        execution_time = parse_datetime(execution_time)
+        pk = int(pk)
+    except (UnicodeError, ValueError, TypeError):
+        raise ValueError("Invalid cursor.")
+    if execution_time is None:
+        raise ValueError("Invalid cursor.")
+    return execution_time, pk
+
+
+def keyset_page(queryset, cursor, page_size):
+    """
+    Returns one page of a queryset ordered by (-execution_time, -id)
+    starting after the cursor, and the cursor of the next page.
+    """
+    queryset = queryset.order_by("-execution_time", "-id")
+    if cursor:
+        execution_time, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(execution_time__lt=execution_time)
+            | Q(execution_time=execution_time, id__lt=pk)
+        )
+    items = list(queryset[: page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(last.execution_time, last.id)
+    return items, next_cursor
@@ -0,0 +1,127 @@
+import re
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import ExecutionHistory, ResultBlob
+
+
+def day_start(moment=None):
+    """
+    Returns the start of the UTC day, and so of the results table
+    partition, that moment (by default now) falls in.
+    """
+    moment = (moment or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def partition_name(day):
+    return f"{settings.RESULT_TABLE_NAME}_p{day:%Y%m%d}"
+
+
+def create_partition(cursor, day):
+    """
+    Creates the daily partition of the results table holding rows
+    with execution_time on the given UTC day.
+    """
+    table_name = settings.RESULT_TABLE_NAME
+    start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    end = start + timedelta(days=1)
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS "{partition_name(day)}"
+        PARTITION OF "{table_name}"
+        FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}');
+        """
+    )
+
+
+def ensure_partitions(cursor):
+    """
+    Creates partitions from today up to RESULT_PARTITIONS_AHEAD days
+    in the future.
+    """
+    today = datetime.now(timezone.utc).date()
+    for offset in range(settings.RESULT_PARTITIONS_AHEAD + 1):
+        create_partition(cursor, today + timedelta(days=offset))
+
+
+def drop_expired_partitions(cursor):
+    """
+    Detaches and drops the partitions whose whole day is older than
+    RESULT_RETENTION_DAYS, together with the results whose chunks they
+    hold, and the legacy results table once all of its rows are that
+    old. Returns the names of the dropped tables.
+    """
+    table_name = settings.RESULT_TABLE_NAME
+    cutoff = datetime.now(timezone.utc).date() - timedelta(
+        days=settings.RESULT_RETENTION_DAYS
+    )
+    cursor.execute(
+        """
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = to_regclass(%s);
+        """,
+        [f'"{table_name}"'],
+    )
+    pattern = re.compile(rf"^{re.escape(table_name)}_p(\d{{8}})$")
+    dropped = []
+    for (name,) in cursor.fetchall():
+        match = pattern.match(name)
+        if not match:
+            continue
+        day = datetime.strptime(match.group(1), "%Y%m%d").date()
+        if day >= cutoff:
+            continue
+        with transaction.atomic():
+            _expire_results(cursor, day)
+            cursor.execute(
+                f'ALTER TABLE "{table_name}" DETACH PARTITION "{name}";'
+            )
+            cursor.execute(f'DROP TABLE "{name}";')
+        dropped.append(name)
+    if _drop_legacy_table(cursor, cutoff):
+        dropped.append(f"{table_name}_legacy")
+    return dropped
+
+
+def _expire_results(cursor, day):
+    """
+    Deletes the results whose chunks are in the partition of the given
+    day, detaching them from their executions first.
+    """
+    blob_table = ResultBlob._meta.db_table
+    chunk_date = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    cursor.execute(
+        f"""
+        UPDATE "{ExecutionHistory._meta.db_table}" SET result_id = NULL
+        WHERE result_id IN (
+            SELECT id FROM "{blob_table}" WHERE chunk_date = %s
+        );
+        DELETE FROM "{blob_table}" WHERE chunk_date = %s;
+        """,
+        [chunk_date, chunk_date],
+    )
+
+
+def _drop_legacy_table(cursor, cutoff):
+    """
+    Drops the unpartitioned results table kept from before partitioning
+    once it has no rows left within the retention window. Its rows are
+    copies of ExecutionHistory.result_data, so nothing else is lost.
+    """
+    legacy_table = f"{settings.RESULT_TABLE_NAME}_legacy"
+    cursor.execute("SELECT to_regclass(%s);", [f'"{legacy_table}"'])
+    if cursor.fetchone()[0] is None:
+        return False
+    cursor.execute(
+        f'SELECT 1 FROM "{legacy_table}" WHERE execution_time >= %s LIMIT 1;',
+        [datetime(cutoff.year, cutoff.month, cutoff.day, tzinfo=timezone.utc)],
+    )
+    if cursor.fetchone() is not None:
+        return False
+    cursor.execute(f'DROP TABLE "{legacy_table}";')
+    return True
@@ -0,0 +1,278 @@
+import json
+import math
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import redis
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .breaker import CircuitBreaker
+from .metrics import timed
+from .models import DatabaseConnection
+from .redis_client import get_redis
+
+STATS_KEY = "source_pool_stats:{}"
+
+_pools = {}
+_pools_lock = threading.Lock()
+_reaper_pid = None
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class SourceConnectionPool:
+    """
+    Pool of connections to one external database, owned by a single
+    worker process.
+    """
+
+    def __init__(self, connection_id, params):
+        self.connection_id = connection_id
+        self.params = params
+        self.max_size = settings.SOURCE_POOL_MAX_SIZE
+        self._idle = []
+        self._in_use = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._stats_published_at = 0
+        self.stats = {"created": 0, "reused": 0, "discarded": 0, "waits": 0}
+
+    def getconn(self, timeout=None):
+        """
+        Checks out a connection. A timeout bounds both the wait for a
+        free slot and connecting, otherwise SOURCE_POOL_CHECKOUT_TIMEOUT
+        and SOURCE_POOL_CONNECT_TIMEOUT apply.
+        """
+        checkout_timeout = timeout
+        if checkout_timeout is None:
+            checkout_timeout = settings.SOURCE_POOL_CHECKOUT_TIMEOUT
+        deadline = time.monotonic() + checkout_timeout
+        with self._condition:
+            self._evict_idle()
+            while True:
+                while self._idle:
+                    conn, last_used = self._idle.pop()
+                    if self._is_healthy(conn, last_used):
+                        self._in_use += 1
+                        self.stats["reused"] += 1
+                        return conn
+                    self._discard(conn)
+                if self._in_use < self.max_size:
+                    self._in_use += 1
+                    break
+                self.stats["waits"] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    raise PoolTimeout(
+                        "Timed out waiting for a connection to "
+                        f"DatabaseConnection {self.connection_id}"
+                    )
+        connect_timeout = settings.SOURCE_POOL_CONNECT_TIMEOUT
+        if timeout is not None:
+            connect_timeout = min(
+                connect_timeout, max(deadline - time.monotonic(), 0)
+            )
+        try:
+            conn = self._connect(connect_timeout)
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+        self.stats["created"] += 1
+        return conn
+
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        with self._condition:
+            self._in_use -= 1
+            if discard or conn.closed or self._closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._evict_idle()
+            self._condition.notify()
+        self._publish_stats()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Checks out a connection through the DatabaseConnection's circuit
+        breaker: fails fast with CircuitOpen while the source is
+        considered down, and feeds the breaker with the outcome.
+        """
+        breaker = CircuitBreaker(self.connection_id)
+        breaker.check()
+        with timed("connect"):
+            try:
+                conn = self.getconn(timeout)
+            except psycopg2.OperationalError:
+                breaker.record_failure()
+                raise
+        breaker.record_success()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def evict_idle(self):
+        with self._condition:
+            self._evict_idle()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+
+    def get_stats(self):
+        with self._condition:
+            return {
+                **self.stats,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "max_size": self.max_size,
+            }
+
+    def _connect(self, timeout):
+        # libpq rounds connect_timeout to whole seconds, at least 2
+        return psycopg2.connect(
+            **self.params, connect_timeout=max(2, math.ceil(timeout))
+        )
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        alive = []
+        for conn, last_used in self._idle:
+            if now - last_used > settings.SOURCE_POOL_IDLE_TIMEOUT:
+                self._discard(conn)
+            else:
+                alive.append((conn, last_used))
+        self._idle = alive
+
+    def _is_healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        idle_time = time.monotonic() - last_used
+        if idle_time < settings.SOURCE_POOL_HEALTH_CHECK_INTERVAL:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _discard(self, conn):
+        self.stats["discarded"] += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _publish_stats(self):
+        """
+        Pools live inside worker processes, so their stats are shared
+        through Redis for CheckDatabaseConnection to report.
+        """
+        now = time.monotonic()
+        interval = settings.SOURCE_POOL_STATS_INTERVAL
+        if now - self._stats_published_at < interval:
+            return
+        self._stats_published_at = now
+        key = STATS_KEY.format(self.connection_id)
+        try:
+            client = get_redis()
+            client.hset(key, _worker_name(), json.dumps(self.get_stats()))
+            client.expire(key, settings.SOURCE_POOL_IDLE_TIMEOUT)
+        except redis.RedisError:
+            pass
+
+
+def get_pool(db_conn):
+    """
+    Returns this process's pool for the DatabaseConnection, replacing
+    it when the connection details were edited since it was created.
+    """
+    params = {
+        "dbname": db_conn.database_name,
+        "user": db_conn.username,
+        "password": db_conn.password,
+        "host": db_conn.host,
+        "port": db_conn.port,
+    }
+    with _pools_lock:
+        pool = _pools.get(db_conn.id)
+        if pool is not None and pool.params != params:
+            pool.close()
+            pool = None
+        if pool is None:
+            pool = SourceConnectionPool(db_conn.id, params)
+            _pools[db_conn.id] = pool
+        _start_reaper()
+        return pool
+
+
+def invalidate_pool(connection_id):
+    with _pools_lock:
+        pool = _pools.pop(connection_id, None)
+    if pool is not None:
+        pool.close()
+
+
+def get_pool_stats(connection_id):
+    """
+    Returns the latest pool stats reported by every worker process.
+    """
+    stats = get_redis().hgetall(STATS_KEY.format(connection_id))
+    return {
+        worker.decode(): json.loads(value) for worker, value in stats.items()
+    }
+
+
+@receiver(post_save, sender=DatabaseConnection)
+@receiver(post_delete, sender=DatabaseConnection)
+def _invalidate_on_change(sender, instance, **kwargs):
+    invalidate_pool(instance.id)
+
+
+def _start_reaper():
+    """
+    Starts the thread closing idle connections of pools that are no
+    longer checked out from. Started lazily, and again after a fork,
+    as prefork workers don't inherit the parent's threads.
+    """
+    global _reaper_pid
+    if _reaper_pid == os.getpid():
+        return
+    _reaper_pid = os.getpid()
+    threading.Thread(
+        target=_reap_idle_connections, name="source-pool-reaper", daemon=True
+    ).start()
+
+
+def _reap_idle_connections():
+    while True:
+        time.sleep(settings.SOURCE_POOL_IDLE_TIMEOUT / 2)
+        with _pools_lock:
+            pools = list(_pools.values())
+        for pool in pools:
+            pool.evict_idle()
+
+
+def _worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
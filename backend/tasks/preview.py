@@ -0,0 +1,48 @@
+import time
+import uuid
+
+from django.conf import settings
+
+from .encoding import column_types, to_json_value
+from .pool import get_pool
+
+
+class PreviewTimeout(Exception):
+    pass
+
+
+def preview_query(db_conn, query, limit):
+    """
+    Runs a query in a read-only transaction and returns at most limit
+    rows of it. Checkout, connecting and the query itself share one
+    PREVIEW_TIMEOUT budget. The rows are read through a server-side
+    cursor, so the rest of the result never leaves the source database,
+    and nothing is stored.
+    """
+    deadline = time.monotonic() + settings.PREVIEW_TIMEOUT
+    source_pool = get_pool(db_conn)
+    with source_pool.connection(
+        timeout=settings.PREVIEW_TIMEOUT
+    ) as source_conn:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise PreviewTimeout("No time left to run the query")
+        with source_conn.cursor() as cursor:
+            cursor.execute(
+                "SET TRANSACTION READ ONLY; "
+                "SET LOCAL statement_timeout = %s",
+                [max(1, int(remaining * 1000))],
+            )
+        cursor_name = f"preview_{uuid.uuid4().hex}"
+        with source_conn.cursor(name=cursor_name) as source_cursor:
+            source_cursor.execute(query)
+            rows = source_cursor.fetchmany(limit + 1)
+            description = source_cursor.description
+    return {
+        "columns": [desc.name for desc in description],
+        "column_types": column_types(description),
+        "rows": [
+            [to_json_value(value) for value in row] for row in rows[:limit]
+        ],
+        "truncated": len(rows) > limit,
+    }
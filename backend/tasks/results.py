@@ -0,0 +1,645 @@
+import hashlib
+import json
+import re
+import uuid
+from datetime import date, datetime, time, timedelta
+from django.db import IntegrityError, connection, transaction
+from django.conf import settings
+from django.utils import timezone
+from .encoding import column_types, compress, decode_rows, serialize_rows
+from .metrics import timed
+from .models import ExecutionHistory, ResultBlob, ResultChunk
+from .partitions import day_start, ensure_partitions
+
+# Number of chunks read from the results table per query
+READ_BATCH_SIZE = 16
+
+
+class IncrementalReset(Exception):
+    """
+    Raised when an incremental run can't extend the stored result. The
+    task's watermark is reset, so the retry reloads the whole result.
+    """
+
+
+def store_streamed_results(
+    task, source_conn, watermark=None, guard=None, base=None
+):
+    """
+    Reads the query results with a server-side cursor in batches of
+    task.fetch_size rows and writes every batch to the result store
+    as soon as it arrives. Rows of an incremental run are appended to
+    the base result.
+    """
+    with source_conn.cursor(name=_cursor_name(task)) as source_cursor:
+        source_cursor.itersize = task.fetch_size
+        with timed("execute"):
+            source_cursor.execute(*task.get_query())
+        with timed("fetch"):
+            rows = source_cursor.fetchmany(task.fetch_size)
+        writer = ResultWriter(
+            source_cursor.description, watermark, guard, base
+        )
+        while rows and writer.write(rows):
+            with timed("fetch"):
+                rows = source_cursor.fetchmany(task.fetch_size)
+    return writer.finish()
+
+
+def store_results(
+    task, description, rows, watermark=None, guard=None, base=None
+):
+    """
+    Writes an already fetched result to the result store, appended to
+    the base result in an incremental run.
+    """
+    writer = ResultWriter(description, watermark, guard, base)
+    for start in range(0, len(rows), task.fetch_size):
+        end = start + task.fetch_size
+        if not writer.write(rows[start:end]):
+            break
+    return writer.finish()
+
+
+def store_shard_results(task, source_conn, shard_index, guard=None):
+    """
+    Streams one shard of a sharded task into a blob of its own.
+    Returns the blob and the hash of its content.
+    """
+    with source_conn.cursor(name=_cursor_name(task)) as source_cursor:
+        source_cursor.itersize = task.fetch_size
+        with timed("execute"):
+            source_cursor.execute(*task.get_query(shard_index))
+        with timed("fetch"):
+            rows = source_cursor.fetchmany(task.fetch_size)
+        writer = ResultWriter(source_cursor.description, guard=guard)
+        while rows and writer.write(rows):
+            with timed("fetch"):
+                rows = source_cursor.fetchmany(task.fetch_size)
+    return writer.finish_shard()
+
+
+def merge_shard_results(shards):
+    """
+    Merges the blobs written by the shards of one execution, given as
+    (blob id, content hash) pairs in shard order, into a single blob
+    listing their chunks. Chunks of shards that were stored on another
+    day than the first shard are carried forward into its partition.
+    """
+    blobs = ResultBlob.objects.in_bulk([blob_id for blob_id, _ in shards])
+    first = blobs[shards[0][0]]
+    merged = ResultBlob(
+        columns=first.columns,
+        column_types=first.column_types,
+        chunk_date=first.chunk_date,
+    )
+    content_hash = hashlib.sha256(
+        json.dumps([first.columns, first.column_types]).encode("utf-8")
+    )
+    for blob_id, shard_hash in shards:
+        blob = blobs[blob_id]
+        chunk_ids = blob.chunk_ids
+        if blob.chunk_date != merged.chunk_date:
+            chunk_ids = carry_forward_chunks(
+                chunk_ids, blob.chunk_date, merged.chunk_date
+            )
+        merged.chunk_ids += chunk_ids
+        merged.row_count += blob.row_count
+        merged.size += blob.size
+        content_hash.update(shard_hash.encode("ascii"))
+    ResultBlob.objects.filter(id__in=blobs).delete()
+    return _save_blob(merged, content_hash.hexdigest())
+
+
+def store_materialized_results(
+    task, source_conn, execution_history, watermark=None, guard=None
+):
+    """
+    Loads the query results into a typed per-task table with
+    COPY FROM STDIN, streaming rows straight from a server-side cursor.
+    Returns a summary of the materialized result, naming the archived
+    table when a change of the query's columns replaced the old one.
+    Unless the run appends to the rows of an incremental task, its rows
+    replace those of earlier runs in the same transaction.
+    """
+    table_name = materialized_table_name(task)
+    with source_conn.cursor(name=_cursor_name(task)) as source_cursor:
+        source_cursor.itersize = task.fetch_size
+        with timed("execute"):
+            source_cursor.execute(*task.get_query())
+        with timed("fetch"):
+            first_rows = source_cursor.fetchmany(task.fetch_size)
+        columns = list(
+            zip(
+                [desc.name for desc in source_cursor.description],
+                column_types(source_cursor.description),
+            )
+        )
+        if watermark is not None:
+            watermark.bind([name for name, _ in columns])
+        reader = CursorCopyReader(
+            source_cursor,
+            task.fetch_size,
+            first_rows,
+            execution_history.id,
+            watermark,
+            guard,
+        )
+        column_list = ", ".join(
+            ["_execution_id"] + [_quote_ident(name) for name, _ in columns]
+        )
+        incremental = (
+            watermark is not None and task.watermark_value is not None
+        )
+        with timed("write"), transaction.atomic():
+            with connection.cursor() as cursor:
+                archived_table = _create_materialized_table(
+                    cursor, table_name, columns, incremental
+                )
+                if not incremental:
+                    _replace_materialized_rows(
+                        cursor, table_name, execution_history
+                    )
+                cursor.copy_expert(
+                    f'COPY "{table_name}" ({column_list}) FROM STDIN', reader
+                )
+    summary = {
+        "columns": [name for name, _ in columns],
+        "row_count": reader.row_count,
+        "size": reader.size,
+        "table": table_name,
+    }
+    if archived_table is not None:
+        summary["archived_table"] = archived_table
+    return summary
+
+
+def materialized_table_name(task):
+    return f"{settings.RESULT_TABLE_NAME}_task_{task.id}"
+
+
+def archived_table_names(cursor, task):
+    """
+    Returns the names of the task's materialized tables archived after
+    a change of the query's columns.
+    """
+    table_name = materialized_table_name(task)
+    cursor.execute(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' "
+        "AND starts_with(relname, %s);",
+        [f"{table_name}_archive_"],
+    )
+    pattern = re.compile(rf"^{re.escape(table_name)}_archive_\d{{14}}$")
+    return [name for (name,) in cursor.fetchall() if pattern.match(name)]
+
+
+def carry_forward_chunks(chunk_ids, from_day, to_day):
+    """
+    Copies chunks from the partition of one day into the partition of
+    another and returns their ids there, in the same order. Chunks
+    already stored on that day are reused.
+    """
+    table_name = settings.RESULT_TABLE_NAME
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO "{table_name}"
+                (execution_time, content_hash, data, rows)
+            SELECT %s, content_hash, data, rows FROM "{table_name}"
+            WHERE execution_time = %s AND id = ANY(%s)
+            ON CONFLICT (content_hash, execution_time) DO NOTHING;
+            """,
+            [to_day, from_day, chunk_ids],
+        )
+        cursor.execute(
+            f"""
+            SELECT chunk.id, copy.id
+            FROM "{table_name}" chunk
+            JOIN "{table_name}" copy ON copy.content_hash = chunk.content_hash
+                AND copy.execution_time = %s
+            WHERE chunk.execution_time = %s AND chunk.id = ANY(%s);
+            """,
+            [to_day, from_day, chunk_ids],
+        )
+        copies = dict(cursor.fetchall())
+    return [copies[chunk_id] for chunk_id in chunk_ids]
+
+
+def iter_result_rows(blob):
+    """
+    Yields the rows of a stored result chunk by chunk, decoded back
+    into typed values.
+    """
+    for start in range(0, len(blob.chunk_ids), READ_BATCH_SIZE):
+        end = start + READ_BATCH_SIZE
+        chunk_ids = blob.chunk_ids[start:end]
+        chunks = ResultChunk.objects.filter(
+            execution_time=blob.chunk_date, id__in=chunk_ids
+        ).in_bulk()
+        for chunk_id in chunk_ids:
+            yield from decode_rows(chunks[chunk_id].data, blob.column_types)
+
+
+def ensure_results_schema(cursor=None):
+    """
+    Creates the results table and the upcoming partitions. Runs at
+    launch and when a worker starts, never from the execution path, so
+    executions don't take DDL locks.
+    """
+    if cursor is None:
+        with connection.cursor() as cursor:
+            ensure_results_schema(cursor)
+        return
+    with transaction.atomic():
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(hashtext(%s));",
+            [settings.RESULT_TABLE_NAME],
+        )
+        create_result_table(cursor)
+        ensure_partitions(cursor)
+
+
+def create_result_table(cursor):
+    """
+    Creates the results table holding the chunks of stored results,
+    range-partitioned by execution_time, the start of the UTC day the
+    chunk was stored on. A pre-existing unpartitioned table is kept
+    under a _legacy name until its rows expire.
+    """
+    table_name = settings.RESULT_TABLE_NAME
+    cursor.execute(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass(%s);",
+        [f'"{table_name}"'],
+    )
+    row = cursor.fetchone()
+    if row is not None and row[0] == "r":
+        cursor.execute(
+            f"""
+            ALTER TABLE "{table_name}" RENAME TO "{table_name}_legacy";
+            ALTER SEQUENCE IF EXISTS "{table_name}_id_seq"
+                RENAME TO "{table_name}_legacy_id_seq";
+            """
+        )
+    create_table_query = f"""
+        CREATE TABLE IF NOT EXISTS "{table_name}" (
+            id BIGSERIAL,
+            execution_time TIMESTAMP WITH TIME ZONE NOT NULL,
+            content_hash CHAR(64) NOT NULL,
+            data BYTEA NOT NULL,
+            PRIMARY KEY (id, execution_time),
+            UNIQUE (content_hash, execution_time)
+        ) PARTITION BY RANGE (execution_time);
+    """
+    cursor.execute(create_table_query)
+
+
+class ResultWriter:
+    """
+    Writes one result to the content-addressed store chunk by chunk.
+    Every chunk is hashed before it is compressed; when today's
+    partition of the results table already holds a chunk with the same
+    content it is reused, so an unchanged result is neither compressed
+    nor sent to the database again. The blob listing the chunks is only
+    saved by finish(), which returns an identical result stored the same
+    day instead when there is one. Given the base result of an
+    incremental run, the written rows are appended to its chunks.
+    """
+
+    def __init__(self, description, watermark=None, guard=None, base=None):
+        self.columns = [desc[0] for desc in description]
+        self.types = column_types(description)
+        self.watermark = watermark
+        self.guard = guard
+        if watermark is not None:
+            watermark.bind(self.columns)
+        self.chunk_date = day_start()
+        self.chunk_ids = []
+        self.row_count = 0
+        self.size = 0
+        header = json.dumps([self.columns, self.types]).encode("utf-8")
+        self._hash = hashlib.sha256(header)
+        self._chunk_hash = hashlib.sha256(header)
+        self.base = base
+        if base is not None:
+            if [base.columns, base.column_types] != [self.columns, self.types]:
+                raise IncrementalReset(
+                    "The query result columns changed since the previous "
+                    "run, reloading the whole result."
+                )
+            self._hash.update(base.content_hash.encode("ascii"))
+
+    def write(self, rows):
+        """
+        Writes a batch of rows. Returns False once the guard's limits
+        are reached and no further batches should be fetched.
+        """
+        if self.guard is not None:
+            rows = self.guard.admit_rows(rows)
+            if not rows:
+                return False
+        with timed("encode"):
+            payload = serialize_rows(rows, self.types)
+        if self.guard is not None and not self.guard.admit_bytes(len(payload)):
+            return False
+        if self.watermark is not None:
+            self.watermark.update(rows)
+        with timed("encode"):
+            chunk_hash = self._chunk_hash.copy()
+            chunk_hash.update(payload)
+            chunk_hash = chunk_hash.hexdigest()
+        with timed("write"):
+            chunk = _find_chunk(self.chunk_date, chunk_hash)
+        if chunk is None:
+            with timed("encode"):
+                data = compress(payload)
+            with timed("write"):
+                chunk_id = _store_chunk(self.chunk_date, chunk_hash, data)
+            chunk = (chunk_id, len(data))
+        self.chunk_ids.append(chunk[0])
+        self._hash.update(chunk_hash.encode("ascii"))
+        self.row_count += len(rows)
+        self.size += chunk[1]
+        return self.guard is None or not self.guard.truncated
+
+    def finish(self):
+        with timed("write"):
+            blob = self._new_blob()
+            if self.base is not None:
+                self._append_to_base(blob)
+            return _save_blob(blob, self._hash.hexdigest())
+
+    def finish_shard(self):
+        """
+        Saves the blob without a content hash, to be merged with the
+        other shards of the execution. Returns the blob and the hash of
+        its content.
+        """
+        with timed("write"):
+            blob = self._new_blob()
+            blob.save()
+        return blob, self._hash.hexdigest()
+
+    def _append_to_base(self, blob):
+        """
+        Puts the base result's chunks, carried forward to today's
+        partition when needed, ahead of the written ones.
+        """
+        chunk_ids = self.base.chunk_ids
+        if self.base.chunk_date != self.chunk_date:
+            chunk_ids = carry_forward_chunks(
+                chunk_ids, self.base.chunk_date, self.chunk_date
+            )
+        blob.chunk_ids = chunk_ids + blob.chunk_ids
+        blob.row_count += self.base.row_count
+        blob.size += self.base.size
+
+    def _new_blob(self):
+        return ResultBlob(
+            columns=self.columns,
+            column_types=self.types,
+            row_count=self.row_count,
+            size=self.size,
+            chunk_date=self.chunk_date,
+            chunk_ids=self.chunk_ids,
+        )
+
+
+def _find_chunk(chunk_date, content_hash):
+    """
+    Returns the id and the stored size of the chunk with the given
+    content in the partition of chunk_date, or None.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT id, octet_length(data) FROM "{settings.RESULT_TABLE_NAME}"
+            WHERE execution_time = %s AND content_hash = %s;
+            """,
+            [chunk_date, content_hash],
+        )
+        return cursor.fetchone()
+
+
+def _store_chunk(chunk_date, content_hash, data):
+    """
+    Stores a chunk in the partition of chunk_date unless a concurrent
+    execution stored the same content first. Returns the id of the
+    chunk.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO "{settings.RESULT_TABLE_NAME}"
+                (execution_time, content_hash, data)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (content_hash, execution_time) DO NOTHING
+            RETURNING id;
+            """,
+            [chunk_date, content_hash, data],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        row = _find_chunk(chunk_date, content_hash)
+    return row[0]
+
+
+def _save_blob(blob, content_hash):
+    """
+    Saves the blob under its content hash or, when an identical result
+    was already stored the same day, returns the existing one instead.
+    """
+    lookup = {"content_hash": content_hash, "chunk_date": blob.chunk_date}
+    existing = ResultBlob.objects.filter(**lookup).first()
+    if existing is not None:
+        return existing
+    blob.content_hash = content_hash
+    try:
+        with transaction.atomic():
+            blob.save()
+        return blob
+    except IntegrityError:
+        return ResultBlob.objects.get(**lookup)
+
+
+def _create_materialized_table(cursor, table_name, columns, incremental):
+    """
+    Creates the per-task table. When the query's column names or types
+    no longer match the existing table, the table is kept under an
+    archive name with the current time and a new one is created.
+    Returns the archive name, or None. An incremental run would only
+    load the rows past the watermark into a new table, so it raises
+    IncrementalReset instead.
+    """
+    expected = [("_execution_id", "bigint")] + list(columns)
+    cursor.execute(
+        """
+        SELECT attname, format_type(atttypid, atttypmod)
+        FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum;
+        """,
+        [f'"{table_name}"'],
+    )
+    existing = [tuple(row) for row in cursor.fetchall()]
+    if existing == expected:
+        return None
+    if incremental:
+        raise IncrementalReset(
+            f'Table "{table_name}" is missing or has different columns, '
+            "reloading the whole result."
+        )
+    archived_table = None
+    if existing:
+        archived_table = f"{table_name}_archive_{timezone.now():%Y%m%d%H%M%S}"
+        cursor.execute(
+            f'ALTER TABLE "{table_name}" RENAME TO "{archived_table}";'
+        )
+    column_defs = ", ".join(
+        f"{_quote_ident(name)} {type_name}" for name, type_name in expected
+    )
+    cursor.execute(f'CREATE TABLE "{table_name}" ({column_defs});')
+    cursor.execute(f'CREATE INDEX ON "{table_name}" (_execution_id);')
+    return archived_table
+
+
+def _replace_materialized_rows(cursor, table_name, execution_history):
+    """
+    Deletes the rows earlier runs loaded into the per-task table and
+    clears their summaries, so they no longer claim a stored result.
+    DELETE rather than TRUNCATE keeps the table readable by exports
+    while the new rows load.
+    """
+    cursor.execute(
+        f'DELETE FROM "{table_name}" WHERE _execution_id <> %s;',
+        [execution_history.id],
+    )
+    ExecutionHistory.objects.filter(
+        task_id=execution_history.task_id, result_data__isnull=False
+    ).exclude(id=execution_history.id).update(result_data=None)
+
+
+class WatermarkTracker:
+    """
+    Tracks the highest value of the watermark column in fetched rows.
+    """
+
+    def __init__(self, column):
+        self.column = column
+        self.value = None
+        self._index = None
+
+    def bind(self, columns):
+        if self.column not in columns:
+            raise ValueError(
+                f'Watermark column "{self.column}" is not in the query result.'
+            )
+        self._index = columns.index(self.column)
+
+    def update(self, rows):
+        for row in rows:
+            value = row[self._index]
+            if value is None:
+                continue
+            if self.value is None or value > self.value:
+                self.value = value
+
+    def serialize(self):
+        if self.value is None:
+            return None
+        if isinstance(self.value, (datetime, date, time)):
+            return self.value.isoformat()
+        return str(self.value)
+
+
+class CursorCopyReader:
+    """
+    File-like object for COPY FROM STDIN that encodes rows in the
+    text format, fetching them from the source cursor batch by batch.
+    """
+
+    def __init__(
+        self,
+        source_cursor,
+        fetch_size,
+        first_rows,
+        execution_id,
+        watermark,
+        guard,
+    ):
+        self.source_cursor = source_cursor
+        self.watermark = watermark
+        self.guard = guard
+        self.fetch_size = fetch_size
+        self.prefix = f"{execution_id}\t"
+        self.row_count = 0
+        self.size = 0
+        self._pending_rows = first_rows
+        self._buffer = bytearray()
+        self._exhausted = False
+
+    def read(self, size=-1):
+        while not self._exhausted and (size < 0 or len(self._buffer) < size):
+            self._fill()
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def _fill(self):
+        rows = self._pending_rows
+        self._pending_rows = None
+        if rows is None:
+            with timed("fetch"):
+                rows = self.source_cursor.fetchmany(self.fetch_size)
+        if self.guard is not None and rows:
+            rows = self.guard.admit_rows(rows)
+        if not rows:
+            self._exhausted = True
+            return
+        with timed("encode"):
+            data = "".join(
+                self.prefix + "\t".join(_copy_value(v) for v in row) + "\n"
+                for row in rows
+            ).encode("utf-8")
+        if self.guard is not None and not self.guard.admit_bytes(len(data)):
+            self._exhausted = True
+            return
+        if self.watermark is not None:
+            self.watermark.update(rows)
+        self._buffer += data
+        self.row_count += len(rows)
+        self.size += len(data)
+        if self.guard is not None and self.guard.truncated:
+            self._exhausted = True
+
+
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "\\\\x" + bytes(value).hex()
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    elif isinstance(value, (datetime, date, time)):
+        value = value.isoformat()
+    elif isinstance(value, timedelta):
+        value = f"{value.total_seconds()} seconds"
+    else:
+        value = str(value)
+    return (
+        value.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _quote_ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _cursor_name(task):
+    return f"task_{task.id}_{uuid.uuid4().hex}"
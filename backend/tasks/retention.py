@@ -0,0 +1,130 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import ProtectedError, Q
+from django.utils import timezone
+
+from .models import ExecutionHistory, ResultBlob, Task
+from .results import archived_table_names, materialized_table_name
+
+# Executions that may still be written to by a worker
+ACTIVE_STATUSES = ("PENDING", "RETRY")
+
+
+def prune_task_history(task, batch_size=None):
+    """
+    Deletes the executions of a task that fall outside its retention
+    policy, batch_size rows per transaction. Returns how many were
+    deleted.
+    """
+    batch_size = batch_size or settings.HISTORY_PRUNE_BATCH_SIZE
+    histories = task.executions.exclude(status__in=ACTIVE_STATUSES)
+    expired = ExecutionHistory.objects.none()
+    if task.retention_days:
+        cutoff = timezone.now() - timedelta(days=task.retention_days)
+        expired = histories.filter(execution_time__lt=cutoff)
+    deleted = _delete_in_batches(task, expired, batch_size)
+    if task.retention_runs:
+        start = task.retention_runs
+        while True:
+            ids = list(
+                histories.order_by("-execution_time", "-id").values_list(
+                    "id", flat=True
+                )[start:start + batch_size]
+            )
+            if not ids:
+                break
+            deleted += _delete_batch(task, ids)
+    return deleted
+
+
+def delete_task_history(task, batch_size=None):
+    """
+    Deletes everything stored for a task in small batches, so deleting
+    the task itself doesn't cascade over its whole history at once.
+    """
+    batch_size = batch_size or settings.HISTORY_PRUNE_BATCH_SIZE
+    _delete_in_batches(task, task.executions.all(), batch_size)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DROP TABLE IF EXISTS "{materialized_table_name(task)}";'
+        )
+        for table_name in archived_table_names(cursor, task):
+            cursor.execute(f'DROP TABLE "{table_name}";')
+
+
+def collect_unreferenced_blobs(batch_size=None):
+    """
+    Deletes stored results that no execution points to any more. Blobs
+    younger than RESULT_BLOB_GC_GRACE seconds are kept, as they may
+    belong to shards awaiting their merge. Their chunks stay in the
+    results table, possibly shared with other results, until their
+    partition is dropped. Returns how many were deleted.
+    """
+    batch_size = batch_size or settings.HISTORY_PRUNE_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(seconds=settings.RESULT_BLOB_GC_GRACE)
+    select_query = f"""
+        SELECT blob.id FROM "{ResultBlob._meta.db_table}" blob
+        WHERE blob.created_at < %s
+            AND NOT EXISTS (
+                SELECT 1 FROM "{ExecutionHistory._meta.db_table}" history
+                WHERE history.result_id = blob.id
+            )
+        LIMIT %s;
+    """
+    deleted = 0
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(select_query, [cutoff, batch_size])
+            ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return deleted
+        try:
+            with transaction.atomic():
+                _, counts = ResultBlob.objects.filter(id__in=ids).delete()
+        except (IntegrityError, ProtectedError):
+            # A new execution picked one of the blobs up meanwhile.
+            return deleted
+        deleted += counts.get("tasks.ResultBlob", 0)
+
+
+def prune_all():
+    """
+    Applies every task's retention policy, then removes the results
+    nothing refers to any more.
+    """
+    tasks = Task.objects.filter(
+        Q(retention_runs__gt=0) | Q(retention_days__gt=0)
+    )
+    pruned = sum(prune_task_history(task) for task in tasks.iterator())
+    return {"executions": pruned, "results": collect_unreferenced_blobs()}
+
+
+def _delete_in_batches(task, histories, batch_size):
+    deleted = 0
+    while True:
+        ids = list(histories.values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += _delete_batch(task, ids)
+
+
+def _delete_batch(task, ids):
+    with transaction.atomic():
+        if task.materialize_results:
+            _delete_materialized_rows(task, ids)
+        _, counts = ExecutionHistory.objects.filter(id__in=ids).delete()
+    return counts.get("tasks.ExecutionHistory", 0)
+
+
+def _delete_materialized_rows(task, ids):
+    table_name = materialized_table_name(task)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s);", [f'"{table_name}"'])
+        if cursor.fetchone()[0] is None:
+            return
+        cursor.execute(
+            f'DELETE FROM "{table_name}" WHERE _execution_id = ANY(%s);',
+            [ids],
+        )
@@ -0,0 +1,27 @@
+from django.conf import settings
+
+from .models import DatabaseConnection
+
+ROUTED_TASKS = ("tasks.tasks.execute_task", "tasks.tasks.execute_shard")
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """
+    Celery router sending execute_task and its shards to the queue
+    configured on the task's DatabaseConnection, if any. Interactive
+    runs go to the INTERACTIVE_QUEUE lane of that queue instead.
+    """
+    if name not in ROUTED_TASKS or not args:
+        return None
+    queue = (
+        DatabaseConnection.objects.filter(tasks__id=args[0])
+        .values_list("queue", flat=True)
+        .first()
+    )
+    if kwargs.get("lane") == "interactive":
+        if queue:
+            return {"queue": f"{queue}.{settings.INTERACTIVE_QUEUE}"}
+        return {"queue": settings.INTERACTIVE_QUEUE}
+    if queue:
+        return {"queue": queue}
+    return None
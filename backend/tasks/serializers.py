@@ -1,11 +1,14 @@
 from rest_framework import serializers
 from .models import DatabaseConnection, Task, ExecutionHistory
+from .encoding import to_json_value
+from .results import iter_result_rows
 
 
 class DatabaseConnectionSerializer(serializers.ModelSerializer):
     class Meta:
         model = DatabaseConnection
         fields = "__all__"
+        read_only_fields = ["consecutive_failures"]
 
 
 class TaskSerializer(serializers.ModelSerializer):
@@ -22,7 +25,13 @@ class TaskSerializer(serializers.ModelSerializer):
     class Meta:
         model = Task
         fields = "__all__"
-        read_only_fields = ["id", "last_run", "periodic_task"]
+        read_only_fields = [
+            "id",
+            "last_run",
+            "periodic_task",
+            "watermark_value",
+            "consecutive_failures",
+        ]
 
     def validate(self, data):
         if not self.instance:
@@ -77,6 +86,11 @@ class TaskSerializer(serializers.ModelSerializer):
         elif database_connection:
             instance.database_connection = database_connection
 
+        if validated_data.get(
+            "watermark_column", instance.watermark_column
+        ) != instance.watermark_column:
+            instance.watermark_value = None
+
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
@@ -85,7 +99,34 @@ class TaskSerializer(serializers.ModelSerializer):
 
 class ExecutionHistorySerializer(serializers.ModelSerializer):
     task = TaskSerializer()
+    result_data = serializers.SerializerMethodField()
 
     class Meta:
         model = ExecutionHistory
         fields = "__all__"
+
+    def get_result_data(self, obj):
+        if obj.result is None:
+            return obj.result_data
+        return {
+            "columns": obj.result.columns,
+            "column_types": obj.result.column_types,
+            "rows": [
+                [to_json_value(value) for value in row]
+                for row in iter_result_rows(obj.result)
+            ],
+        }
+
+
+class TaskSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Task
+        fields = ["id", "name"]
+
+
+class ExecutionHistoryListSerializer(serializers.ModelSerializer):
+    task = TaskSummarySerializer()
+
+    class Meta:
+        model = ExecutionHistory
+        exclude = ["result_data"]
@@ -0,0 +1,229 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import F
+
+from .metrics import DURATION_BUCKETS
+from .models import DatabaseConnection, ExecutionStats, Task
+
+GRAINS = {
+    "hour": {"minute": 0, "second": 0, "microsecond": 0},
+    "day": {"hour": 0, "minute": 0, "second": 0, "microsecond": 0},
+}
+DEFAULT_RANGES = {
+    "hour": timedelta(hours=48),
+    "day": timedelta(days=30),
+}
+SUCCESS_STATUSES = ("SUCCESS", "PARTIAL")
+FAILURE_STATUSES = ("FAILURE", "TIMEOUT")
+FINAL_STATUSES = SUCCESS_STATUSES + FAILURE_STATUSES + (
+    "CANCELLED",
+    "SKIPPED",
+    "COALESCED",
+)
+COUNTERS = (
+    "executions",
+    "successes",
+    "failures",
+    "cancellations",
+    "skips",
+    "duration_sum",
+    "row_count",
+    "byte_count",
+)
+
+
+def record_execution_stats(execution_history, task):
+    """
+    Adds a finished execution to the hourly and daily rollups of its
+    task and connection, and updates their failure streaks.
+    """
+    status = execution_history.status
+    if status not in FINAL_STATUSES:
+        return
+    task_streak, connection_streak = _update_failure_streaks(task, status)
+
+    duration = None
+    if status not in ("SKIPPED", "COALESCED") and execution_history.timings:
+        duration = execution_history.timings.get("total")
+    values = {
+        "executions": 1,
+        "successes": int(status in SUCCESS_STATUSES),
+        "failures": int(status in FAILURE_STATUSES),
+        "cancellations": int(status == "CANCELLED"),
+        "skips": int(status in ("SKIPPED", "COALESCED")),
+        "duration_sum": duration or 0,
+        "duration_max": duration or 0,
+        "duration_buckets": _bucket_counts(duration),
+        "row_count": execution_history.row_count or 0,
+        "byte_count": execution_history.byte_count or 0,
+    }
+    for grain, truncate in GRAINS.items():
+        period_start = execution_history.execution_time.replace(**truncate)
+        _upsert(
+            grain,
+            period_start,
+            task.database_connection_id,
+            task.id,
+            task_streak,
+            values,
+        )
+        _upsert(
+            grain,
+            period_start,
+            task.database_connection_id,
+            None,
+            connection_streak,
+            values,
+        )
+
+
+def summarize(rows):
+    """
+    Combines rollup rows into totals with the success rate and
+    duration percentiles estimated from the bucket counts.
+    """
+    totals = {field: 0 for field in COUNTERS}
+    totals["duration_max"] = 0
+    totals["max_failure_streak"] = 0
+    buckets = [0] * (len(DURATION_BUCKETS) + 1)
+    for row in rows:
+        for field in COUNTERS:
+            totals[field] += getattr(row, field)
+        totals["duration_max"] = max(totals["duration_max"], row.duration_max)
+        totals["max_failure_streak"] = max(
+            totals["max_failure_streak"], row.max_failure_streak
+        )
+        for index, count in enumerate(row.duration_buckets):
+            buckets[index] += count
+    completed = totals["successes"] + totals["failures"]
+    timed_runs = sum(buckets)
+    totals["success_rate"] = (
+        round(totals["successes"] / completed, 4) if completed else None
+    )
+    totals["duration_avg"] = (
+        totals["duration_sum"] / timed_runs if timed_runs else None
+    )
+    for percent in (50, 95, 99):
+        totals[f"duration_p{percent}"] = _bucket_percentile(
+            buckets, percent, totals["duration_max"]
+        )
+    return totals
+
+
+def stats_queryset(task=None, database_connection=None):
+    rows = ExecutionStats.objects.all()
+    if task is not None:
+        return rows.filter(task=task)
+    return rows.filter(database_connection=database_connection, task=None)
+
+
+def _update_failure_streaks(task, status):
+    if status in FAILURE_STATUSES:
+        change = F("consecutive_failures") + 1
+    elif status in SUCCESS_STATUSES:
+        change = 0
+    else:
+        change = F("consecutive_failures")
+    Task.objects.filter(id=task.id).update(consecutive_failures=change)
+    DatabaseConnection.objects.filter(id=task.database_connection_id).update(
+        consecutive_failures=change
+    )
+    task_streak = (
+        Task.objects.filter(id=task.id)
+        .values_list("consecutive_failures", flat=True)
+        .first()
+    )
+    connection_streak = (
+        DatabaseConnection.objects.filter(id=task.database_connection_id)
+        .values_list("consecutive_failures", flat=True)
+        .first()
+    )
+    return task_streak or 0, connection_streak or 0
+
+
+def _upsert(grain, period_start, connection_id, task_id, streak, values):
+    """
+    Increments one rollup row, creating it if needed, in a single
+    statement so concurrent workers don't lose updates.
+    """
+    if task_id is not None:
+        conflict = "(grain, period_start, task_id) WHERE task_id IS NOT NULL"
+    else:
+        conflict = (
+            "(grain, period_start, database_connection_id) "
+            "WHERE task_id IS NULL"
+        )
+    table_name = ExecutionStats._meta.db_table
+    increments = ", ".join(
+        f"{field} = s.{field} + EXCLUDED.{field}" for field in COUNTERS
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO "{table_name}" AS s (
+                grain, period_start, database_connection_id, task_id,
+                {", ".join(COUNTERS)},
+                duration_max, duration_buckets, max_failure_streak
+            )
+            VALUES (
+                %s, %s, %s, %s, {", ".join(["%s"] * len(COUNTERS))},
+                %s, %s, %s
+            )
+            ON CONFLICT {conflict} DO UPDATE SET
+                {increments},
+                duration_max = GREATEST(s.duration_max, EXCLUDED.duration_max),
+                duration_buckets = ARRAY(
+                    SELECT coalesce(a, 0) + coalesce(b, 0)
+                    FROM unnest(s.duration_buckets, EXCLUDED.duration_buckets)
+                        WITH ORDINALITY AS buckets (a, b, i)
+                    ORDER BY i
+                ),
+                max_failure_streak = GREATEST(
+                    s.max_failure_streak, EXCLUDED.max_failure_streak
+                );
+            """,
+            [
+                grain,
+                period_start,
+                connection_id,
+                task_id,
+                *[values[field] for field in COUNTERS],
+                values["duration_max"],
+                values["duration_buckets"],
+                streak,
+            ],
+        )
+
+
+def _bucket_counts(duration):
+    counts = [0] * (len(DURATION_BUCKETS) + 1)
+    if duration is None:
+        return counts
+    for index, bucket in enumerate(DURATION_BUCKETS):
+        if duration <= bucket:
+            counts[index] = 1
+            return counts
+    counts[-1] = 1
+    return counts
+
+
+def _bucket_percentile(buckets, percent, duration_max):
+    """
+    Estimates a percentile by interpolating within the bucket that
+    contains it. Values in the +Inf bucket are capped at the maximum.
+    """
+    total = sum(buckets)
+    if not total:
+        return None
+    rank = percent / 100 * total
+    seen = 0
+    lower = 0.0
+    bounds = list(DURATION_BUCKETS) + [max(duration_max, DURATION_BUCKETS[-1])]
+    for count, upper in zip(buckets, bounds):
+        if count and seen + count >= rank:
+            estimate = lower + (upper - lower) * (rank - seen) / count
+            return round(min(estimate, duration_max), 6)
+        seen += count
+        lower = upper
+    return round(duration_max, 6)
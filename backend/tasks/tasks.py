@@ -1,16 +1,54 @@
-import psycopg2
-import json
-from celery import shared_task
-from django.db import connection
+import random
+import time
+from collections import defaultdict
+from datetime import datetime
+from celery import chord, shared_task
 from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
 from .models import Task, ExecutionHistory
-from celery.exceptions import MaxRetriesExceededError
+from .breaker import CircuitOpen
+from .cache import cache_result, get_cached_result
+from .events import publish_execution_event
+from .guards import ExecutionAborted, ExecutionGuard, is_cancelled
+from .locks import ConnectionSemaphore, TaskLock
+from .metrics import record_execution, timed, track_phases
+from .partitions import drop_expired_partitions
+from .pool import get_pool
+from .retention import prune_all
+from .results import (
+    ensure_results_schema,
+    merge_shard_results,
+    store_materialized_results,
+    store_results,
+    store_shard_results,
+    store_streamed_results,
+    IncrementalReset,
+    WatermarkTracker,
+)
+from .stats import record_execution_stats
+from celery.exceptions import Ignore, MaxRetriesExceededError
+from celery.signals import before_task_publish, worker_ready
+from psycopg2.errors import QueryCanceled
 
 
 @shared_task(bind=True)
-def execute_task(self, task_id):
-    source_conn = None
-    source_cursor = None
+def execute_task(self, task_id, lane="scheduled"):
+    """
+    Runs a task's query. Interactive runs use lane="interactive", which
+    route_task sends to a queue of its own so they don't wait behind
+    scheduled ones.
+    """
+    with track_phases() as timer:
+        _execute_task(self, task_id, lane, timer)
+
+
+def _execute_task(self, task_id, lane, timer):
+    semaphore = None
+    task_lock = None
+    guard = None
+    execution_history = None
+    deferred = False
     try:
         task = Task.objects.select_related("database_connection").get(
             id=task_id
@@ -23,11 +61,14 @@ def execute_task(self, task_id):
                 "status": "PENDING",
                 "retry_count": 0,
                 "celery_task_id": self.request.id,
+                "lane": lane,
             },
         )
+        if created:
+            publish_execution_event(execution_history)
 
-        if not created:
-            execution_history.retry_count += 1
+        execution_history.retry_count = self.request.retries
+        execution_history.queue_wait = _queue_wait(self.request)
 
         if execution_history.retry_count > task.max_retries:
             execution_history.status = "FAILURE"
@@ -35,56 +76,89 @@ def execute_task(self, task_id):
             execution_history.save()
             raise MaxRetriesExceededError("Max retries exceeded")
 
-        db_conn = task.database_connection
-        source_conn = psycopg2.connect(
-            dbname=db_conn.database_name,
-            user=db_conn.username,
-            password=db_conn.password,
-            host=db_conn.host,
-            port=db_conn.port,
+        if task.overlap_policy != "allow":
+            task_lock = TaskLock(task.id, self.request.id)
+            if not task_lock.acquire():
+                task_lock = None
+                _handle_overlap(self, task, execution_history)
+                return
+            if task.overlap_policy == "queue":
+                task_lock.release_follow_up()
+
+        if task.is_sharded:
+            _dispatch_shards(task, execution_history, lane)
+            # The merge, or its error handler, finishes the execution
+            # and releases the task lock.
+            task_lock = None
+            deferred = True
+            return
+
+        if task.database_connection.max_concurrency:
+            semaphore = ConnectionSemaphore(
+                task.database_connection.id,
+                task.database_connection.max_concurrency,
+                self.request.id,
+            )
+            if not semaphore.acquire():
+                semaphore = None
+                self.signature_from_request().apply_async(
+                    countdown=random.uniform(
+                        1, settings.CONNECTION_THROTTLE_DELAY
+                    )
+                )
+                raise Ignore()
+
+        guard = ExecutionGuard(task, self.request.id)
+        with transaction.atomic():
+            _run_and_store(task, execution_history, guard)
+
+    except Ignore:
+        deferred = True
+        raise
+
+    except (ExecutionAborted, QueryCanceled) as e:
+        execution_history.refresh_from_db(
+            fields=[
+                "result",
+                "result_data",
+                "from_cache",
+                "row_count",
+                "byte_count",
+            ]
         )
-        source_cursor = source_conn.cursor()
-        source_cursor.execute(task.query)
-        results = source_cursor.fetchall()
-        columns = [desc[0] for desc in source_cursor.description]
-
-        result_data = {"columns": columns, "rows": results}
-
-        table_name = settings.RESULT_TABLE_NAME
-
-        with connection.cursor() as cursor:
-            create_table_query = f"""
-                CREATE TABLE IF NOT EXISTS "{table_name}" (
-                    id SERIAL PRIMARY KEY,
-                    task_id INTEGER REFERENCES tasks_task(id),
-                    execution_time TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                    result_data JSONB
-                );
-            """
-            cursor.execute(create_table_query)
-
-            insert_query = f"""
-                INSERT INTO "{table_name}" (task_id, result_data)
-                VALUES (%s, %s);
-            """
-            cursor.execute(insert_query, [task.id, json.dumps(result_data)])
-
-        execution_history.status = "SUCCESS"
-        execution_history.result_data = result_data
+        if isinstance(e, ExecutionAborted):
+            execution_history.status = e.status
+        elif guard.is_cancelled():
+            execution_history.status = "CANCELLED"
+        else:
+            execution_history.status = "TIMEOUT"
+        execution_history.error_message = str(e)
         execution_history.save()
 
     except Exception as e:
+        execution_history.refresh_from_db(
+            fields=[
+                "result",
+                "result_data",
+                "from_cache",
+                "row_count",
+                "byte_count",
+            ]
+        )
         execution_history.status = "RETRY"
         execution_history.error_message = str(e)
         execution_history.save()
+        if isinstance(e, IncrementalReset):
+            Task.objects.filter(id=task.id).update(watermark_value=None)
 
         try:
             remaining_retries = task.max_retries - self.request.retries
 
             if remaining_retries > 0:
+                publish_execution_event(execution_history)
                 raise self.retry(
                     exc=e,
-                    countdown=task.retry_delay,
+                    countdown=_retry_countdown(task, self.request.retries, e),
                     max_retries=task.max_retries,
                 )
             else:
@@ -99,7 +173,380 @@ def execute_task(self, task_id):
             raise
 
     finally:
-        if source_cursor is not None:
-            source_cursor.close()
-        if source_conn is not None:
-            source_conn.close()
+        # A retried execution was published before the retry was
+        # scheduled, and is recorded once its last attempt finishes.
+        finished = (
+            execution_history is not None
+            and not deferred
+            and execution_history.status != "RETRY"
+        )
+        if semaphore is not None:
+            semaphore.release()
+        if task_lock is not None:
+            task_lock.release()
+            if finished:
+                _resolve_coalesced(execution_history)
+        if finished:
+            _record_metrics(task, execution_history, timer.as_dict())
+
+
+@shared_task(bind=True)
+def execute_shard(self, task_id, parent_id, shard_index, lane="scheduled"):
+    """
+    Extracts one slice of a sharded task into a blob of its own. The
+    blobs are merged by merge_shards once every shard has finished.
+    """
+    with track_phases() as timer:
+        task = Task.objects.select_related("database_connection").get(
+            id=task_id
+        )
+        semaphore = None
+        if task.database_connection.max_concurrency:
+            semaphore = ConnectionSemaphore(
+                task.database_connection.id,
+                task.database_connection.max_concurrency,
+                self.request.id,
+            )
+            if not semaphore.acquire():
+                self.signature_from_request().apply_async(
+                    countdown=random.uniform(
+                        1, settings.CONNECTION_THROTTLE_DELAY
+                    )
+                )
+                raise Ignore()
+
+        guard = ExecutionGuard(task, parent_id, slot=f"shard_{shard_index}")
+        try:
+            source_pool = get_pool(task.database_connection)
+            with transaction.atomic(), source_pool.connection() as source_conn:
+                guard.start(source_conn, task.database_connection.id)
+                try:
+                    blob, content_hash = store_shard_results(
+                        task, source_conn, shard_index, guard
+                    )
+                finally:
+                    guard.finish()
+        except (ExecutionAborted, QueryCanceled) as e:
+            if isinstance(e, ExecutionAborted):
+                status = e.status
+            elif guard.is_cancelled():
+                status = "CANCELLED"
+            else:
+                status = "TIMEOUT"
+            ExecutionHistory.objects.filter(
+                celery_task_id=parent_id, status__in=("PENDING", "RETRY")
+            ).update(status=status, error_message=str(e))
+            raise
+        except Exception as e:
+            raise self.retry(
+                exc=e,
+                countdown=_retry_countdown(task, self.request.retries, e),
+                max_retries=task.max_retries,
+            )
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+        return {
+            "blob": blob.id,
+            "hash": content_hash,
+            "truncated": guard.truncated,
+            "timings": timer.as_dict(),
+        }
+
+
+@shared_task
+def merge_shards(shard_results, task_id, execution_id, started_at):
+    """
+    Merges the shards' blobs into the result of the sharded execution.
+    Phase timings are summed over the shards, while the total is the
+    wall-clock time since the shards were dispatched.
+    """
+    task = Task.objects.select_related("database_connection").get(id=task_id)
+    execution_history = ExecutionHistory.objects.get(id=execution_id)
+    timings = defaultdict(float)
+    for shard in shard_results:
+        for phase, value in shard["timings"].items():
+            if phase != "total":
+                timings[phase] += value
+    try:
+        with track_phases() as timer, timer.phase("merge"):
+            with transaction.atomic():
+                result = merge_shard_results(
+                    [(shard["blob"], shard["hash"]) for shard in shard_results]
+                )
+                execution_history.result = result
+                execution_history.row_count = result.row_count
+                execution_history.byte_count = result.size
+                truncated = any(shard["truncated"] for shard in shard_results)
+                execution_history.status = (
+                    "PARTIAL" if truncated else "SUCCESS"
+                )
+                execution_history.save()
+                Task.objects.filter(id=task.id).update(last_run=timezone.now())
+        timings["merge"] = timer.phases["merge"]
+    except Exception as e:
+        execution_history.refresh_from_db(
+            fields=["result", "row_count", "byte_count"]
+        )
+        execution_history.status = "FAILURE"
+        execution_history.error_message = str(e)
+        execution_history.save()
+        raise
+    finally:
+        timings["total"] = round(time.time() - started_at, 6)
+        _finish_sharded(task, execution_history, dict(timings))
+
+
+@shared_task
+def fail_sharded_execution(request, exc, traceback, execution_id):
+    """
+    Error handler of the shards' chord: marks the execution failed,
+    unless a shard already recorded a more specific outcome.
+    """
+    execution_history = ExecutionHistory.objects.select_related(
+        "task", "task__database_connection"
+    ).get(id=execution_id)
+    if execution_history.status in ("PENDING", "RETRY"):
+        execution_history.status = (
+            "CANCELLED"
+            if is_cancelled(execution_history.celery_task_id)
+            else "FAILURE"
+        )
+        execution_history.error_message = str(exc)
+        execution_history.save()
+    _finish_sharded(execution_history.task, execution_history, {})
+
+
+def _handle_overlap(self, task, execution_history):
+    """
+    Applies the task's overlap policy to a trigger that found another
+    execution of the task running.
+    """
+    task_lock = TaskLock(task.id, self.request.id)
+    holder = ExecutionHistory.objects.filter(
+        celery_task_id=task_lock.holder()
+    ).first()
+    if task.overlap_policy == "queue" and task_lock.claim_follow_up():
+        self.signature_from_request().apply_async(
+            countdown=random.uniform(1, settings.TASK_FOLLOW_UP_DELAY)
+        )
+        raise Ignore()
+    if task.overlap_policy == "coalesce" and holder is not None:
+        execution_history.status = "COALESCED"
+        execution_history.coalesced_into = holder
+        execution_history.save()
+        # The holder may have finished before it could see this row.
+        holder.refresh_from_db()
+        if holder.status not in ("PENDING", "RETRY"):
+            _resolve_coalesced(holder)
+        return
+    execution_history.status = "SKIPPED"
+    execution_history.error_message = (
+        f"Execution {holder.id} of the task is still running"
+        if holder is not None
+        else "Another execution of the task is still running"
+    )
+    execution_history.save()
+
+
+def _resolve_coalesced(execution_history):
+    """
+    Hands the outcome of a finished execution to the triggers that
+    were coalesced into it.
+    """
+    coalesced = ExecutionHistory.objects.filter(
+        coalesced_into=execution_history
+    )
+    coalesced.update(
+        result=execution_history.result,
+        result_data=execution_history.result_data,
+        row_count=execution_history.row_count,
+        byte_count=execution_history.byte_count,
+        error_message=execution_history.error_message,
+    )
+    for history in coalesced.select_related("task"):
+        publish_execution_event(history)
+
+
+def _dispatch_shards(task, execution_history, lane):
+    execution_history.save(update_fields=["retry_count", "queue_wait"])
+    header = [
+        execute_shard.s(
+            task.id, execution_history.celery_task_id, index, lane=lane
+        )
+        for index in range(task.shard_count)
+    ]
+    callback = merge_shards.s(
+        task.id, execution_history.id, time.time()
+    ).on_error(fail_sharded_execution.s(execution_id=execution_history.id))
+    chord(header)(callback)
+
+
+def _finish_sharded(task, execution_history, timings):
+    if task.overlap_policy != "allow":
+        TaskLock(task.id, execution_history.celery_task_id).release()
+        _resolve_coalesced(execution_history)
+    _record_metrics(task, execution_history, timings)
+
+
+def _run_and_store(task, execution_history, guard):
+    """
+    Runs the task query, or reuses a cached result, and stores the
+    result. Called inside a single transaction by execute_task.
+    """
+    watermark = None
+    if task.watermark_column:
+        watermark = WatermarkTracker(task.watermark_column)
+
+    cached_result = None
+    if task.cache_ttl and not (task.materialize_results or watermark):
+        cached_result = get_cached_result(task)
+
+    if cached_result is not None:
+        execution_history.result = cached_result
+        execution_history.from_cache = True
+    else:
+        source_pool = get_pool(task.database_connection)
+        with source_pool.connection() as source_conn:
+            guard.start(source_conn, task.database_connection.id)
+            try:
+                _store_from_source(
+                    task, execution_history, source_conn, watermark, guard
+                )
+            finally:
+                guard.finish()
+
+    if execution_history.result is not None:
+        execution_history.row_count = execution_history.result.row_count
+        execution_history.byte_count = execution_history.result.size
+    elif execution_history.result_data is not None:
+        summary = execution_history.result_data
+        execution_history.row_count = summary["row_count"]
+        execution_history.byte_count = summary["size"]
+    execution_history.status = "PARTIAL" if guard.truncated else "SUCCESS"
+    execution_history.save()
+
+    task_updates = {"last_run": timezone.now()}
+    if watermark is not None and watermark.value is not None:
+        task_updates["watermark_value"] = watermark.serialize()
+    Task.objects.filter(id=task.id).update(**task_updates)
+
+
+def _store_from_source(task, execution_history, source_conn, watermark, guard):
+    if task.materialize_results:
+        execution_history.result_data = store_materialized_results(
+            task, source_conn, execution_history, watermark, guard
+        )
+        return
+
+    base = None
+    if watermark is not None and task.watermark_value is not None:
+        base = _previous_result(task)
+
+    if task.stream_results or guard.has_result_limits:
+        result = store_streamed_results(
+            task, source_conn, watermark, guard, base
+        )
+    else:
+        with source_conn.cursor() as source_cursor:
+            with timed("execute"):
+                source_cursor.execute(*task.get_query())
+            with timed("fetch"):
+                results = source_cursor.fetchall()
+            description = source_cursor.description
+        result = store_results(
+            task, description, results, watermark, guard, base
+        )
+
+    execution_history.result = result
+    if task.cache_ttl and watermark is None and not guard.truncated:
+        transaction.on_commit(lambda: cache_result(task, result))
+
+
+def _previous_result(task):
+    """
+    Returns the stored result an incremental run appends its rows to.
+    """
+    history = (
+        task.executions.filter(
+            status__in=["SUCCESS", "PARTIAL"], result__isnull=False
+        )
+        .select_related("result")
+        .order_by("-execution_time", "-id")
+        .first()
+    )
+    if history is None:
+        raise IncrementalReset(
+            "No stored result to append to, reloading the whole result."
+        )
+    return history.result
+
+
+def _retry_countdown(task, retries, exc):
+    """
+    Exponential backoff from the task's retry_delay with jitter, so
+    executions failing together don't retry in lockstep. While the
+    connection's circuit is open, waits at least until it admits a
+    probe.
+    """
+    backoff = min(task.retry_delay * 2**retries, settings.RETRY_BACKOFF_MAX)
+    countdown = backoff / 2 + random.uniform(0, backoff / 2)
+    if isinstance(exc, CircuitOpen):
+        countdown = max(countdown, exc.retry_in)
+    return countdown
+
+
+def _queue_wait(request):
+    """
+    Returns the seconds between dispatch, or the ETA of a delayed
+    run, and the worker picking the task up.
+    """
+    dispatched_at = getattr(request, "dispatched_at", None)
+    if dispatched_at is None:
+        return None
+    if request.eta:
+        eta = datetime.fromisoformat(request.eta).timestamp()
+        dispatched_at = max(dispatched_at, eta)
+    return max(time.time() - dispatched_at, 0)
+
+
+def _record_metrics(task, execution_history, timings):
+    ExecutionHistory.objects.filter(id=execution_history.id).update(
+        timings=timings, queue_wait=execution_history.queue_wait
+    )
+    execution_history.timings = timings
+    publish_execution_event(execution_history)
+    record_execution_stats(execution_history, task)
+    record_execution(execution_history, task, timings)
+
+
+@shared_task
+def maintain_result_partitions():
+    """
+    Creates upcoming partitions of the results table and drops the
+    partitions past the retention window.
+    """
+    with connection.cursor() as cursor:
+        ensure_results_schema(cursor)
+        return drop_expired_partitions(cursor)
+
+
+@shared_task
+def prune_execution_history():
+    """
+    Deletes executions outside their task's retention policy and the
+    stored results nothing refers to any more.
+    """
+    return prune_all()
+
+
+@worker_ready.connect
+def _prepare_results_schema(**kwargs):
+    ensure_results_schema()
+
+
+@before_task_publish.connect
+def _stamp_dispatch_time(sender=None, headers=None, **kwargs):
+    if sender == execute_task.name and headers is not None:
+        headers.setdefault("dispatched_at", time.time())
@@ -0,0 +1,79 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+from rest_framework.test import APIRequestFactory
+
+from tasks.models import ExecutionHistory, Task
+from tasks.views import RunTaskBatch
+
+factory = APIRequestFactory()
+
+
+@mock.patch.object(Task.objects, "all")
+class RunTaskBatchFilterTests(SimpleTestCase):
+    def post(self, data):
+        request = factory.post("/tasks/run/batch/", data, format="json")
+        return RunTaskBatch.as_view()(request)
+
+    def test_is_active_strings_are_parsed_as_booleans(self, all_):
+        tasks = all_.return_value
+        tasks.filter.return_value.only.return_value = []
+        for value, expected in (
+            ("false", False),
+            ("0", False),
+            (False, False),
+            ("true", True),
+        ):
+            with self.subTest(value=value):
+                response = self.post({"is_active": value})
+                self.assertEqual(response.status_code, 404)
+                tasks.filter.assert_called_with(is_active=expected)
+
+    def test_invalid_filters(self, all_):
+        for data in (
+            {"is_active": "maybe"},
+            {"task_ids": ["a"]},
+            {"database_connection": "x"},
+        ):
+            with self.subTest(**data):
+                self.assertEqual(self.post(data).status_code, 400)
+
+    def test_filter_is_required(self, all_):
+        self.assertEqual(self.post({}).status_code, 400)
+        all_.assert_not_called()
+
+    @mock.patch("tasks.views.publish_execution_events")
+    @mock.patch("tasks.views.group")
+    @mock.patch.object(ExecutionHistory.objects, "bulk_create")
+    def test_executions_are_created_before_dispatch(
+        self, bulk_create, group, publish, all_
+    ):
+        all_.return_value.filter.return_value.only.return_value = [
+            Task(id=1, name="a"),
+            Task(id=2, name="b"),
+        ]
+        bulk_create.side_effect = lambda executions: executions
+        apply_async = group.return_value.apply_async
+        apply_async.return_value = mock.Mock(id="group")
+        calls = mock.Mock()
+        calls.attach_mock(bulk_create, "bulk_create")
+        calls.attach_mock(publish, "publish")
+        calls.attach_mock(apply_async, "apply_async")
+        response = self.post({"task_ids": [1, 2]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"group_id": "group", "count": 2})
+        self.assertEqual(
+            [call[0] for call in calls.mock_calls],
+            ["bulk_create", "publish", "apply_async", "apply_async().save"],
+        )
+        executions = bulk_create.call_args.args[0]
+        publish.assert_called_once_with(executions)
+        self.assertEqual(
+            [execution.task_id for execution in executions], [1, 2]
+        )
+        executions = bulk_create.call_args.args[0]
+        signatures = group.call_args.args[0]
+        self.assertEqual(
+            [execution.celery_task_id for execution in executions],
+            [signature.options["task_id"] for signature in signatures],
+        )
@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+from rest_framework.test import APIRequestFactory
+
+from tasks.models import ExecutionHistory
+from tasks.views import RunTaskBatchStatus
+
+factory = APIRequestFactory()
+
+
+@mock.patch.object(ExecutionHistory.objects, "filter")
+@mock.patch("tasks.views.GroupResult")
+class RunTaskBatchStatusTests(SimpleTestCase):
+    def get_status(self, group_result, filter_, counts):
+        group_result.restore.return_value = SimpleNamespace(
+            results=[SimpleNamespace(id=f"task-{i}") for i in range(3)]
+        )
+        annotate = filter_.return_value.values_list.return_value.annotate
+        annotate.return_value = counts
+        request = factory.get("/tasks/run/batch/group/")
+        return RunTaskBatchStatus.as_view()(request, group_id="group")
+
+    def test_every_terminal_status_counts_as_finished(
+        self, group_result, filter_
+    ):
+        response = self.get_status(
+            group_result,
+            filter_,
+            [("SUCCESS", 1), ("TIMEOUT", 1), ("CANCELLED", 1)],
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["completed"])
+        self.assertEqual(response.data["total"], 3)
+        filter_.assert_called_once_with(
+            celery_task_id__in=["task-0", "task-1", "task-2"]
+        )
+
+    def test_pending_and_retrying_runs_are_not_finished(
+        self, group_result, filter_
+    ):
+        for active in ("PENDING", "RETRY"):
+            with self.subTest(status=active):
+                response = self.get_status(
+                    group_result, filter_, [("SUCCESS", 2), (active, 1)]
+                )
+                self.assertFalse(response.data["completed"])
+
+    def test_unknown_group(self, group_result, filter_):
+        group_result.restore.return_value = None
+        request = factory.get("/tasks/run/batch/group/")
+        response = RunTaskBatchStatus.as_view()(request, group_id="group")
+        self.assertEqual(response.status_code, 404)
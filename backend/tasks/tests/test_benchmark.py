@@ -0,0 +1,115 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from tasks.benchmark import (
+    FakeConnection,
+    Scenario,
+    _percentile,
+    compare_reports,
+    run_benchmark,
+    scenario_name,
+)
+from tasks.events import publish_execution_event
+from tasks.metrics import record_execution
+from tasks.models import ExecutionHistory, Task
+
+
+class FakeSourceTests(SimpleTestCase):
+    def test_generates_distinct_rows_on_every_run(self):
+        connection = FakeConnection(Scenario(3, "mixed", "stream", 16))
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            first = cursor.fetchmany(2) + cursor.fetchall()
+            self.assertEqual(len(cursor.description), len(first[0]))
+            cursor.execute("SELECT 1")
+            second = cursor.fetchall()
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 3)
+        self.assertNotEqual(first[0][0], second[0][0])
+
+    def test_wide_profile_text_width(self):
+        connection = FakeConnection(Scenario(1, "wide", "fetchall", 32))
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            row = cursor.fetchall()[0]
+        self.assertEqual(len(row), 21)
+        self.assertEqual(len(row[1]), 32)
+
+
+class CompareReportsTests(SimpleTestCase):
+    baseline = {
+        "stream/narrow/w32/1000": {
+            "rows_per_second": 1000.0,
+            "latency_p99": 1.0,
+            "peak_rss_delta": 100.0,
+        }
+    }
+
+    def test_within_tolerance(self):
+        report = {
+            "stream/narrow/w32/1000": {
+                "rows_per_second": 900.0,
+                "latency_p99": 1.1,
+                "peak_rss_delta": 110.0,
+            },
+            "stream/wide/w32/1000": {"rows_per_second": 1.0},
+        }
+        self.assertEqual(compare_reports(report, self.baseline, 0.2), [])
+
+    def test_reports_every_regression(self):
+        report = {
+            "stream/narrow/w32/1000": {
+                "rows_per_second": 500.0,
+                "latency_p99": 2.0,
+                "peak_rss_delta": 100.0,
+            }
+        }
+        regressions = compare_reports(report, self.baseline, 0.2)
+        self.assertEqual(len(regressions), 2)
+        self.assertIn("rows_per_second 1000 -> 500 (-50%)", regressions[0])
+        self.assertIn("latency_p99 1 -> 2 (+100%)", regressions[1])
+
+
+class HelperTests(SimpleTestCase):
+    def test_scenario_name(self):
+        self.assertEqual(
+            scenario_name(Scenario(10, "narrow", "materialize", 8)),
+            "materialize/narrow/w8/10",
+        )
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(_percentile(values, 50), 50)
+        self.assertEqual(_percentile(values, 99), 99)
+        self.assertEqual(_percentile([3.0], 99), 3.0)
+
+
+@mock.patch("tasks.benchmark.transaction")
+@mock.patch("tasks.events.get_redis")
+@mock.patch("tasks.metrics.get_redis")
+class RunBenchmarkTests(SimpleTestCase):
+    def finish_execution(self, *args):
+        task = Task(id=1, database_connection_id=2)
+        history = ExecutionHistory(
+            id=5, task=task, status="SUCCESS", row_count=1, byte_count=8
+        )
+        record_execution(history, task, {"total": 0.1})
+        publish_execution_event(history)
+        return {}
+
+    def test_runs_leave_metrics_and_events_alone(
+        self, metrics_redis, events_redis, transaction
+    ):
+        with mock.patch(
+            "tasks.benchmark._run_scenario", side_effect=self.finish_execution
+        ):
+            report = run_benchmark([Scenario(1, "narrow", "stream", 8)])
+        self.assertEqual(list(report), ["stream/narrow/w8/1"])
+        metrics_redis.assert_not_called()
+        events_redis.assert_not_called()
+        transaction.set_rollback.assert_called_once_with(True)
+
+        self.finish_execution()
+        metrics_redis.return_value.pipeline.assert_called_once()
+        events_redis.return_value.pipeline.assert_called_once()
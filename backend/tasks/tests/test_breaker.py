@@ -0,0 +1,61 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from tasks.breaker import CircuitBreaker, CircuitOpen
+
+
+@mock.patch("tasks.breaker.get_redis")
+class CircuitBreakerTests(SimpleTestCase):
+    def allow(self, get_redis, result):
+        get_redis.return_value.register_script.return_value = mock.Mock(
+            return_value=result
+        )
+
+    def test_open_circuit_fails_fast(self, get_redis):
+        self.allow(get_redis, b"12.5")
+        with self.assertRaises(CircuitOpen) as cm:
+            CircuitBreaker(1).check()
+        self.assertEqual(cm.exception.retry_in, 12.5)
+
+    def test_success_without_recorded_failures_skips_redis(self, get_redis):
+        self.allow(get_redis, b"-1")
+        breaker = CircuitBreaker(1)
+        breaker.check()
+        breaker.record_success()
+        get_redis.return_value.delete.assert_not_called()
+
+    def test_success_resets_recorded_failures(self, get_redis):
+        self.allow(get_redis, b"0")
+        breaker = CircuitBreaker(1)
+        breaker.check()
+        breaker.record_success()
+        breaker.record_success()
+        get_redis.return_value.delete.assert_called_once_with("circuit:1")
+
+    def test_record_failure_passes_the_settings(self, get_redis):
+        with self.settings(
+            CIRCUIT_FAILURE_THRESHOLD=3,
+            CIRCUIT_OPEN_TIMEOUT=30,
+            CIRCUIT_MAX_OPEN_TIMEOUT=600,
+        ):
+            CircuitBreaker(1).record_failure()
+        script = get_redis.return_value.register_script.return_value
+        self.assertEqual(script.call_args.kwargs["keys"], ["circuit:1"])
+        self.assertEqual(script.call_args.kwargs["args"][1:], [3, 30, 600])
+
+    def test_get_state(self, get_redis):
+        get_redis.return_value.hgetall.return_value = {
+            b"state": b"open",
+            b"failures": b"4",
+            b"open_until": b"1700000000.5",
+        }
+        self.assertEqual(
+            CircuitBreaker(1).get_state(),
+            {"state": "open", "failures": 4, "open_until": 1700000000.5},
+        )
+        get_redis.return_value.hgetall.return_value = {}
+        self.assertEqual(
+            CircuitBreaker(1).get_state(),
+            {"state": "closed", "failures": 0, "open_until": None},
+        )
@@ -0,0 +1,78 @@
+import time
+from unittest import mock
+
+import redis
+from django.test import SimpleTestCase
+
+from tasks.cache import _cache_key, cache_result, get_cached_result
+from tasks.models import ResultBlob, Task
+
+
+def make_task(**kwargs):
+    fields = {
+        "query": "SELECT * FROM orders",
+        "database_connection_id": 1,
+        "cache_ttl": 60,
+        "max_rows": None,
+        "max_result_bytes": None,
+    }
+    fields.update(kwargs)
+    return Task(**fields)
+
+
+class CacheKeyTests(SimpleTestCase):
+    def test_formatting_differences_share_a_key(self):
+        self.assertEqual(
+            _cache_key(make_task(query="SELECT *\n  FROM orders;")),
+            _cache_key(make_task()),
+        )
+
+    def test_string_literals_are_kept(self):
+        self.assertNotEqual(
+            _cache_key(make_task(query="SELECT 'a  b'")),
+            _cache_key(make_task(query="SELECT 'a b'")),
+        )
+
+    def test_limits_and_connection_are_part_of_the_key(self):
+        key = _cache_key(make_task())
+        for changes in (
+            {"max_rows": 100},
+            {"max_result_bytes": 1024},
+            {"database_connection_id": 2},
+        ):
+            with self.subTest(**changes):
+                self.assertNotEqual(_cache_key(make_task(**changes)), key)
+
+
+@mock.patch("tasks.cache.get_redis")
+class CachedResultTests(SimpleTestCase):
+    def test_entry_older_than_the_reader_ttl_is_ignored(self, get_redis):
+        get_redis.return_value.get.return_value = (
+            f"5:{time.time() - 120}".encode()
+        )
+        with mock.patch.object(ResultBlob.objects, "filter") as filter_:
+            self.assertIsNone(get_cached_result(make_task(cache_ttl=60)))
+        filter_.assert_not_called()
+
+    def test_fresh_entry_is_returned(self, get_redis):
+        get_redis.return_value.get.return_value = (
+            f"5:{time.time() - 10}".encode()
+        )
+        with mock.patch.object(ResultBlob.objects, "filter") as filter_:
+            result = get_cached_result(make_task(cache_ttl=60))
+        filter_.assert_called_once_with(id=5, content_hash__isnull=False)
+        self.assertEqual(result, filter_.return_value.first.return_value)
+
+    def test_redis_outage_is_a_cache_miss(self, get_redis):
+        get_redis.return_value.get.side_effect = redis.ConnectionError
+        self.assertIsNone(get_cached_result(make_task()))
+        get_redis.return_value.set.side_effect = redis.ConnectionError
+        cache_result(make_task(), ResultBlob(id=5))
+
+    def test_entry_expires_with_the_writer_ttl(self, get_redis):
+        task = make_task(cache_ttl=30)
+        cache_result(task, ResultBlob(id=5))
+        key, value = get_redis.return_value.set.call_args.args
+        self.assertEqual(key, _cache_key(task))
+        self.assertTrue(value.startswith("5:"))
+        self.assertEqual(get_redis.return_value.set.call_args.kwargs["ex"], 30)
@@ -0,0 +1,66 @@
+from collections import namedtuple
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from tasks.results import ResultWriter
+
+Column = namedtuple("Column", ["name", "type_code"])
+
+DESCRIPTION = [Column("id", 23), Column("name", 25)]
+
+
+@mock.patch("tasks.results._save_blob", side_effect=lambda blob, h: (blob, h))
+@mock.patch("tasks.results._store_chunk")
+@mock.patch("tasks.results._find_chunk")
+class ResultWriterDeduplicationTests(SimpleTestCase):
+    def test_stored_chunk_is_neither_compressed_nor_written(
+        self, find_chunk, store_chunk, save_blob
+    ):
+        find_chunk.return_value = (42, 100)
+        writer = ResultWriter(DESCRIPTION)
+        with mock.patch("tasks.results.compress") as compress:
+            writer.write([[1, "a"]])
+        compress.assert_not_called()
+        store_chunk.assert_not_called()
+        blob, _ = writer.finish()
+        self.assertEqual(blob.chunk_ids, [42])
+        self.assertEqual(blob.size, 100)
+        self.assertEqual(blob.row_count, 1)
+
+    def test_new_chunk_is_written(self, find_chunk, store_chunk, save_blob):
+        find_chunk.return_value = None
+        store_chunk.return_value = 7
+        writer = ResultWriter(DESCRIPTION)
+        writer.write([[1, "a"]])
+        chunk_date, chunk_hash, data = store_chunk.call_args.args
+        self.assertEqual(chunk_date, writer.chunk_date)
+        find_chunk.assert_called_once_with(writer.chunk_date, chunk_hash)
+        blob, _ = writer.finish()
+        self.assertEqual(blob.chunk_ids, [7])
+        self.assertEqual(blob.size, len(data))
+
+    def test_content_hash_depends_on_rows_and_columns(
+        self, find_chunk, store_chunk, save_blob
+    ):
+        find_chunk.return_value = (1, 10)
+
+        def content_hash(description, rows):
+            writer = ResultWriter(description)
+            writer.write(rows)
+            return writer.finish()[1]
+
+        rows = [[1, "a"], [2, "b"]]
+        self.assertEqual(
+            content_hash(DESCRIPTION, rows), content_hash(DESCRIPTION, rows)
+        )
+        self.assertNotEqual(
+            content_hash(DESCRIPTION, rows),
+            content_hash(DESCRIPTION, [[1, "a"]]),
+        )
+        renamed = [Column("id", 23), Column("title", 25)]
+        self.assertNotEqual(
+            content_hash(DESCRIPTION, rows), content_hash(renamed, rows)
+        )
+        chunk_hashes = {call.args[1] for call in find_chunk.call_args_list}
+        self.assertEqual(len(chunk_hashes), 3)
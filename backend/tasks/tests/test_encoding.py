@@ -0,0 +1,80 @@
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from uuid import UUID
+
+from django.test import SimpleTestCase
+
+from tasks.encoding import (
+    column_types,
+    compress,
+    decode_rows,
+    serialize_rows,
+    to_json_value,
+)
+
+Column = namedtuple("Column", ["name", "type_code"])
+
+
+class EncodingTests(SimpleTestCase):
+    def test_column_types(self):
+        description = [
+            Column("id", 23),
+            Column("amount", 1700),
+            Column("note", 0),
+        ]
+        self.assertEqual(
+            column_types(description), ["integer", "numeric", "text"]
+        )
+
+    def test_round_trip(self):
+        types = [
+            "integer",
+            "numeric",
+            "bytea",
+            "date",
+            "time without time zone",
+            "timestamp with time zone",
+            "interval",
+            "uuid",
+            "jsonb",
+            "text",
+        ]
+        rows = [
+            [
+                1,
+                Decimal("10.50"),
+                b"\x00\xff",
+                date(2024, 2, 29),
+                time(12, 30),
+                datetime(2024, 2, 29, 12, 30, tzinfo=timezone.utc),
+                timedelta(minutes=90),
+                UUID("12345678-1234-5678-1234-567812345678"),
+                {"key": [1, 2]},
+                "text",
+            ],
+            [None] * len(types),
+        ]
+        data = compress(serialize_rows(rows, types))
+        self.assertEqual(decode_rows(data, types), rows)
+
+    def test_serialization_is_deterministic(self):
+        rows = [[1, "a"], [2, "b"]]
+        types = ["integer", "text"]
+        self.assertEqual(
+            serialize_rows(rows, types), serialize_rows(list(rows), types)
+        )
+
+    def test_rows_without_columns(self):
+        data = compress(serialize_rows([[], []], []))
+        self.assertEqual(decode_rows(data, []), [[], []])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            decode_rows(b"not a chunk", ["text"])
+
+    def test_to_json_value(self):
+        self.assertEqual(to_json_value(b"\x01"), "AQ==")
+        self.assertEqual(to_json_value(Decimal("1.5")), "1.5")
+        self.assertEqual(to_json_value(timedelta(seconds=3)), 3.0)
+        self.assertEqual(to_json_value(date(2024, 1, 2)), "2024-01-02")
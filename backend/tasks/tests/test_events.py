@@ -0,0 +1,71 @@
+import json
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from tasks.events import publish_execution_event, stream_execution_events
+from tasks.export import aiter_blocks
+
+
+@mock.patch("tasks.events.ExecutionHistoryListSerializer")
+@mock.patch("tasks.events.get_redis")
+class PublishExecutionEventTests(SimpleTestCase):
+    def test_published_to_the_global_and_the_task_channel(
+        self, get_redis, serializer
+    ):
+        serializer.return_value.data = {"id": 1, "status": "SUCCESS"}
+        publish_execution_event(SimpleNamespace(task_id=7))
+        pipeline = get_redis.return_value.pipeline.return_value
+        self.assertEqual(
+            [call.args for call in pipeline.publish.call_args_list],
+            [
+                ("executions", json.dumps({"id": 1, "status": "SUCCESS"})),
+                (
+                    "executions:task:7",
+                    json.dumps({"id": 1, "status": "SUCCESS"}),
+                ),
+            ],
+        )
+        pipeline.execute.assert_called_once()
+
+
+class StreamExecutionEventsTests(SimpleTestCase):
+    @mock.patch("tasks.events.redis.asyncio.from_url")
+    async def test_events_and_keepalives(self, from_url):
+        pubsub = from_url.return_value.pubsub.return_value
+        pubsub.subscribe = mock.AsyncMock()
+        pubsub.aclose = mock.AsyncMock()
+        from_url.return_value.aclose = mock.AsyncMock()
+        pubsub.get_message = mock.AsyncMock(
+            side_effect=[{"data": b'{"id": 1}'}, None]
+        )
+        stream = stream_execution_events(task_id=7)
+        events = [await stream.__anext__() for _ in range(3)]
+        await stream.aclose()
+        self.assertEqual(
+            events,
+            [
+                "retry: 3000\n\n",
+                'event: execution\ndata: {"id": 1}\n\n',
+                ": keepalive\n\n",
+            ],
+        )
+        pubsub.subscribe.assert_awaited_once_with("executions:task:7")
+        pubsub.aclose.assert_awaited_once()
+
+
+class AiterBlocksTests(SimpleTestCase):
+    async def test_yields_every_block_and_closes_the_source(self):
+        closed = []
+
+        def blocks():
+            try:
+                yield b"a"
+                yield b"b"
+            finally:
+                closed.append(True)
+
+        sent = [block async for block in aiter_blocks(blocks())]
+        self.assertEqual(sent, [b"a", b"b"])
+        self.assertEqual(closed, [True])
@@ -0,0 +1,109 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from celery.exceptions import Retry
+from django.test import SimpleTestCase
+from rest_framework.test import APIRequestFactory
+
+from tasks.metrics import PhaseTimer
+from tasks.models import DatabaseConnection, ExecutionHistory, Task
+from tasks.tasks import _execute_task
+from tasks.views import CancelExecution
+
+
+class RetryEventTests(SimpleTestCase):
+    def setUp(self):
+        self.task = Task(
+            id=1, max_retries=3, database_connection=DatabaseConnection(id=2)
+        )
+        self.history = ExecutionHistory(
+            id=5, task=self.task, status="PENDING", celery_task_id="run-a"
+        )
+        self.published = []
+        patchers = {
+            "select_related": mock.patch.object(
+                Task.objects, "select_related"
+            ),
+            "get_or_create": mock.patch.object(
+                ExecutionHistory.objects, "get_or_create"
+            ),
+            "filter": mock.patch.object(ExecutionHistory.objects, "filter"),
+            "save": mock.patch.object(ExecutionHistory, "save"),
+            "refresh": mock.patch.object(ExecutionHistory, "refresh_from_db"),
+            "publish": mock.patch("tasks.tasks.publish_execution_event"),
+            "stats": mock.patch("tasks.tasks.record_execution_stats"),
+            "metrics": mock.patch("tasks.tasks.record_execution"),
+            "guard": mock.patch("tasks.tasks.ExecutionGuard"),
+            "atomic": mock.patch("tasks.tasks.transaction.atomic"),
+            "run": mock.patch(
+                "tasks.tasks._run_and_store",
+                side_effect=RuntimeError("boom"),
+            ),
+        }
+        self.mocks = {}
+        for name, patcher in patchers.items():
+            self.mocks[name] = patcher.start()
+            self.addCleanup(patcher.stop)
+        select_related = self.mocks["select_related"]
+        select_related.return_value.get.return_value = self.task
+        self.mocks["publish"].side_effect = (
+            lambda history: self.published.append(history.status)
+        )
+
+    def run_attempt(self, retries):
+        self.mocks["get_or_create"].return_value = (
+            self.history,
+            retries == 0,
+        )
+        task_self = mock.Mock()
+        task_self.request = SimpleNamespace(
+            id="run-a", retries=retries, eta=None
+        )
+        task_self.retry.side_effect = lambda **kwargs: Retry()
+        _execute_task(task_self, 1, "scheduled", PhaseTimer())
+
+    def test_retry_is_published_once_per_attempt(self):
+        with self.assertRaises(Retry):
+            self.run_attempt(0)
+        self.assertEqual(self.published, ["PENDING", "RETRY"])
+        with self.assertRaises(Retry):
+            self.run_attempt(1)
+        self.assertEqual(self.published, ["PENDING", "RETRY", "RETRY"])
+        self.mocks["metrics"].assert_not_called()
+        self.mocks["stats"].assert_not_called()
+
+    def test_last_attempt_is_recorded_once(self):
+        with self.assertRaises(RuntimeError):
+            self.run_attempt(3)
+        self.assertEqual(self.published, ["FAILURE"])
+        self.mocks["stats"].assert_called_once_with(self.history, self.task)
+        self.assertEqual(self.mocks["metrics"].call_count, 1)
+
+
+@mock.patch("tasks.views.publish_execution_event")
+@mock.patch.object(ExecutionHistory, "save")
+@mock.patch("tasks.views.get_object_or_404")
+class CancelExecutionEventTests(SimpleTestCase):
+    def cancel(self, get_object, running):
+        history = ExecutionHistory(id=5, task_id=1, status="PENDING")
+        get_object.return_value = history
+        request = APIRequestFactory().post("/executions/5/cancel/")
+        with mock.patch(
+            "tasks.views.cancel_execution", return_value=running
+        ):
+            response = CancelExecution.as_view()(request, execution_id=5)
+        self.assertEqual(response.status_code, 200)
+        return history
+
+    def test_cancelled_before_start_is_published(
+        self, get_object, save, publish
+    ):
+        history = self.cancel(get_object, running=False)
+        self.assertEqual(history.status, "CANCELLED")
+        publish.assert_called_once_with(history)
+
+    def test_running_execution_publishes_its_own_outcome(
+        self, get_object, save, publish
+    ):
+        self.cancel(get_object, running=True)
+        publish.assert_not_called()
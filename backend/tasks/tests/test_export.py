@@ -0,0 +1,140 @@
+import gzip
+import json
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase
+from rest_framework.test import APIRequestFactory
+
+from tasks.export import encode_blocks, render_csv, render_ndjson
+from tasks.models import ExecutionHistory, Task
+from tasks.views import ExportTask
+
+
+class RenderTests(SimpleTestCase):
+    rows = [
+        ["id", "amount", "day", "raw"],
+        [1, Decimal("2.50"), None, b"\x01"],
+    ]
+
+    def test_csv(self):
+        self.assertEqual(
+            "".join(render_csv(self.rows)),
+            "id,amount,day,raw\r\n1,2.50,,\\x01\r\n",
+        )
+
+    def test_ndjson(self):
+        lines = list(
+            render_ndjson([["id", "day"], [1, date(2024, 1, 2)], [2, None]])
+        )
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [{"id": 1, "day": "2024-01-02"}, {"id": 2, "day": None}],
+        )
+
+
+class EncodeBlocksTests(SimpleTestCase):
+    def test_lines_are_grouped_into_blocks(self):
+        lines = ["x" * 10 + "\n"] * 10
+        with mock.patch("tasks.export.EXPORT_BLOCK_SIZE", 30):
+            blocks = list(encode_blocks(iter(lines)))
+        self.assertEqual([len(block) for block in blocks], [33, 33, 33, 11])
+        self.assertEqual(b"".join(blocks), "".join(lines).encode())
+
+    def test_gzip(self):
+        lines = [f"{i}\n" for i in range(1000)]
+        data = b"".join(encode_blocks(iter(lines), compress=True))
+        self.assertEqual(gzip.decompress(data), "".join(lines).encode())
+
+    def test_empty_export(self):
+        self.assertEqual(list(encode_blocks(iter([]))), [])
+
+
+class FakeExecutions:
+    """
+    The lookups ExportTask makes on task.executions, over a list.
+    """
+
+    def __init__(self, histories):
+        self.histories = histories
+
+    def filter(self, status__in=None, **isnull):
+        histories = [
+            history
+            for history in self.histories
+            if status__in is None or history.status in status__in
+        ]
+        for lookup, value in isnull.items():
+            field = lookup.removesuffix("__isnull")
+            histories = [
+                history
+                for history in histories
+                if (getattr(history, field) is None) == value
+            ]
+        return FakeExecutions(histories)
+
+    def select_related(self, *fields):
+        return self
+
+    def order_by(self, *fields):
+        return FakeExecutions(
+            sorted(
+                self.histories,
+                key=lambda history: (history.execution_time, history.id),
+                reverse=True,
+            )
+        )
+
+    def first(self):
+        return self.histories[0] if self.histories else None
+
+
+@mock.patch("tasks.views.iter_materialized_export", return_value=[["id"]])
+@mock.patch("tasks.views.get_object_or_404")
+class ExportTaskTests(SimpleTestCase):
+    def export(self, get_object, task, histories):
+        get_object.return_value = task
+        request = APIRequestFactory().get("/tasks/1/export/")
+        with mock.patch.object(Task, "executions", FakeExecutions(histories)):
+            return ExportTask.as_view()(request, task_id=1)
+
+    def execution(self, id, status, day):
+        return ExecutionHistory(
+            id=id,
+            status=status,
+            execution_time=datetime(2024, 1, day, tzinfo=timezone.utc),
+            result_data={"row_count": 1},
+        )
+
+    def test_materialized_export_is_the_latest_run(self, get_object, export):
+        task = Task(id=1, materialize_results=True)
+        response = self.export(
+            get_object,
+            task,
+            [
+                self.execution(1, "SUCCESS", 1),
+                self.execution(2, "SUCCESS", 2),
+                self.execution(3, "FAILURE", 3),
+            ],
+        )
+        self.assertEqual(response.status_code, 200)
+        export.assert_called_once_with(task, 2)
+
+    def test_incremental_export_has_every_run(self, get_object, export):
+        task = Task(id=1, materialize_results=True, watermark_column="id")
+        response = self.export(
+            get_object,
+            task,
+            [self.execution(1, "SUCCESS", 1), self.execution(2, "SUCCESS", 2)],
+        )
+        self.assertEqual(response.status_code, 200)
+        export.assert_called_once_with(task)
+
+    def test_no_stored_run(self, get_object, export):
+        task = Task(id=1, materialize_results=True)
+        response = self.export(
+            get_object, task, [self.execution(1, "FAILURE", 1)]
+        )
+        self.assertEqual(response.status_code, 404)
+        export.assert_not_called()
@@ -0,0 +1,53 @@
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from tasks.guards import (
+    ExecutionCancelled,
+    ExecutionGuard,
+    ExecutionTimedOut,
+)
+from tasks.models import Task
+
+
+def make_guard(**kwargs):
+    fields = {"statement_timeout": None, "max_rows": None}
+    fields.update(kwargs)
+    return ExecutionGuard(Task(**fields), "celery-id")
+
+
+@mock.patch("tasks.guards.get_redis")
+class ExecutionGuardTests(SimpleTestCase):
+    def test_rows_past_the_limit_are_cut_off(self, get_redis):
+        get_redis.return_value.exists.return_value = 0
+        guard = make_guard(max_rows=5)
+        self.assertEqual(guard.admit_rows([1, 2, 3]), [1, 2, 3])
+        self.assertFalse(guard.truncated)
+        self.assertEqual(guard.admit_rows([4, 5, 6]), [4, 5])
+        self.assertTrue(guard.truncated)
+        self.assertEqual(guard.admit_rows([7]), [])
+
+    def test_batch_past_the_byte_limit_is_refused(self, get_redis):
+        guard = make_guard(max_result_bytes=100)
+        self.assertTrue(guard.admit_bytes(60))
+        self.assertFalse(guard.admit_bytes(60))
+        self.assertTrue(guard.truncated)
+        self.assertTrue(guard.has_result_limits)
+
+    def test_timeout(self, get_redis):
+        guard = make_guard(statement_timeout=10)
+        guard.deadline = time.monotonic() - 1
+        with self.assertRaises(ExecutionTimedOut):
+            guard.check()
+
+    def test_cancellation_is_checked_at_most_once_a_second(self, get_redis):
+        get_redis.return_value.exists.return_value = 0
+        guard = make_guard()
+        guard.check()
+        get_redis.return_value.exists.return_value = 1
+        guard.check()
+        self.assertEqual(get_redis.return_value.exists.call_count, 1)
+        guard._cancel_checked_at -= 1
+        with self.assertRaises(ExecutionCancelled):
+            guard.check()
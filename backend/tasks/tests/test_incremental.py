@@ -0,0 +1,121 @@
+from collections import namedtuple
+from datetime import date, timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from tasks.models import ResultBlob, Task
+from tasks.partitions import day_start
+from tasks.results import (
+    IncrementalReset,
+    ResultWriter,
+    WatermarkTracker,
+    _create_materialized_table,
+)
+
+Column = namedtuple("Column", ["name", "type_code"])
+
+DESCRIPTION = [Column("id", 23), Column("updated", 1082)]
+
+
+class WatermarkQueryTests(SimpleTestCase):
+    def test_full_load_is_ordered_by_the_watermark(self):
+        task = Task(query="SELECT * FROM t;", watermark_column="updated")
+        query, params = task.get_query()
+        self.assertEqual(
+            query,
+            'SELECT * FROM (SELECT * FROM t) AS incremental_source '
+            'ORDER BY "updated"',
+        )
+        self.assertIsNone(params)
+
+    def test_incremental_load_selects_rows_past_the_watermark(self):
+        task = Task(
+            query="SELECT * FROM t WHERE name LIKE 'a%'",
+            watermark_column="updated",
+            watermark_value="2024-01-01",
+        )
+        query, params = task.get_query()
+        self.assertIn("LIKE 'a%%'", query)
+        self.assertIn('WHERE "updated" > %(watermark)s', query)
+        self.assertEqual(params, {"watermark": "2024-01-01"})
+
+
+class WatermarkTrackerTests(SimpleTestCase):
+    def test_tracks_the_highest_value(self):
+        tracker = WatermarkTracker("updated")
+        tracker.bind(["id", "updated"])
+        tracker.update(
+            [[1, date(2024, 1, 2)], [2, None], [3, date(2024, 1, 1)]]
+        )
+        self.assertEqual(tracker.serialize(), "2024-01-02")
+
+    def test_missing_column(self):
+        with self.assertRaises(ValueError):
+            WatermarkTracker("updated").bind(["id"])
+
+
+@mock.patch("tasks.results._save_blob", side_effect=lambda blob, _: blob)
+@mock.patch("tasks.results._find_chunk", return_value=(9, 50))
+class IncrementalWriterTests(SimpleTestCase):
+    def make_base(self, chunk_date, **kwargs):
+        fields = {
+            "columns": ["id", "updated"],
+            "column_types": ["integer", "date"],
+            "content_hash": "f" * 64,
+            "row_count": 3,
+            "size": 100,
+            "chunk_date": chunk_date,
+            "chunk_ids": [1, 2],
+        }
+        fields.update(kwargs)
+        return ResultBlob(**fields)
+
+    def test_rows_are_appended_to_the_base_result(self, *mocks):
+        writer = ResultWriter(DESCRIPTION, base=self.make_base(day_start()))
+        writer.write([[4, date(2024, 1, 3)]])
+        blob = writer.finish()
+        self.assertEqual(blob.chunk_ids, [1, 2, 9])
+        self.assertEqual(blob.row_count, 4)
+        self.assertEqual(blob.size, 150)
+
+    def test_base_chunks_are_carried_forward(self, *mocks):
+        today = day_start()
+        yesterday = today - timedelta(days=1)
+        writer = ResultWriter(DESCRIPTION, base=self.make_base(yesterday))
+        with mock.patch(
+            "tasks.results.carry_forward_chunks", return_value=[5, 6]
+        ) as carry_forward:
+            blob = writer.finish()
+        carry_forward.assert_called_once_with([1, 2], yesterday, today)
+        self.assertEqual(blob.chunk_ids, [5, 6])
+        self.assertEqual(blob.chunk_date, today)
+
+    def test_changed_columns_reset_the_watermark(self, *mocks):
+        base = self.make_base(None, columns=["id", "changed"])
+        with self.assertRaises(IncrementalReset):
+            ResultWriter(DESCRIPTION, base=base)
+
+
+class MaterializedIncrementalTests(SimpleTestCase):
+    def test_missing_table_resets_the_watermark(self):
+        cursor = mock.Mock()
+        cursor.fetchall.return_value = []
+        with self.assertRaises(IncrementalReset):
+            _create_materialized_table(
+                cursor, "results_task_1", [("id", "integer")], True
+            )
+        self.assertEqual(cursor.execute.call_count, 1)
+
+    def test_matching_table_is_kept(self):
+        cursor = mock.Mock()
+        cursor.fetchall.return_value = [
+            ("_execution_id", "bigint"),
+            ("id", "integer"),
+        ]
+        self.assertIsNone(
+            _create_materialized_table(
+                cursor, "results_task_1", [("id", "integer")], True
+            )
+        )
+        self.assertEqual(cursor.execute.call_count, 1)
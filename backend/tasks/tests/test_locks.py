@@ -0,0 +1,60 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from tasks.locks import ConnectionSemaphore, TaskLock
+
+
+@override_settings(CONNECTION_SLOT_LEASE=3600)
+@mock.patch("tasks.locks.time.time", return_value=1000.0)
+@mock.patch("tasks.locks.get_redis")
+class ConnectionSemaphoreTests(SimpleTestCase):
+    def test_acquire_passes_limit_and_lease(self, get_redis, _time):
+        script = get_redis.return_value.register_script.return_value
+        script.return_value = 1
+        self.assertTrue(ConnectionSemaphore(3, 2, "run-a").acquire())
+        script.assert_called_once_with(
+            keys=["connection_slots:3"], args=["run-a", 2, 1000.0, 3600]
+        )
+
+    def test_acquire_fails_when_all_slots_are_taken(self, get_redis, _time):
+        script = get_redis.return_value.register_script.return_value
+        script.return_value = 0
+        self.assertFalse(ConnectionSemaphore(3, 2, "run-a").acquire())
+
+    def test_release_frees_only_its_own_slot(self, get_redis, _time):
+        ConnectionSemaphore(3, 2, "run-a").release()
+        get_redis.return_value.zrem.assert_called_once_with(
+            "connection_slots:3", "run-a"
+        )
+
+
+@override_settings(TASK_LOCK_LEASE=600)
+@mock.patch("tasks.locks.get_redis")
+class TaskLockTests(SimpleTestCase):
+    def test_acquire_sets_the_holder_with_a_lease(self, get_redis):
+        get_redis.return_value.set.return_value = True
+        self.assertTrue(TaskLock(1, "run-a").acquire())
+        get_redis.return_value.set.assert_called_once_with(
+            "task_lock:1", "run-a", nx=True, ex=600
+        )
+
+    def test_holder(self, get_redis):
+        get_redis.return_value.get.return_value = b"run-a"
+        self.assertEqual(TaskLock(1, "run-b").holder(), "run-a")
+        get_redis.return_value.get.return_value = None
+        self.assertIsNone(TaskLock(1, "run-b").holder())
+
+    def test_single_follow_up(self, get_redis):
+        client = get_redis.return_value
+        client.set.return_value = None
+        client.get.return_value = b"run-b"
+        self.assertTrue(TaskLock(1, "run-b").claim_follow_up())
+        self.assertFalse(TaskLock(1, "run-c").claim_follow_up())
+        client.set.return_value = True
+        self.assertTrue(TaskLock(1, "run-d").claim_follow_up())
+
+    def test_release_only_removes_its_own_lock(self, get_redis):
+        TaskLock(1, "run-a").release()
+        script = get_redis.return_value.register_script.return_value
+        script.assert_called_once_with(keys=["task_lock:1"], args=["run-a"])
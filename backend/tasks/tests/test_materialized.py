@@ -0,0 +1,117 @@
+from collections import namedtuple
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from tasks.models import ExecutionHistory, Task
+from tasks.results import (
+    WatermarkTracker,
+    _copy_value,
+    _create_materialized_table,
+    archived_table_names,
+    store_materialized_results,
+)
+
+Column = namedtuple("Column", ["name", "type_code"])
+
+
+class MaterializedTableTests(SimpleTestCase):
+    def test_changed_columns_archive_the_old_table(self):
+        cursor = mock.Mock()
+        cursor.fetchall.return_value = [
+            ("_execution_id", "bigint"),
+            ("id", "integer"),
+        ]
+        archived = _create_materialized_table(
+            cursor, "results_task_1", [("id", "bigint")], False
+        )
+        self.assertRegex(archived, r"^results_task_1_archive_\d{14}$")
+        statements = [call.args[0] for call in cursor.execute.call_args_list]
+        self.assertFalse(any("DROP" in sql for sql in statements))
+        self.assertEqual(
+            statements[1],
+            f'ALTER TABLE "results_task_1" RENAME TO "{archived}";',
+        )
+        self.assertEqual(
+            statements[2],
+            'CREATE TABLE "results_task_1" '
+            '("_execution_id" bigint, "id" bigint);',
+        )
+
+    def test_new_table_archives_nothing(self):
+        cursor = mock.Mock()
+        cursor.fetchall.return_value = []
+        self.assertIsNone(
+            _create_materialized_table(
+                cursor, "results_task_1", [("id", "bigint")], False
+            )
+        )
+        statements = [call.args[0] for call in cursor.execute.call_args_list]
+        self.assertFalse(any("RENAME" in sql for sql in statements))
+
+    def test_archived_table_names(self):
+        cursor = mock.Mock()
+        cursor.fetchall.return_value = [
+            ("query_results_task_1_archive_20240102030405",),
+            ("query_results_task_1_archive_old",),
+        ]
+        self.assertEqual(
+            archived_table_names(cursor, Task(id=1)),
+            ["query_results_task_1_archive_20240102030405"],
+        )
+
+
+@mock.patch("tasks.results.transaction.atomic")
+@mock.patch("tasks.results._create_materialized_table", return_value=None)
+@mock.patch.object(ExecutionHistory.objects, "filter")
+@mock.patch("tasks.results.connection")
+class StoreMaterializedResultsTests(SimpleTestCase):
+    def store(self, connection, watermark_value=None):
+        task = Task(id=1, fetch_size=10, query="SELECT id FROM t")
+        task.watermark_value = watermark_value
+        source_conn = mock.MagicMock()
+        source_cursor = source_conn.cursor.return_value.__enter__()
+        source_cursor.fetchmany.return_value = []
+        source_cursor.description = [Column("id", 20)]
+        watermark = None
+        if watermark_value is not None:
+            watermark = WatermarkTracker("id")
+        store_materialized_results(
+            task, source_conn, ExecutionHistory(id=5, task=task), watermark
+        )
+        cursor = connection.cursor.return_value.__enter__.return_value
+        return [call.args for call in cursor.execute.call_args_list]
+
+    def test_full_load_replaces_earlier_runs(
+        self, connection, filter_, create, atomic
+    ):
+        statements = self.store(connection)
+        self.assertEqual(
+            statements,
+            [
+                (
+                    'DELETE FROM "query_results_task_1" '
+                    "WHERE _execution_id <> %s;",
+                    [5],
+                )
+            ],
+        )
+        filter_.assert_called_once_with(task_id=1, result_data__isnull=False)
+        exclude = filter_.return_value.exclude
+        exclude.assert_called_once_with(id=5)
+        exclude.return_value.update.assert_called_once_with(result_data=None)
+
+    def test_incremental_run_keeps_earlier_runs(
+        self, connection, filter_, create, atomic
+    ):
+        self.assertEqual(self.store(connection, watermark_value="3"), [])
+        filter_.assert_not_called()
+
+
+class CopyValueTests(SimpleTestCase):
+    def test_text_format_escaping(self):
+        self.assertEqual(_copy_value(None), "\\N")
+        self.assertEqual(_copy_value(True), "t")
+        self.assertEqual(_copy_value(b"\x01"), "\\\\x01")
+        self.assertEqual(_copy_value("a\tb\nc\\"), "a\\tb\\nc\\\\")
+        self.assertEqual(_copy_value({"a": 1}), '{"a": 1}')
@@ -0,0 +1,103 @@
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from tasks.metrics import (
+    METRICS_KEY,
+    record_execution,
+    render_metrics,
+    timed,
+    track_phases,
+)
+
+
+class PhaseTimerTests(SimpleTestCase):
+    def test_nested_phase_is_not_counted_twice(self):
+        with track_phases() as timer:
+            with timed("write"):
+                with timed("fetch"):
+                    time.sleep(0.02)
+        self.assertGreaterEqual(timer.phases["fetch"], 0.02)
+        self.assertLess(timer.phases["write"], 0.02)
+        self.assertIn("total", timer.as_dict())
+
+    def test_timed_without_tracking(self):
+        with timed("fetch"):
+            pass
+
+
+@mock.patch("tasks.metrics.get_redis")
+class RenderMetricsTests(SimpleTestCase):
+    def test_histogram_buckets_in_numeric_order(self, get_redis):
+        name = "query_execution_duration_seconds"
+        labels = 'connection="1",task="2"'
+        get_redis.return_value.hgetall.return_value = {
+            f'{name}_count{{{labels}}}'.encode(): b"3",
+            f'{name}_bucket{{{labels},le="+Inf"}}'.encode(): b"3",
+            f'{name}_bucket{{{labels},le="10"}}'.encode(): b"2",
+            f'{name}_bucket{{{labels},le="5"}}'.encode(): b"1",
+            f'{name}_bucket{{{labels},le="0.5"}}'.encode(): b"0",
+            f'{name}_sum{{{labels}}}'.encode(): b"17.25",
+        }
+        lines = render_metrics().splitlines()
+        self.assertEqual(
+            lines,
+            [
+                f"# TYPE {name} histogram",
+                f'{name}_bucket{{{labels},le="0.5"}} 0',
+                f'{name}_bucket{{{labels},le="5"}} 1',
+                f'{name}_bucket{{{labels},le="10"}} 2',
+                f'{name}_bucket{{{labels},le="+Inf"}} 3',
+                f"{name}_sum{{{labels}}} 17.25",
+                f"{name}_count{{{labels}}} 3",
+            ],
+        )
+
+    def test_values_keep_their_precision(self, get_redis):
+        get_redis.return_value.hgetall.return_value = {
+            b'query_rows_total{task="1"}': b"123456789",
+            b'query_result_bytes_total{task="1"}': b"0.123456789",
+        }
+        text = render_metrics()
+        self.assertIn('query_rows_total{task="1"} 123456789\n', text)
+        self.assertIn('query_result_bytes_total{task="1"} 0.123456789\n', text)
+
+
+@mock.patch("tasks.metrics.get_redis")
+class RecordExecutionTests(SimpleTestCase):
+    def test_histogram_buckets_are_cumulative(self, get_redis):
+        pipeline = get_redis.return_value.pipeline.return_value
+        execution = SimpleNamespace(
+            status="SUCCESS",
+            row_count=10,
+            byte_count=None,
+            queue_wait=None,
+            lane="scheduled",
+        )
+        task = SimpleNamespace(id=2, database_connection_id=1)
+        record_execution(execution, task, {"total": 7})
+        recorded = {
+            call.args[1]: call.args[2]
+            for call in pipeline.hincrbyfloat.call_args_list
+        }
+        self.assertTrue(
+            all(
+                call.args[0] == METRICS_KEY
+                for call in pipeline.hincrbyfloat.call_args_list
+            )
+        )
+        name = "query_execution_duration_seconds_bucket"
+        labels = 'connection="1",le="{}",task="2"'
+        self.assertEqual(recorded[f"{name}{{{labels.format(5)}}}"], 0)
+        self.assertEqual(recorded[f"{name}{{{labels.format(10)}}}"], 1)
+        self.assertEqual(recorded[f"{name}{{{labels.format('+Inf')}}}"], 1)
+        self.assertEqual(
+            recorded[
+                'query_executions_total{connection="1",status="SUCCESS",'
+                'task="2"}'
+            ],
+            1,
+        )
+        pipeline.execute.assert_called_once()
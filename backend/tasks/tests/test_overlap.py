@@ -0,0 +1,138 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from tasks.models import DatabaseConnection, ExecutionHistory, Task
+from tasks.tasks import execute_task
+
+
+class OverlapPolicyTests(SimpleTestCase):
+    """
+    Runs execute_task eagerly while another execution of the task,
+    run-a, holds its lock.
+    """
+
+    def setUp(self):
+        self.task = Task(
+            id=1,
+            overlap_policy="skip",
+            database_connection=DatabaseConnection(id=2),
+        )
+        self.holder = ExecutionHistory(
+            id=4, task=self.task, status="PENDING", celery_task_id="run-a"
+        )
+        self.history = ExecutionHistory(
+            id=5, task=self.task, status="PENDING", celery_task_id="run-b"
+        )
+        self.coalesced = mock.MagicMock()
+        self.coalesced.select_related.return_value = []
+        patchers = {
+            "select_related": mock.patch.object(
+                Task.objects, "select_related"
+            ),
+            "get_or_create": mock.patch.object(
+                ExecutionHistory.objects,
+                "get_or_create",
+                return_value=(self.history, True),
+            ),
+            "filter": mock.patch.object(
+                ExecutionHistory.objects, "filter", side_effect=self.filter
+            ),
+            "save": mock.patch.object(ExecutionHistory, "save"),
+            "refresh": mock.patch.object(ExecutionHistory, "refresh_from_db"),
+            "lock": mock.patch("tasks.tasks.TaskLock"),
+            "publish": mock.patch("tasks.tasks.publish_execution_event"),
+            "stats": mock.patch("tasks.tasks.record_execution_stats"),
+            "metrics": mock.patch("tasks.tasks.record_execution"),
+            "run": mock.patch("tasks.tasks._run_and_store"),
+            "guard": mock.patch("tasks.tasks.ExecutionGuard"),
+            "atomic": mock.patch("tasks.tasks.transaction.atomic"),
+            "follow_up": mock.patch.object(
+                execute_task, "signature_from_request"
+            ),
+        }
+        self.mocks = {}
+        for name, patcher in patchers.items():
+            self.mocks[name] = patcher.start()
+            self.addCleanup(patcher.stop)
+        select_related = self.mocks["select_related"]
+        select_related.return_value.get.return_value = self.task
+        self.lock = self.mocks["lock"].return_value
+        self.lock.acquire.return_value = False
+        self.lock.holder.return_value = "run-a"
+
+    def filter(self, **lookup):
+        if "coalesced_into" in lookup:
+            return self.coalesced
+        histories = mock.MagicMock()
+        histories.first.return_value = self.holder
+        return histories
+
+    def run_task(self, policy):
+        self.task.overlap_policy = policy
+        result = execute_task.apply(args=[1], task_id="run-b")
+        self.assertIn(result.state, ("SUCCESS", "IGNORED"), result.result)
+        return result
+
+    def test_skip(self):
+        self.run_task("skip")
+        self.assertEqual(self.history.status, "SKIPPED")
+        self.assertEqual(
+            self.history.error_message,
+            "Execution 4 of the task is still running",
+        )
+        self.mocks["run"].assert_not_called()
+        self.lock.release.assert_not_called()
+        self.mocks["stats"].assert_called_once_with(self.history, self.task)
+
+    def test_queue_schedules_one_follow_up(self):
+        self.lock.claim_follow_up.return_value = True
+        result = self.run_task("queue")
+        self.assertEqual(result.state, "IGNORED")
+        self.assertEqual(self.history.status, "PENDING")
+        follow_up = self.mocks["follow_up"].return_value
+        follow_up.apply_async.assert_called_once()
+        self.mocks["run"].assert_not_called()
+        self.mocks["stats"].assert_not_called()
+
+    def test_queue_skips_when_a_follow_up_is_waiting(self):
+        self.lock.claim_follow_up.return_value = False
+        self.run_task("queue")
+        self.assertEqual(self.history.status, "SKIPPED")
+        self.mocks["follow_up"].return_value.apply_async.assert_not_called()
+
+    def test_coalesce_joins_the_running_execution(self):
+        self.run_task("coalesce")
+        self.assertEqual(self.history.status, "COALESCED")
+        self.assertIs(self.history.coalesced_into, self.holder)
+        self.mocks["run"].assert_not_called()
+        self.coalesced.update.assert_not_called()
+
+    def test_coalesce_after_the_holder_finished(self):
+        self.holder.status = "SUCCESS"
+        self.holder.row_count = 3
+        self.run_task("coalesce")
+        self.assertEqual(self.history.status, "COALESCED")
+        self.assertEqual(
+            self.coalesced.update.call_args.kwargs["row_count"], 3
+        )
+
+    def test_holder_hands_its_outcome_to_coalesced_runs(self):
+        self.lock.acquire.return_value = True
+        coalesced = ExecutionHistory(id=6, task=self.task, status="COALESCED")
+        self.coalesced.select_related.return_value = [coalesced]
+
+        def succeed(task, history, guard):
+            history.status = "SUCCESS"
+            history.row_count = 7
+
+        self.mocks["run"].side_effect = succeed
+        self.run_task("coalesce")
+        self.lock.release.assert_called_once_with()
+        self.assertEqual(
+            self.coalesced.update.call_args.kwargs["row_count"], 7
+        )
+        published = [
+            call.args[0] for call in self.mocks["publish"].call_args_list
+        ]
+        self.assertIn(coalesced, published)
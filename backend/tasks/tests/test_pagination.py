@@ -0,0 +1,51 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from tasks.pagination import decode_cursor, encode_cursor, keyset_page
+
+MOMENT = datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        cursor = encode_cursor(MOMENT, 42)
+        self.assertEqual(decode_cursor(cursor), (MOMENT, 42))
+
+    def test_malformed_cursors(self):
+        for cursor in ("", "not base64!", encode_cursor(MOMENT, 1)[:-4]):
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(ValueError):
+                    decode_cursor(cursor)
+
+
+class KeysetPageTests(SimpleTestCase):
+    def make_queryset(self, items):
+        queryset = mock.MagicMock()
+        ordered = queryset.order_by.return_value
+        ordered.filter.return_value = ordered
+        ordered.__getitem__.side_effect = lambda key: items[key]
+        return queryset, ordered
+
+    def test_next_cursor_points_at_the_last_row(self):
+        items = [
+            SimpleNamespace(id=pk, execution_time=MOMENT) for pk in (3, 2, 1)
+        ]
+        queryset, ordered = self.make_queryset(items)
+        page, next_cursor = keyset_page(queryset, None, 2)
+        self.assertEqual(page, items[:2])
+        self.assertEqual(decode_cursor(next_cursor), (MOMENT, 2))
+        queryset.order_by.assert_called_once_with("-execution_time", "-id")
+        ordered.filter.assert_not_called()
+
+    def test_last_page_has_no_cursor(self):
+        items = [SimpleNamespace(id=1, execution_time=MOMENT)]
+        queryset, ordered = self.make_queryset(items)
+        page, next_cursor = keyset_page(
+            queryset, encode_cursor(MOMENT, 2), 2
+        )
+        self.assertEqual(page, items)
+        self.assertIsNone(next_cursor)
+        ordered.filter.assert_called_once()
@@ -0,0 +1,72 @@
+from unittest import mock
+
+import psycopg2
+import redis
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APIRequestFactory
+
+from tasks.pool import PoolTimeout, SourceConnectionPool
+from tasks.views import CheckDatabaseConnection
+
+
+class FakePool(SourceConnectionPool):
+    def _connect(self, timeout):
+        return mock.Mock(closed=False)
+
+
+@override_settings(SOURCE_POOL_MAX_SIZE=1, SOURCE_POOL_IDLE_TIMEOUT=60)
+@mock.patch("tasks.pool.get_redis")
+class SourceConnectionPoolTests(SimpleTestCase):
+    def test_connection_is_reused(self, get_redis):
+        pool = FakePool(1, {})
+        conn = pool.getconn()
+        pool.putconn(conn)
+        self.assertIs(pool.getconn(), conn)
+        self.assertEqual(pool.get_stats()["reused"], 1)
+        conn.rollback.assert_called_once()
+
+    def test_checkout_times_out_when_the_pool_is_full(self, get_redis):
+        pool = FakePool(1, {})
+        pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn(timeout=0.01)
+        self.assertEqual(pool.get_stats()["waits"], 1)
+
+    def test_failed_connect_frees_the_slot(self, get_redis):
+        pool = FakePool(1, {})
+        with mock.patch.object(
+            pool, "_connect", side_effect=psycopg2.OperationalError
+        ):
+            with self.assertRaises(psycopg2.OperationalError):
+                pool.getconn()
+        self.assertEqual(pool.get_stats()["in_use"], 0)
+
+    def test_idle_connections_are_evicted_without_a_checkout(self, get_redis):
+        pool = FakePool(1, {})
+        conn = pool.getconn()
+        with mock.patch("tasks.pool.time.monotonic", return_value=0):
+            pool.putconn(conn)
+        pool.evict_idle()
+        conn.close.assert_called_once()
+        self.assertEqual(pool.get_stats()["idle"], 0)
+
+
+class CheckDatabaseConnectionTests(SimpleTestCase):
+    @mock.patch("tasks.views.get_pool_stats", side_effect=redis.RedisError)
+    @mock.patch("tasks.views.psycopg2.connect")
+    def test_redis_outage_does_not_fail_the_check(self, connect, stats):
+        request = APIRequestFactory().post(
+            "/check-connection/",
+            {
+                "id": 1,
+                "database_name": "db",
+                "username": "user",
+                "password": "secret",
+                "host": "localhost",
+                "port": 5432,
+            },
+            format="json",
+        )
+        response = CheckDatabaseConnection.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"is_connection_successful": True})
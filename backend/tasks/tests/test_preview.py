@@ -0,0 +1,72 @@
+from collections import namedtuple
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from tasks.models import DatabaseConnection
+from tasks.pool import SourceConnectionPool
+from tasks.preview import PreviewTimeout, preview_query
+
+Column = namedtuple("Column", ["name", "type_code"])
+
+
+@override_settings(PREVIEW_TIMEOUT=2)
+@mock.patch("tasks.preview.get_pool")
+class PreviewQueryTests(SimpleTestCase):
+    def setUp(self):
+        self.conn = mock.MagicMock()
+        self.cursor = self.conn.cursor.return_value.__enter__.return_value
+
+    def use_pool(self, get_pool):
+        connection = get_pool.return_value.connection.return_value
+        connection.__enter__.return_value = self.conn
+
+    def test_returns_at_most_limit_rows(self, get_pool):
+        self.use_pool(get_pool)
+        self.cursor.fetchmany.return_value = [(1,), (2,), (3,)]
+        self.cursor.description = [Column("id", 23)]
+        preview = preview_query(DatabaseConnection(id=1), "SELECT 1", 2)
+        self.assertEqual(
+            preview,
+            {
+                "columns": ["id"],
+                "column_types": ["integer"],
+                "rows": [[1], [2]],
+                "truncated": True,
+            },
+        )
+        self.cursor.fetchmany.assert_called_once_with(3)
+        get_pool.return_value.connection.assert_called_once_with(timeout=2)
+
+    def test_statement_gets_the_remaining_time(self, get_pool):
+        self.use_pool(get_pool)
+        self.cursor.fetchmany.return_value = []
+        self.cursor.description = [Column("id", 23)]
+        with mock.patch(
+            "tasks.preview.time.monotonic", side_effect=[100, 101.5]
+        ):
+            preview_query(DatabaseConnection(id=1), "SELECT 1", 10)
+        sql, params = self.cursor.execute.call_args_list[0].args
+        self.assertIn("statement_timeout", sql)
+        self.assertEqual(params, [500])
+
+    def test_no_time_left_after_connecting(self, get_pool):
+        self.use_pool(get_pool)
+        with mock.patch(
+            "tasks.preview.time.monotonic", side_effect=[100, 103]
+        ), self.assertRaises(PreviewTimeout):
+            preview_query(DatabaseConnection(id=1), "SELECT 1", 10)
+        self.cursor.execute.assert_not_called()
+
+
+class ConnectTimeoutTests(SimpleTestCase):
+    @override_settings(SOURCE_POOL_CONNECT_TIMEOUT=10, SOURCE_POOL_MAX_SIZE=2)
+    def test_connect_timeout_is_bounded_by_the_checkout_timeout(self):
+        pool = SourceConnectionPool(1, {"host": "db"})
+        with mock.patch("tasks.pool.psycopg2.connect") as connect:
+            pool.getconn()
+            pool.getconn(timeout=3)
+        first, second = [call.kwargs for call in connect.call_args_list]
+        self.assertEqual(first["connect_timeout"], 10)
+        self.assertEqual(second["connect_timeout"], 3)
+        self.assertEqual(second["host"], "db")
@@ -0,0 +1,115 @@
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from tasks.encoding import compress, serialize_rows
+from tasks.models import ResultBlob, ResultChunk
+from tasks.partitions import day_start, drop_expired_partitions
+from tasks.results import iter_result_rows, merge_shard_results
+
+Column = namedtuple("Column", ["name", "type_code"])
+
+TODAY = datetime(2024, 3, 10, tzinfo=timezone.utc)
+
+
+class DayStartTests(SimpleTestCase):
+    def test_start_of_utc_day(self):
+        moment = datetime(
+            2024, 3, 10, 1, 30, tzinfo=timezone(timedelta(hours=3))
+        )
+        self.assertEqual(
+            day_start(moment), datetime(2024, 3, 9, tzinfo=timezone.utc)
+        )
+
+
+class IterResultRowsTests(SimpleTestCase):
+    def test_reads_chunks_in_order_from_the_blob_partition(self):
+        types = ["integer"]
+        chunks = {
+            11: ResultChunk(
+                id=11, data=compress(serialize_rows([[1]], types))
+            ),
+            12: ResultChunk(
+                id=12, data=compress(serialize_rows([[2]], types))
+            ),
+        }
+        blob = ResultBlob(
+            column_types=types, chunk_date=TODAY, chunk_ids=[12, 11]
+        )
+        with mock.patch.object(ResultChunk.objects, "filter") as filter_:
+            filter_.return_value.in_bulk.return_value = chunks
+            rows = list(iter_result_rows(blob))
+        self.assertEqual(rows, [[2], [1]])
+        filter_.assert_called_once_with(
+            execution_time=TODAY, id__in=[12, 11]
+        )
+
+
+class MergeShardResultsTests(SimpleTestCase):
+    def test_carries_chunks_forward_to_the_first_shard_day(self):
+        yesterday = TODAY - timedelta(days=1)
+        shards = {
+            1: ResultBlob(
+                id=1,
+                columns=["id"],
+                column_types=["integer"],
+                row_count=2,
+                size=10,
+                chunk_date=TODAY,
+                chunk_ids=[5],
+            ),
+            2: ResultBlob(
+                id=2,
+                columns=["id"],
+                column_types=["integer"],
+                row_count=3,
+                size=20,
+                chunk_date=yesterday,
+                chunk_ids=[3, 4],
+            ),
+        }
+        with mock.patch.object(
+            ResultBlob.objects, "in_bulk", return_value=shards
+        ), mock.patch.object(ResultBlob.objects, "filter"), mock.patch(
+            "tasks.results.carry_forward_chunks", return_value=[6, 7]
+        ) as carry_forward, mock.patch(
+            "tasks.results._save_blob", side_effect=lambda blob, _: blob
+        ):
+            merged = merge_shard_results([(1, "a" * 64), (2, "b" * 64)])
+        carry_forward.assert_called_once_with([3, 4], yesterday, TODAY)
+        self.assertEqual(merged.chunk_ids, [5, 6, 7])
+        self.assertEqual(merged.chunk_date, TODAY)
+        self.assertEqual(merged.row_count, 5)
+        self.assertEqual(merged.size, 30)
+
+
+class DropExpiredPartitionsTests(SimpleTestCase):
+    @mock.patch("tasks.partitions.transaction.atomic")
+    @mock.patch("tasks.partitions.datetime")
+    def test_expires_results_before_dropping_their_partition(
+        self, datetime_, atomic
+    ):
+        datetime_.now.return_value = TODAY + timedelta(days=30)
+        datetime_.side_effect = datetime
+        datetime_.strptime = datetime.strptime
+        cursor = mock.Mock()
+        cursor.fetchall.return_value = [
+            ("query_results_p20240309",),
+            ("query_results_p20240310",),
+        ]
+        cursor.fetchone.return_value = (None,)
+        with self.settings(RESULT_RETENTION_DAYS=30):
+            dropped = drop_expired_partitions(cursor)
+        self.assertEqual(dropped, ["query_results_p20240309"])
+        statements = [call.args[0] for call in cursor.execute.call_args_list]
+        expire, detach, drop = statements[1:4]
+        self.assertIn("SET result_id = NULL", expire)
+        self.assertIn("DELETE FROM", expire)
+        self.assertEqual(
+            cursor.execute.call_args_list[1].args[1],
+            [TODAY - timedelta(days=1)] * 2,
+        )
+        self.assertIn('DETACH PARTITION "query_results_p20240309"', detach)
+        self.assertIn('DROP TABLE "query_results_p20240309"', drop)
@@ -0,0 +1,56 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from tasks.results import create_result_table, ensure_results_schema
+
+
+@override_settings(RESULT_TABLE_NAME="results")
+class CreateResultTableTests(SimpleTestCase):
+    def queries(self, cursor):
+        return [call.args[0] for call in cursor.execute.call_args_list]
+
+    def test_creates_a_partitioned_table(self):
+        cursor = mock.Mock()
+        cursor.fetchone.return_value = None
+        create_result_table(cursor)
+        query = self.queries(cursor)[-1]
+        self.assertIn('CREATE TABLE IF NOT EXISTS "results"', query)
+        self.assertIn("PARTITION BY RANGE (execution_time)", query)
+
+    def test_keeps_an_unpartitioned_table_as_legacy(self):
+        cursor = mock.Mock()
+        cursor.fetchone.return_value = ("r",)
+        create_result_table(cursor)
+        self.assertIn(
+            'RENAME TO "results_legacy"', self.queries(cursor)[1]
+        )
+
+    def test_leaves_a_partitioned_table_alone(self):
+        cursor = mock.Mock()
+        cursor.fetchone.return_value = ("p",)
+        create_result_table(cursor)
+        self.assertEqual(len(self.queries(cursor)), 2)
+        self.assertNotIn("DROP", " ".join(self.queries(cursor)))
+
+
+@override_settings(RESULT_TABLE_NAME="results")
+@mock.patch("tasks.results.transaction.atomic")
+class EnsureResultsSchemaTests(SimpleTestCase):
+    @mock.patch("tasks.results.ensure_partitions")
+    @mock.patch("tasks.results.create_result_table")
+    def test_runs_every_step_under_an_advisory_lock(
+        self, create, partitions, atomic
+    ):
+        calls = mock.Mock()
+        cursor = mock.Mock()
+        calls.attach_mock(cursor.execute, "execute")
+        calls.attach_mock(create, "create")
+        calls.attach_mock(partitions, "partitions")
+        ensure_results_schema(cursor)
+        self.assertEqual(
+            [call[0] for call in calls.mock_calls],
+            ["execute", "create", "partitions"],
+        )
+        self.assertIn("pg_advisory_xact_lock", cursor.execute.call_args[0][0])
+        atomic.assert_called_once_with()
@@ -0,0 +1,83 @@
+from unittest import mock
+
+from django.db.models import ProtectedError
+from django.test import SimpleTestCase
+
+from tasks import retention
+from tasks.models import ExecutionHistory, ResultBlob, Task
+
+
+def _cursor(connection, rows=()):
+    cursor = connection.cursor.return_value.__enter__.return_value
+    cursor.fetchall.side_effect = [list(batch) for batch in rows]
+    return cursor
+
+
+@mock.patch("tasks.retention.transaction.atomic")
+class DeleteBatchTests(SimpleTestCase):
+    @mock.patch.object(ExecutionHistory.objects, "filter")
+    def test_deletes_executions(self, filter_, atomic):
+        filter_.return_value.delete.return_value = (
+            2, {"tasks.ExecutionHistory": 2}
+        )
+        task = Task(id=1, materialize_results=False)
+        self.assertEqual(retention._delete_batch(task, [1, 2]), 2)
+        filter_.assert_called_once_with(id__in=[1, 2])
+
+    @mock.patch("tasks.retention.connection")
+    @mock.patch.object(ExecutionHistory.objects, "filter")
+    def test_deletes_materialized_rows_too(self, filter_, connection, _):
+        filter_.return_value.delete.return_value = (0, {})
+        cursor = _cursor(connection)
+        cursor.fetchone.return_value = ["task_1_results"]
+        task = Task(id=1, materialize_results=True)
+        retention._delete_batch(task, [1, 2])
+        query, params = cursor.execute.call_args.args
+        self.assertIn("_execution_id = ANY(%s)", query)
+        self.assertEqual(params, [[1, 2]])
+
+    @mock.patch("tasks.retention.connection")
+    @mock.patch.object(ExecutionHistory.objects, "filter")
+    def test_skips_missing_materialized_table(
+        self, filter_, connection, _
+    ):
+        filter_.return_value.delete.return_value = (0, {})
+        cursor = _cursor(connection)
+        cursor.fetchone.return_value = [None]
+        retention._delete_batch(Task(id=1, materialize_results=True), [1])
+        self.assertEqual(cursor.execute.call_count, 1)
+
+
+@mock.patch("tasks.retention.transaction.atomic")
+@mock.patch("tasks.retention.connection")
+class CollectUnreferencedBlobsTests(SimpleTestCase):
+    @mock.patch.object(ResultBlob.objects, "filter")
+    def test_deletes_batches_until_none_are_left(
+        self, filter_, connection, _
+    ):
+        _cursor(connection, [[(1,), (2,)], [(3,)], []])
+        filter_.return_value.delete.side_effect = [
+            (2, {"tasks.ResultBlob": 2}),
+            (1, {"tasks.ResultBlob": 1}),
+        ]
+        self.assertEqual(retention.collect_unreferenced_blobs(2), 3)
+
+    @mock.patch.object(ResultBlob.objects, "filter")
+    def test_stops_when_a_blob_was_picked_up(self, filter_, connection, _):
+        _cursor(connection, [[(1,)]])
+        filter_.return_value.delete.side_effect = ProtectedError(
+            "referenced", set()
+        )
+        self.assertEqual(retention.collect_unreferenced_blobs(2), 0)
+
+
+class PruneAllTests(SimpleTestCase):
+    @mock.patch("tasks.retention.collect_unreferenced_blobs", return_value=4)
+    @mock.patch("tasks.retention.prune_task_history", side_effect=[2, 3])
+    @mock.patch.object(Task.objects, "filter")
+    def test_sums_pruned_executions(self, filter_, prune, collect):
+        filter_.return_value.iterator.return_value = [Task(id=1), Task(id=2)]
+        self.assertEqual(
+            retention.prune_all(), {"executions": 5, "results": 4}
+        )
+        self.assertEqual(prune.call_count, 2)
@@ -0,0 +1,66 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APIRequestFactory
+
+from tasks.models import DatabaseConnection, ExecutionHistory, Task
+from tasks.routing import route_task
+from tasks.views import RunTask
+
+
+@override_settings(INTERACTIVE_QUEUE="interactive")
+@mock.patch.object(DatabaseConnection.objects, "filter")
+class RouteTaskTests(SimpleTestCase):
+    def route(self, filter_, queue, name="tasks.tasks.execute_task", **kw):
+        values_list = filter_.return_value.values_list.return_value
+        values_list.first.return_value = queue
+        return route_task(name, [1], kw, {})
+
+    def test_connection_queue(self, filter_):
+        self.assertEqual(self.route(filter_, "reports"), {"queue": "reports"})
+        filter_.assert_called_once_with(tasks__id=1)
+
+    def test_default_queue(self, filter_):
+        self.assertIsNone(self.route(filter_, ""))
+
+    def test_interactive_lane(self, filter_):
+        self.assertEqual(
+            self.route(filter_, "reports", lane="interactive"),
+            {"queue": "reports.interactive"},
+        )
+        self.assertEqual(
+            self.route(filter_, None, lane="interactive"),
+            {"queue": "interactive"},
+        )
+
+    def test_other_tasks_are_not_routed(self, filter_):
+        self.assertIsNone(
+            self.route(filter_, "reports", name="tasks.tasks.merge_shards")
+        )
+        filter_.assert_not_called()
+
+
+@mock.patch("tasks.views.publish_execution_event")
+@mock.patch("tasks.views.execute_task")
+@mock.patch.object(ExecutionHistory.objects, "create")
+@mock.patch("tasks.views.get_object_or_404")
+class RunTaskTests(SimpleTestCase):
+    def test_execution_is_recorded_before_dispatch(
+        self, get_object, create, execute_task, publish
+    ):
+        get_object.return_value = Task(id=3, name="report")
+        calls = mock.Mock()
+        calls.attach_mock(create, "create")
+        calls.attach_mock(execute_task.apply_async, "apply_async")
+        request = APIRequestFactory().post("/tasks/3/run/")
+        response = RunTask.as_view()(request, task_id=3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [call[0] for call in calls.mock_calls], ["create", "apply_async"]
+        )
+        celery_task_id = create.call_args.kwargs["celery_task_id"]
+        self.assertEqual(create.call_args.kwargs["lane"], "interactive")
+        execute_task.apply_async.assert_called_once_with(
+            (3,), {"lane": "interactive"}, task_id=celery_task_id
+        )
+        publish.assert_called_once_with(create.return_value)
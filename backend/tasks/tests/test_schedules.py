@@ -0,0 +1,23 @@
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase
+
+from tasks.models import Task
+
+
+class ScheduleValidationTests(SimpleTestCase):
+    def test_valid_schedule(self):
+        Task(name="report", query="SELECT 1", schedule="*/5 * * * *").clean()
+
+    def test_wrong_number_of_fields(self):
+        task = Task(name="report", query="SELECT 1", schedule="* * *")
+        with self.assertRaises(ValidationError) as cm:
+            task.clean()
+        self.assertIn("schedule", cm.exception.message_dict)
+
+    def test_unparsable_field(self):
+        for schedule in ("abc * * * *", "61 * * * *", "* * * 13 *"):
+            with self.subTest(schedule=schedule):
+                task = Task(name="report", query="SELECT 1", schedule=schedule)
+                with self.assertRaises(ValidationError) as cm:
+                    task.clean()
+                self.assertIn("schedule", cm.exception.message_dict)
@@ -0,0 +1,227 @@
+from unittest import mock
+
+from celery.exceptions import Retry
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase
+
+from tasks.guards import ExecutionCancelled
+from tasks.importer import TaskImportSerializer
+from tasks.models import (
+    DatabaseConnection,
+    ExecutionHistory,
+    ResultBlob,
+    Task,
+)
+from tasks.tasks import execute_shard, fail_sharded_execution, merge_shards
+
+
+def make_task(**kwargs):
+    fields = {
+        "name": "orders",
+        "query": "SELECT * FROM orders;",
+        "schedule": "0 * * * *",
+        "shard_key": "id",
+        "shard_count": 4,
+    }
+    fields.update(kwargs)
+    return Task(**fields)
+
+
+class ShardQueryTests(SimpleTestCase):
+    def test_shard_selects_its_slice_of_the_key_hash(self):
+        query, params = make_task(shard_key='odd"key').get_query(2)
+        self.assertEqual(
+            query,
+            "SELECT * FROM (SELECT * FROM orders) AS shard_source "
+            'WHERE (hashtext(shard_source."odd""key"::text) & 2147483647) '
+            "% 4 = 2",
+        )
+        self.assertIsNone(params)
+
+    def test_is_sharded(self):
+        self.assertTrue(make_task().is_sharded)
+        self.assertFalse(make_task(shard_count=1).is_sharded)
+
+
+class ShardValidationTests(SimpleTestCase):
+    def test_shard_key_is_required(self):
+        with self.assertRaises(ValidationError) as cm:
+            make_task(shard_key="").clean()
+        self.assertIn("shard_key", cm.exception.message_dict)
+
+    def test_sharded_tasks_cant_be_materialized_or_incremental(self):
+        for changes in (
+            {"materialize_results": True},
+            {"watermark_column": "updated"},
+        ):
+            with self.subTest(**changes):
+                with self.assertRaises(ValidationError) as cm:
+                    make_task(**changes).clean()
+                self.assertIn("shard_count", cm.exception.message_dict)
+
+    def test_sharded_tasks_cant_limit_their_result(self):
+        for changes in ({"max_rows": 100}, {"max_result_bytes": 1024}):
+            with self.subTest(**changes):
+                with self.assertRaises(ValidationError) as cm:
+                    make_task(**changes).clean()
+                self.assertIn("shard_count", cm.exception.message_dict)
+
+    def test_bulk_import_validates_sharding(self):
+        serializer = TaskImportSerializer(
+            data=[
+                {
+                    "name": "orders",
+                    "query": "SELECT * FROM orders",
+                    "schedule": "0 * * * *",
+                    "database_connection": 1,
+                    "shard_count": 4,
+                },
+                {
+                    "name": "customers",
+                    "query": "SELECT * FROM customers",
+                    "schedule": "bad",
+                    "database_connection": 1,
+                },
+            ],
+            many=True,
+        )
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("shard_key", serializer.errors[0])
+        self.assertIn("schedule", serializer.errors[1])
+
+
+def shard_result(blob, fetch):
+    return {
+        "blob": blob,
+        "hash": f"hash{blob}",
+        "truncated": False,
+        "timings": {"fetch": fetch, "total": 10.0},
+    }
+
+
+@mock.patch("tasks.tasks._finish_sharded")
+@mock.patch("tasks.tasks.transaction.atomic")
+@mock.patch.object(Task.objects, "filter")
+@mock.patch.object(ExecutionHistory, "refresh_from_db")
+@mock.patch.object(ExecutionHistory, "save")
+@mock.patch.object(ExecutionHistory.objects, "get")
+@mock.patch.object(Task.objects, "select_related")
+class MergeShardsTests(SimpleTestCase):
+    def setUp(self):
+        self.task = make_task(id=1)
+        self.history = ExecutionHistory(id=5, status="PENDING")
+
+    def merge(self, select_related, get, merge_shard_results):
+        select_related.return_value.get.return_value = self.task
+        get.return_value = self.history
+        with mock.patch(
+            "tasks.tasks.merge_shard_results", merge_shard_results
+        ):
+            merge_shards(
+                [shard_result(1, 0.5), shard_result(2, 0.25)], 1, 5, 0.0
+            )
+
+    def test_merges_the_shards_into_the_execution(
+        self, select_related, get, save, refresh, filter_, atomic, finish
+    ):
+        merged = ResultBlob(id=9, row_count=10, size=100)
+        self.merge(select_related, get, mock.Mock(return_value=merged))
+        self.assertIs(self.history.result, merged)
+        self.assertEqual(self.history.status, "SUCCESS")
+        self.assertEqual(self.history.row_count, 10)
+        filter_.assert_called_once_with(id=1)
+        task, history, timings = finish.call_args.args
+        self.assertEqual((task, history), (self.task, self.history))
+        self.assertEqual(timings["fetch"], 0.75)
+        self.assertIn("merge", timings)
+        self.assertGreater(timings["total"], 0)
+
+    def test_failed_merge_fails_the_execution(
+        self, select_related, get, save, refresh, filter_, atomic, finish
+    ):
+        with self.assertRaises(RuntimeError):
+            self.merge(
+                select_related,
+                get,
+                mock.Mock(side_effect=RuntimeError("merge failed")),
+            )
+        self.assertEqual(self.history.status, "FAILURE")
+        self.assertEqual(self.history.error_message, "merge failed")
+        finish.assert_called_once()
+
+
+@mock.patch("tasks.tasks._finish_sharded")
+@mock.patch.object(ExecutionHistory, "save")
+@mock.patch.object(ExecutionHistory.objects, "select_related")
+class FailShardedExecutionTests(SimpleTestCase):
+    def fail(self, select_related, status, cancelled=False):
+        history = ExecutionHistory(
+            id=5, status=status, celery_task_id="run-a", task=make_task()
+        )
+        select_related.return_value.get.return_value = history
+        with mock.patch("tasks.tasks.is_cancelled", return_value=cancelled):
+            fail_sharded_execution(None, RuntimeError("boom"), None, 5)
+        return history
+
+    def test_marks_the_execution_failed(self, select_related, save, finish):
+        history = self.fail(select_related, "PENDING")
+        self.assertEqual(history.status, "FAILURE")
+        self.assertEqual(history.error_message, "boom")
+        finish.assert_called_once_with(history.task, history, {})
+
+    def test_cancelled_execution(self, select_related, save, finish):
+        history = self.fail(select_related, "RETRY", cancelled=True)
+        self.assertEqual(history.status, "CANCELLED")
+
+    def test_keeps_a_shard_outcome(self, select_related, save, finish):
+        history = self.fail(select_related, "TIMEOUT")
+        self.assertEqual(history.status, "TIMEOUT")
+        save.assert_not_called()
+        finish.assert_called_once()
+
+
+@mock.patch("tasks.tasks.transaction.atomic")
+@mock.patch("tasks.tasks.get_pool")
+@mock.patch("tasks.tasks.ExecutionGuard")
+@mock.patch.object(Task.objects, "select_related")
+class ExecuteShardTests(SimpleTestCase):
+    def setUp(self):
+        self.task = make_task(
+            id=1,
+            max_retries=2,
+            database_connection=DatabaseConnection(id=2),
+        )
+
+    def run_shard(self, select_related, error):
+        select_related.return_value.get.return_value = self.task
+        with mock.patch("tasks.tasks.store_shard_results", side_effect=error):
+            execute_shard.run(1, "run-a", 3)
+
+    @mock.patch.object(
+        execute_shard, "retry", side_effect=lambda **kwargs: Retry()
+    )
+    def test_failed_shard_is_retried(
+        self, retry, select_related, guard, get_pool, atomic
+    ):
+        error = RuntimeError("connection lost")
+        with self.assertRaises(Retry):
+            self.run_shard(select_related, error)
+        self.assertIs(retry.call_args.kwargs["exc"], error)
+        self.assertEqual(retry.call_args.kwargs["max_retries"], 2)
+        guard.assert_called_once_with(self.task, "run-a", slot="shard_3")
+        guard.return_value.finish.assert_called_once()
+
+    def test_aborted_shard_finishes_the_execution(
+        self, select_related, guard, get_pool, atomic
+    ):
+        with mock.patch.object(ExecutionHistory.objects, "filter") as filter_:
+            with self.assertRaises(ExecutionCancelled):
+                self.run_shard(
+                    select_related, ExecutionCancelled("cancelled")
+                )
+        filter_.assert_called_once_with(
+            celery_task_id="run-a", status__in=("PENDING", "RETRY")
+        )
+        filter_.return_value.update.assert_called_once_with(
+            status="CANCELLED", error_message="cancelled"
+        )
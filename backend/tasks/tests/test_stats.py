@@ -0,0 +1,65 @@
+from django.test import SimpleTestCase
+
+from tasks.metrics import DURATION_BUCKETS
+from tasks.models import ExecutionStats
+from tasks.stats import _bucket_counts, summarize
+
+
+def make_row(durations, **counters):
+    buckets = [0] * (len(DURATION_BUCKETS) + 1)
+    for duration in durations:
+        for index, count in enumerate(_bucket_counts(duration)):
+            buckets[index] += count
+    fields = {
+        "executions": len(durations),
+        "successes": len(durations),
+        "failures": 0,
+        "cancellations": 0,
+        "skips": 0,
+        "duration_sum": sum(durations),
+        "duration_max": max(durations, default=0),
+        "duration_buckets": buckets,
+        "row_count": 0,
+        "byte_count": 0,
+        "max_failure_streak": 0,
+    }
+    fields.update(counters)
+    return ExecutionStats(**fields)
+
+
+class BucketCountsTests(SimpleTestCase):
+    def test_duration_lands_in_its_bucket(self):
+        counts = _bucket_counts(0.07)
+        self.assertEqual(counts.index(1), DURATION_BUCKETS.index(0.1))
+        self.assertEqual(sum(counts), 1)
+
+    def test_overflow_and_missing_duration(self):
+        self.assertEqual(_bucket_counts(10**6)[-1], 1)
+        self.assertEqual(sum(_bucket_counts(None)), 0)
+
+
+class SummarizeTests(SimpleTestCase):
+    def test_totals_and_rates(self):
+        summary = summarize(
+            [
+                make_row([1, 2], failures=1, max_failure_streak=1),
+                make_row([4], max_failure_streak=3),
+            ]
+        )
+        self.assertEqual(summary["executions"], 3)
+        self.assertEqual(summary["success_rate"], round(3 / 4, 4))
+        self.assertEqual(summary["duration_avg"], 7 / 3)
+        self.assertEqual(summary["duration_max"], 4)
+        self.assertEqual(summary["max_failure_streak"], 3)
+
+    def test_percentiles_stay_within_the_maximum(self):
+        summary = summarize([make_row([0.2] * 98 + [4000, 5000])])
+        self.assertLessEqual(summary["duration_p50"], 0.5)
+        self.assertGreater(summary["duration_p50"], 0.1)
+        self.assertLessEqual(summary["duration_p99"], 5000)
+        self.assertGreater(summary["duration_p99"], 3600)
+
+    def test_no_executions(self):
+        summary = summarize([])
+        self.assertIsNone(summary["success_rate"])
+        self.assertIsNone(summary["duration_p50"])
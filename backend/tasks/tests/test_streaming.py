@@ -0,0 +1,51 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from tasks.results import store_results, store_streamed_results
+
+
+def _task(fetch_size=2):
+    task = mock.Mock(id=7, fetch_size=fetch_size)
+    task.get_query.return_value = ("SELECT 1", [])
+    return task
+
+
+@mock.patch("tasks.results.ResultWriter")
+class StoreStreamedResultsTests(SimpleTestCase):
+    def setUp(self):
+        self.source_conn = mock.MagicMock()
+        cursor = self.source_conn.cursor.return_value.__enter__.return_value
+        self.cursor = cursor
+
+    def test_writes_every_batch_from_a_server_side_cursor(self, writer):
+        self.cursor.fetchmany.side_effect = [[(1,), (2,)], [(3,)], []]
+        writer.return_value.write.return_value = True
+        result = store_streamed_results(_task(), self.source_conn)
+        self.assertIs(result, writer.return_value.finish.return_value)
+        name = self.source_conn.cursor.call_args.kwargs["name"]
+        self.assertTrue(name.startswith("task_7_"))
+        self.assertEqual(self.cursor.itersize, 2)
+        self.cursor.fetchmany.assert_called_with(2)
+        self.assertEqual(
+            writer.return_value.write.call_args_list,
+            [mock.call([(1,), (2,)]), mock.call([(3,)])],
+        )
+
+    def test_stops_fetching_once_the_writer_is_full(self, writer):
+        self.cursor.fetchmany.side_effect = [[(1,), (2,)], [(3,)], []]
+        writer.return_value.write.return_value = False
+        store_streamed_results(_task(), self.source_conn)
+        self.assertEqual(self.cursor.fetchmany.call_count, 1)
+        writer.return_value.finish.assert_called_once_with()
+
+
+@mock.patch("tasks.results.ResultWriter")
+class StoreResultsTests(SimpleTestCase):
+    def test_writes_fetched_rows_in_batches(self, writer):
+        writer.return_value.write.return_value = True
+        store_results(_task(), [], [(1,), (2,), (3,)])
+        self.assertEqual(
+            writer.return_value.write.call_args_list,
+            [mock.call([(1,), (2,)]), mock.call([(3,)])],
+        )
@@ -1,30 +1,82 @@
 from django.urls import path
 from .views import (
     CreateTask,
+    ImportTasks,
     TaskList,
     TaskDetail,
     RunTask,
+    RunTaskBatch,
+    RunTaskBatchStatus,
     ExecutionHistoryList,
+    ExecutionHistoryDetail,
+    ExecutionEvents,
+    CancelExecution,
+    ExportExecution,
+    ExportTask,
+    TaskStats,
     CheckDatabaseConnection,
+    PreviewQuery,
     DatabaseConnectionList,
+    DatabaseConnectionStats,
+    Metrics,
 )
 
 urlpatterns = [
     path("tasks/", TaskList.as_view(), name="task-list"),
     path("tasks/create/", CreateTask.as_view(), name="task-create"),
+    path("tasks/import/", ImportTasks.as_view(), name="task-import"),
     path("tasks/<int:task_id>/", TaskDetail.as_view(), name="task-detail"),
     path("tasks/<int:task_id>/run/", RunTask.as_view(), name="task-run"),
+    path(
+        "tasks/<int:task_id>/export/", ExportTask.as_view(), name="task-export"
+    ),
+    path(
+        "tasks/<int:task_id>/stats/", TaskStats.as_view(), name="task-stats"
+    ),
+    path("tasks/run/", RunTaskBatch.as_view(), name="task-run-batch"),
+    path(
+        "tasks/run/<str:group_id>/",
+        RunTaskBatchStatus.as_view(),
+        name="task-run-batch-status",
+    ),
     path(
         "executions/", ExecutionHistoryList.as_view(), name="execution-history"
     ),
+    path(
+        "executions/events/",
+        ExecutionEvents.as_view(),
+        name="execution-events",
+    ),
+    path(
+        "executions/<int:execution_id>/",
+        ExecutionHistoryDetail.as_view(),
+        name="execution-detail",
+    ),
+    path(
+        "executions/<int:execution_id>/cancel/",
+        CancelExecution.as_view(),
+        name="execution-cancel",
+    ),
+    path(
+        "executions/<int:execution_id>/export/",
+        ExportExecution.as_view(),
+        name="execution-export",
+    ),
     path(
         "check-connection/",
         CheckDatabaseConnection.as_view(),
         name="check-connection",
     ),
+    path("preview/", PreviewQuery.as_view(), name="query-preview"),
     path(
         "database-connections/",
         DatabaseConnectionList.as_view(),
         name="database-connections",
     ),
+    path(
+        "database-connections/<int:connection_id>/stats/",
+        DatabaseConnectionStats.as_view(),
+        name="database-connection-stats",
+    ),
+    path("metrics/", Metrics.as_view(), name="metrics"),
 ]
@@ -1,15 +1,49 @@
 import psycopg2
+import redis
+from psycopg2.errors import QueryCanceled
+from celery import group
+from celery.result import GroupResult
+from celery.utils import uuid
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import serializers, status
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.db.models import Count
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views import View
 from .models import Task, ExecutionHistory, DatabaseConnection
 from .serializers import (
     TaskSerializer,
     DatabaseConnectionSerializer,
     ExecutionHistorySerializer,
+    ExecutionHistoryListSerializer,
 )
 from .tasks import execute_task
+from .pool import PoolTimeout, get_pool_stats
+from .breaker import CircuitBreaker, CircuitOpen
+from .preview import PreviewTimeout, preview_query
+from .pagination import keyset_page
+from .importer import import_tasks
+from .guards import cancel_execution
+from .retention import ACTIVE_STATUSES
+from .metrics import render_metrics
+from .events import (
+    publish_execution_event,
+    publish_execution_events,
+    stream_execution_events,
+)
+from .stats import DEFAULT_RANGES, stats_queryset, summarize
+from .export import (
+    RENDERERS,
+    aiter_blocks,
+    encode_blocks,
+    iter_blob_export,
+    iter_materialized_export,
+)
 
 
 class CreateTask(APIView):
@@ -24,6 +58,18 @@ class CreateTask(APIView):
             )
 
 
+class ImportTasks(APIView):
+    def post(self, request):
+        try:
+            tasks = import_tasks(request.data)
+        except serializers.ValidationError as e:
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {"ids": [task.id for task in tasks]},
+            status=status.HTTP_201_CREATED,
+        )
+
+
 class TaskList(APIView):
     def get(self, request):
         tasks = Task.objects.all()
@@ -54,12 +100,17 @@ class TaskDetail(APIView):
 class RunTask(APIView):
     def post(self, request, task_id):
         task = get_object_or_404(Task, id=task_id)
-        celery_result = execute_task.delay(task.id)
-        ExecutionHistory.objects.create(
+        celery_task_id = uuid()
+        execution_history = ExecutionHistory.objects.create(
             task=task,
             status="PENDING",
-            celery_task_id=celery_result.id,
+            celery_task_id=celery_task_id,
             retry_count=0,
+            lane="interactive",
+        )
+        publish_execution_event(execution_history)
+        execute_task.apply_async(
+            (task.id,), {"lane": "interactive"}, task_id=celery_task_id
         )
         return Response(
             {"message": f'Запрос "{task.name}" успешно запущен.'},
@@ -67,13 +118,309 @@ class RunTask(APIView):
         )
 
 
+class RunTaskBatch(APIView):
+    FILTER_FIELDS = ("task_ids", "database_connection", "is_active")
+
+    def post(self, request):
+        data = request.data
+        if not any(field in data for field in self.FILTER_FIELDS):
+            return Response(
+                {"error": "Укажите task_ids или фильтр запросов."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        tasks = Task.objects.all()
+        try:
+            if "task_ids" in data:
+                tasks = tasks.filter(id__in=[int(i) for i in data["task_ids"]])
+            if "database_connection" in data:
+                tasks = tasks.filter(
+                    database_connection_id=int(data["database_connection"])
+                )
+            if "is_active" in data:
+                is_active = serializers.BooleanField().to_internal_value(
+                    data["is_active"]
+                )
+                tasks = tasks.filter(is_active=is_active)
+        except (TypeError, ValueError, serializers.ValidationError):
+            return Response(
+                {"error": "Неверные параметры запроса."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        tasks = list(tasks.only("id", "name"))
+        if not tasks:
+            return Response(
+                {"error": "Не найдено ни одного запроса."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        signatures = [
+            execute_task.s(task.id).set(task_id=uuid()) for task in tasks
+        ]
+        histories = ExecutionHistory.objects.bulk_create(
+            [
+                ExecutionHistory(
+                    task=task,
+                    status="PENDING",
+                    celery_task_id=signature.options["task_id"],
+                    retry_count=0,
+                )
+                for task, signature in zip(tasks, signatures)
+            ]
+        )
+        publish_execution_events(histories)
+        group_result = group(signatures).apply_async()
+        group_result.save()
+        return Response(
+            {"group_id": group_result.id, "count": len(tasks)},
+            status=status.HTTP_200_OK,
+        )
+
+
+class RunTaskBatchStatus(APIView):
+    def get(self, request, group_id):
+        group_result = GroupResult.restore(group_id)
+        if group_result is None:
+            return Response(
+                {"error": "Группа запусков не найдена."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        celery_task_ids = [child.id for child in group_result.results]
+        counts = dict(
+            ExecutionHistory.objects.filter(celery_task_id__in=celery_task_ids)
+            .values_list("status")
+            .annotate(count=Count("id"))
+        )
+        finished = sum(
+            count
+            for status_name, count in counts.items()
+            if status_name not in ACTIVE_STATUSES
+        )
+        return Response(
+            {
+                "group_id": group_id,
+                "total": len(celery_task_ids),
+                "statuses": counts,
+                "completed": finished == len(celery_task_ids),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
 class ExecutionHistoryList(APIView):
     def get(self, request):
-        histories = ExecutionHistory.objects.all()
-        serializer = ExecutionHistorySerializer(histories, many=True)
+        params = request.query_params
+        histories = ExecutionHistory.objects.select_related("task").defer(
+            "result_data"
+        )
+        if params.get("status"):
+            histories = histories.filter(status=params["status"])
+        for param, lookup in (
+            ("since", "execution_time__gte"),
+            ("until", "execution_time__lt"),
+        ):
+            if params.get(param):
+                value = parse_datetime(params[param])
+                if value is None:
+                    return Response(
+                        {param: "Неверный формат даты."},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                histories = histories.filter(**{lookup: value})
+        try:
+            if params.get("task"):
+                histories = histories.filter(task_id=int(params["task"]))
+            page_size = min(
+                int(params.get("limit", settings.EXECUTION_HISTORY_PAGE_SIZE)),
+                settings.EXECUTION_HISTORY_MAX_PAGE_SIZE,
+            )
+            items, next_cursor = keyset_page(
+                histories, params.get("cursor"), max(page_size, 1)
+            )
+        except ValueError:
+            return Response(
+                {"error": "Неверные параметры запроса."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        serializer = ExecutionHistoryListSerializer(items, many=True)
+        return Response(
+            {"results": serializer.data, "next": next_cursor},
+            status=status.HTTP_200_OK,
+        )
+
+
+class ExecutionEvents(View):
+    """
+    Streams execution state changes as server-sent events, for all
+    tasks or for the one given in ?task=. Needs the ASGI server.
+    """
+
+    async def get(self, request):
+        task_id = request.GET.get("task")
+        if task_id is not None and not task_id.isdigit():
+            return HttpResponse(
+                "Некорректный идентификатор задачи.", status=400
+            )
+        response = StreamingHttpResponse(
+            stream_execution_events(task_id), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+class ExecutionHistoryDetail(APIView):
+    def get(self, request, execution_id):
+        history = get_object_or_404(
+            ExecutionHistory.objects.select_related(
+                "task", "task__database_connection", "result"
+            ),
+            id=execution_id,
+        )
+        serializer = ExecutionHistorySerializer(history)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+def _export_response(request, rows, filename):
+    export_type = request.query_params.get("type", "csv")
+    if export_type not in RENDERERS:
+        return Response(
+            {"error": "Неизвестный формат выгрузки."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    render, content_type = RENDERERS[export_type]
+    compress = request.query_params.get("gzip") in ("1", "true")
+    filename = f"{filename}.{export_type}"
+    if compress:
+        filename += ".gz"
+        content_type = "application/gzip"
+    blocks = encode_blocks(render(rows), compress)
+    if isinstance(request._request, ASGIRequest):
+        blocks = aiter_blocks(blocks)
+    response = StreamingHttpResponse(blocks, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+class ExportExecution(APIView):
+    def get(self, request, execution_id):
+        history = get_object_or_404(
+            ExecutionHistory.objects.select_related("task", "result"),
+            id=execution_id,
+        )
+        if history.result is not None:
+            rows = iter_blob_export(history.result)
+        elif history.task.materialize_results and history.result_data:
+            # Coalesced executions share the rows of the one they joined.
+            rows = iter_materialized_export(
+                history.task, history.coalesced_into_id or history.id
+            )
+        else:
+            return Response(
+                {"error": "У запуска нет сохранённого результата."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return _export_response(request, rows, f"execution_{history.id}")
+
+
+class ExportTask(APIView):
+    def get(self, request, task_id):
+        task = get_object_or_404(Task, id=task_id)
+        if task.materialize_results and task.watermark_column:
+            # Incremental runs add to the rows loaded by earlier ones.
+            rows = iter_materialized_export(task)
+            return _export_response(request, rows, f"task_{task.id}")
+
+        executions = task.executions.filter(status__in=["SUCCESS", "PARTIAL"])
+        if task.materialize_results:
+            executions = executions.filter(result_data__isnull=False)
+        else:
+            executions = executions.filter(
+                result__isnull=False
+            ).select_related("result")
+        history = executions.order_by("-execution_time", "-id").first()
+        if history is None:
+            return Response(
+                {"error": "У запроса нет сохранённых результатов."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        if task.materialize_results:
+            rows = iter_materialized_export(task, history.id)
+        else:
+            rows = iter_blob_export(history.result)
+        return _export_response(request, rows, f"task_{task.id}")
+
+
+class CancelExecution(APIView):
+    def post(self, request, execution_id):
+        history = get_object_or_404(ExecutionHistory, id=execution_id)
+        if history.status not in ("PENDING", "RETRY"):
+            return Response(
+                {"error": "Запрос уже завершён."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not cancel_execution(history):
+            history.status = "CANCELLED"
+            history.save(update_fields=["status"])
+            publish_execution_event(history)
+        return Response(
+            {"message": "Запрос отменён."}, status=status.HTTP_200_OK
+        )
+
+
+def _stats_response(request, rows, consecutive_failures):
+    params = request.query_params
+    grain = params.get("grain", "day")
+    if grain not in DEFAULT_RANGES:
+        return Response(
+            {"grain": "Допустимые значения: hour, day."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    rows = rows.filter(grain=grain)
+    bounds = {"since": timezone.now() - DEFAULT_RANGES[grain], "until": None}
+    for param in bounds:
+        if params.get(param):
+            bounds[param] = parse_datetime(params[param])
+            if bounds[param] is None:
+                return Response(
+                    {param: "Неверный формат даты."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+    rows = rows.filter(period_start__gte=bounds["since"])
+    if bounds["until"] is not None:
+        rows = rows.filter(period_start__lt=bounds["until"])
+    rows = list(rows)
+    return Response(
+        {
+            "grain": grain,
+            "consecutive_failures": consecutive_failures,
+            "summary": summarize(rows),
+            "periods": [
+                {"period_start": row.period_start, **summarize([row])}
+                for row in rows
+            ],
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+class TaskStats(APIView):
+    def get(self, request, task_id):
+        task = get_object_or_404(Task, id=task_id)
+        return _stats_response(
+            request, stats_queryset(task=task), task.consecutive_failures
+        )
+
+
+class DatabaseConnectionStats(APIView):
+    def get(self, request, connection_id):
+        db_conn = get_object_or_404(DatabaseConnection, id=connection_id)
+        return _stats_response(
+            request,
+            stats_queryset(database_connection=db_conn),
+            db_conn.consecutive_failures,
+        )
+
+
 class CheckDatabaseConnection(APIView):
     def post(self, request):
         data = request.data
@@ -100,9 +447,17 @@ class CheckDatabaseConnection(APIView):
                 host=data["host"],
                 port=data["port"],
             ).close()
-            return Response(
-                {"is_connection_successful": True}, status=status.HTTP_200_OK
-            )
+            response_data = {"is_connection_successful": True}
+            if data.get("id"):
+                try:
+                    response_data["pool_stats"] = get_pool_stats(data["id"])
+                    response_data["circuit"] = CircuitBreaker(
+                        data["id"]
+                    ).get_state()
+                except redis.RedisError:
+                    # The stats are optional, the check itself succeeded.
+                    pass
+            return Response(response_data, status=status.HTTP_200_OK)
         except psycopg2.Error as e:
             return Response(
                 {"is_connection_successful": False, "error": str(e)},
@@ -110,8 +465,65 @@ class CheckDatabaseConnection(APIView):
             )
 
 
+class PreviewQuery(APIView):
+    """
+    Runs a query against a DatabaseConnection and returns its first
+    rows without creating a task or storing anything.
+    """
+
+    def post(self, request):
+        data = request.data
+        if not data.get("database_connection") or not data.get("query"):
+            return Response(
+                {"error": "Укажите подключение и запрос."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            limit = int(data.get("limit", settings.PREVIEW_ROWS))
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "Неверное количество строк."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        limit = max(1, min(limit, settings.PREVIEW_MAX_ROWS))
+        db_conn = get_object_or_404(
+            DatabaseConnection, id=data["database_connection"]
+        )
+        try:
+            preview = preview_query(db_conn, data["query"], limit)
+        except (QueryCanceled, PreviewTimeout):
+            return Response(
+                {
+                    "error": "Запрос не уложился в "
+                    f"{settings.PREVIEW_TIMEOUT} с."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except (CircuitOpen, PoolTimeout) as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        except psycopg2.Error as e:
+            return Response(
+                {"error": str(e)}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(preview, status=status.HTTP_200_OK)
+
+
 class DatabaseConnectionList(APIView):
     def get(self, request):
         connections = DatabaseConnection.objects.all()
         serializer = DatabaseConnectionSerializer(connections, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class Metrics(APIView):
+    """
+    Exposes execution metrics in the Prometheus text format.
+    """
+
+    def get(self, request):
+        return HttpResponse(
+            render_metrics(),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
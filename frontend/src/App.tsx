@@ -6,99 +6,56 @@ import TaskAndConnectionForm from './components/TaskAndConnectionForm';
 import ControlPanel from './components/ControlPanel';
 import History from './components/History';
 import { ExecutionHistory } from './types';
-import { fetchExecutionHistory } from './api/apiActions';
+import { subscribeToExecutionEvents } from './api/apiActions';
 import 'bootstrap/dist/css/bootstrap.min.css';
 
 const App: React.FC = () => {
-  const previousHistoriesRef = useRef<ExecutionHistory[]>([]);
+  const lastExecutionsRef = useRef<Map<number, ExecutionHistory>>(new Map());
   const [selectedOption, setSelectedOption] = useState<string>('Панель управления');
 
   useEffect(() => {
-    let isMounted = true;
-  
-    const pollExecutionHistories = async () => {
-      try {
-        console.log('Polling for execution histories...');
-        const currentHistories = await fetchExecutionHistory();
-        console.log('Fetched execution histories:', currentHistories); 
+    const unsubscribe = subscribeToExecutionEvents((execution) => {
+      const previous = lastExecutionsRef.current.get(execution.id);
+      lastExecutionsRef.current.set(execution.id, execution);
+      notifyStatusChange(previous, execution);
+    });
+    return unsubscribe;
+  }, []);
 
-        if (previousHistoriesRef.current.length > 0) {
-          detectStatusChanges(previousHistoriesRef.current, currentHistories);
-        }
+  const notifyStatusChange = (
+    prevExecution: ExecutionHistory | undefined,
+    currExecution: ExecutionHistory
+  ) => {
+    const taskName = currExecution.task.name;
 
-        if (isMounted) {
-          previousHistoriesRef.current = currentHistories;
-        }
-      } catch (err) {
-        console.error('Failed to fetch execution histories', err);
+    if (!prevExecution) {
+      if (currExecution.status === 'PENDING') {
+        toast.info(`Task "${taskName}" has started.`);
       }
-    };
-
-    pollExecutionHistories();
-
-    const intervalId = setInterval(pollExecutionHistories, 5000);
-
-    return () => {
-      clearInterval(intervalId);
-      isMounted = false;
-    };
-  }, []);
+      return;
+    }
 
-  const buildTaskHistoryMap = (histories: ExecutionHistory[]): Map<number, ExecutionHistory> => {
-    const taskHistoryMap = new Map<number, ExecutionHistory>();
-    histories.forEach(history => {
-      const taskId = history.task.id;
-      const existingHistory = taskHistoryMap.get(taskId);
-      if (!existingHistory || new Date(history.execution_time) > new Date(existingHistory.execution_time)) {
-        taskHistoryMap.set(taskId, history);
+    if (prevExecution.status !== currExecution.status) {
+      if (currExecution.status === 'SUCCESS') {
+        toast.success(`Task "${taskName}" completed successfully.`);
+      } else if (currExecution.status === 'FAILURE') {
+        toast.error(`Task "${taskName}" failed after retries.`);
+      } else if (currExecution.status === 'PENDING') {
+        toast.info(`Task "${taskName}" is now pending again.`);
       }
-    });
-    return taskHistoryMap;
-  };
+    }
 
-  let lastRetryCountMap = new Map<number, number>();
+    if (currExecution.retry_count > prevExecution.retry_count) {
+      toast.warning(
+        `Task "${taskName}" is retrying (Attempt ${currExecution.retry_count}).`
+      );
+    }
 
-  const detectStatusChanges = (prevHistories: ExecutionHistory[], currHistories: ExecutionHistory[]) => {
-    const prevTaskHistories = buildTaskHistoryMap(prevHistories);
-    const currTaskHistories = buildTaskHistoryMap(currHistories);
-  
-    currTaskHistories.forEach((currHistory, taskId) => {
-      const prevHistory = prevTaskHistories.get(taskId);
-      const taskName = currHistory.task.name;
-      const lastRetryCount = lastRetryCountMap.get(taskId) || 0;
-  
-      if (!prevHistory) {
-        if (currHistory.status === 'PENDING') {
-          const message = `Task "${taskName}" has started.`;
-          console.log(message);
-          toast.info(message);
-        }
-      } else {
-        if (prevHistory.status !== currHistory.status) {
-          if (currHistory.status === 'SUCCESS') {
-            const message = `Task "${taskName}" completed successfully.`;
-            toast.success(message);
-          } else if (currHistory.status === 'FAILURE') {
-            const message = `Task "${taskName}" failed after retries.`;
-            toast.error(message);
-          } else if (currHistory.status === 'PENDING') {
-            const message = `Task "${taskName}" is now pending again.`;
-            toast.info(message);
-          }
-        }
-  
-        if (currHistory.retry_count > lastRetryCount) {
-          const message = `Task "${taskName}" is retrying (Attempt ${currHistory.retry_count}).`;
-          toast.warning(message);
-          lastRetryCountMap.set(taskId, currHistory.retry_count);
-        }
-  
-        if (prevHistory.status === 'RETRY' && currHistory.status !== 'RETRY') {
-          const message = `Task "${taskName}" finished after retrying. Final status: ${currHistory.status}`;
-          toast.success(message);
-        }
-      }
-    });
+    if (prevExecution.status === 'RETRY' && currExecution.status !== 'RETRY') {
+      toast.success(
+        `Task "${taskName}" finished after retrying. Final status: ${currExecution.status}`
+      );
+    }
   };
 
   const handleOptionSelect = (option: string) => {
@@ -4,6 +4,7 @@ import {
   TaskInput,
   DatabaseConnectionInput,
   ExecutionHistory,
+  ExecutionHistoryPage,
   DatabaseConnection,
 } from '../types';
 
@@ -35,10 +36,39 @@ export const runTask = async (taskId: number): Promise<any> => {
 };
 
 export const fetchExecutionHistory = async (): Promise<ExecutionHistory[]> => {
-  const response = await api.get<ExecutionHistory[]>('executions/');
+  const response = await api.get<ExecutionHistoryPage>('executions/');
+  return response.data.results;
+};
+
+export const fetchExecutionHistoryPage = async (
+  cursor?: string | null
+): Promise<ExecutionHistoryPage> => {
+  const response = await api.get<ExecutionHistoryPage>('executions/', {
+    params: cursor ? { cursor } : {},
+  });
   return response.data;
 };
 
+export const fetchExecution = async (executionId: number): Promise<ExecutionHistory> => {
+  const response = await api.get<ExecutionHistory>(`executions/${executionId}/`);
+  return response.data;
+};
+
+export const subscribeToExecutionEvents = (
+  onEvent: (execution: ExecutionHistory) => void,
+  taskId?: number
+): (() => void) => {
+  const url = new URL('executions/events/', api.defaults.baseURL);
+  if (taskId !== undefined) {
+    url.searchParams.set('task', String(taskId));
+  }
+  const source = new EventSource(url.toString());
+  source.addEventListener('execution', (event) => {
+    onEvent(JSON.parse((event as MessageEvent).data));
+  });
+  return () => source.close();
+};
+
 export const checkDatabaseConnection = async (
   connectionDetails: DatabaseConnectionInput
 ): Promise<{ is_connection_successful: boolean; error?: string }> => {
@@ -1,22 +1,50 @@
 import React, { useEffect, useState } from 'react';
 import { toast } from 'react-toastify';
-import { Container, Table } from 'reactstrap';
+import { Button, Container, Table } from 'reactstrap';
 import { ExecutionHistory } from '../types';
-import { fetchExecutionHistory } from '../api/apiActions';
+import {
+  fetchExecution,
+  fetchExecutionHistoryPage,
+  subscribeToExecutionEvents,
+} from '../api/apiActions';
 
 const History: React.FC = () => {
   const [histories, setHistories] = useState<ExecutionHistory[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [results, setResults] = useState<Record<number, any>>({});
+
+  const loadPage = async (cursor: string | null) => {
+    try {
+      const page = await fetchExecutionHistoryPage(cursor);
+      setHistories((prev) => (cursor ? [...prev, ...page.results] : page.results));
+      setNextCursor(page.next);
+    } catch (err) {
+      toast.error('Не удалось загрузить историю.');
+    }
+  };
+
+  const loadResult = async (executionId: number) => {
+    try {
+      const execution = await fetchExecution(executionId);
+      setResults((prev) => ({ ...prev, [executionId]: execution.result_data }));
+    } catch (err) {
+      toast.error('Не удалось загрузить результат.');
+    }
+  };
 
   useEffect(() => {
-    const fetchData = async () => {
-      try {
-        const data = await fetchExecutionHistory();
-        setHistories(data);
-      } catch (err) {
-        toast.error('Не удалось загрузить историю.');
-      }
-    };
-    fetchData();
+    loadPage(null);
+    return subscribeToExecutionEvents((execution) => {
+      setHistories((prev) => {
+        const index = prev.findIndex((history) => history.id === execution.id);
+        if (index === -1) {
+          return [execution, ...prev];
+        }
+        const next = [...prev];
+        next[index] = execution;
+        return next;
+      });
+    });
   }, []);
 
   return (
@@ -38,9 +66,18 @@ const History: React.FC = () => {
               <td>{new Date(history.execution_time).toLocaleString()}</td>
               <td>{history.status}</td>
               <td>
-              {history.status === 'SUCCESS' ? (
-                <pre>{JSON.stringify(history.result_data, null, 2)}</pre>
-              ) : history.status === 'FAILURE' ? (
+              {['SUCCESS', 'PARTIAL'].includes(history.status) ||
+              (history.status === 'COALESCED' && !history.error_message) ? (
+                history.id in results ? (
+                  <pre>{JSON.stringify(results[history.id], null, 2)}</pre>
+                ) : (
+                  <Button size="sm" onClick={() => loadResult(history.id)}>
+                    Show result
+                  </Button>
+                )
+              ) : ['FAILURE', 'TIMEOUT', 'CANCELLED', 'SKIPPED', 'COALESCED'].includes(
+                  history.status
+                ) ? (
                 history.error_message
               ) : (
                 'Pending...'
@@ -50,6 +87,9 @@ const History: React.FC = () => {
           ))}
         </tbody>
       </Table>
+      {nextCursor && (
+        <Button onClick={() => loadPage(nextCursor)}>Load more</Button>
+      )}
     </Container>
   );
 };
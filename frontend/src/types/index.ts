@@ -50,4 +50,12 @@ export interface ExecutionHistory {
   result_data?: any;
   error_message?: string | null;
   retry_count: number;
+  timings?: Record<string, number> | null;
+  lane?: "scheduled" | "interactive";
+  queue_wait?: number | null;
+}
+
+export interface ExecutionHistoryPage {
+  results: ExecutionHistory[];
+  next: string | null;
 }
@@ -4,8 +4,11 @@ open_tmux_window() {
     tmux new-window -n "$1" "$2"
 }
 
-open_tmux_window "Backend" "cd backend; source ../venv/bin/activate; python3 manage.py makemigrations; python3 manage.py migrate; python3 manage.py runserver"
-open_tmux_window "Celery Worker" "cd backend; source ../venv/bin/activate; celery -A backend worker --loglevel=INFO"
+open_tmux_window "Backend" "cd backend; source ../venv/bin/activate; python3 manage.py makemigrations; python3 manage.py migrate; python3 manage.py ensure_results_schema; python3 manage.py runserver"
+INTERACTIVE_CONCURRENCY=${INTERACTIVE_CONCURRENCY:-2}
+
+open_tmux_window "Celery Worker" "cd backend; source ../venv/bin/activate; celery -A backend worker -Q celery,interactive --loglevel=INFO"
+open_tmux_window "Interactive Worker" "cd backend; source ../venv/bin/activate; celery -A backend worker -Q interactive -n interactive@%h --concurrency=$INTERACTIVE_CONCURRENCY --loglevel=INFO"
 open_tmux_window "Celery Beat" "cd backend; source ../venv/bin/activate; celery -A backend beat --loglevel=INFO"
 open_tmux_window "Frontend" "cd frontend; npm start"
 